@@ -0,0 +1,82 @@
+# config/log.py
+
+"""
+Peças do LOGGING (ver config/settings.py).
+
+O FilaHandler apenas enfileira os registros; a formatação e a escrita no
+stream acontecem em uma thread separada (QueueListener), fora da requisição.
+O Python 3.11 ainda não sabe montar QueueHandler/QueueListener pelo
+dictConfig, por isso o handler cria o próprio listener.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+# Atributos padrão de LogRecord; o que sobrar veio de 'extra=' e vai para o JSON.
+_ATRIBUTOS_PADRAO = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class FormatadorJson(logging.Formatter):
+    """Uma linha JSON por registro: data, nível, logger, mensagem e os campos de 'extra'."""
+
+    def format(self, record):
+        dados = {
+            'data': self.formatTime(record),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensagem': record.getMessage(),
+        }
+        dados.update({
+            chave: valor for chave, valor in vars(record).items()
+            if chave not in _ATRIBUTOS_PADRAO and not chave.startswith('_')
+        })
+        if record.exc_info:
+            dados['excecao'] = self.formatException(record.exc_info)
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class FilaHandler(QueueHandler):
+    """
+    QueueHandler com o seu QueueListener: quem loga só coloca o registro na
+    fila. 'estruturado' escolhe entre JSON (FormatadorJson) e texto simples.
+    """
+
+    def __init__(self, destino=None, estruturado=True):
+        fila = queue.SimpleQueue()
+        super().__init__(fila)
+        alvo = logging.StreamHandler(destino or sys.stderr)
+        alvo.setFormatter(
+            FormatadorJson() if estruturado
+            else logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s')
+        )
+        self.listener = QueueListener(fila, alvo, respect_handler_level=False)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def prepare(self, record):
+        # Sem formatar aqui (o QueueHandler padrão formata na thread de quem loga);
+        # a fila é em memória, então o registro segue como está, com os args.
+        return copy.copy(record)
+
+
+class AmostragemFilter(logging.Filter):
+    """
+    Deixa passar só uma fração ('taxa', de 0 a 1) dos registros até
+    'nivel_maximo'; os de nível mais alto passam sempre.
+    """
+
+    def __init__(self, taxa=1.0, nivel_maximo='DEBUG'):
+        super().__init__()
+        self.taxa = float(taxa)
+        self.nivel_maximo = logging.getLevelName(nivel_maximo) if isinstance(nivel_maximo, str) else nivel_maximo
+
+    def filter(self, record):
+        if record.levelno > self.nivel_maximo:
+            return True
+        return random.random() < self.taxa
@@ -218,18 +218,65 @@ CSRF_TRUSTED_ORIGINS = [
 
 
 
+# ===== CONFIGURAÇÕES DO APP PROCESSO =====
+# Contadores de processos por situação mantidos pelos sinais (dashboard em tempo constante).
+# Ao reativar depois de um período desligado, rode 'python manage.py reconstruir_contadores'.
+PROCESSO_CONTADORES_SITUACAO = os.environ.get('PROCESSO_CONTADORES_SITUACAO', 'true').lower() == 'true'
+# Tempo máximo (s) que cada worker mantém em memória as tabelas de domínio sem reconsultar o banco.
+# Sem um cache compartilhado (LocMemCache), é também a janela em que outro worker ainda aceita
+# uma situação/tipo/... já excluído: a gravação falha na FK e a API responde 400, não 500.
+PROCESSO_CACHE_DOMINIO_TTL = int(os.environ.get('PROCESSO_CACHE_DOMINIO_TTL', 300))
+# Histórico dos campos de texto longos: a partir deste tamanho (caracteres) guarda-se só o delta,
+# comprimido quando passar de PROCESSO_HISTORICO_COMPRIMIR_ACIMA bytes.
+PROCESSO_HISTORICO_DELTA_MINIMO = int(os.environ.get('PROCESSO_HISTORICO_DELTA_MINIMO', 500))
+PROCESSO_HISTORICO_COMPRIMIR_ACIMA = int(os.environ.get('PROCESSO_HISTORICO_COMPRIMIR_ACIMA', 2000))
+# Idade (dias) a partir da qual o comando arquivar_historico move o histórico para o arquivo.
+PROCESSO_HISTORICO_RETENCAO_DIAS = int(os.environ.get('PROCESSO_HISTORICO_RETENCAO_DIAS', 365))
+# Máximo de linhas aceitas por POST /api/processos/importar/.
+PROCESSO_IMPORTACAO_MAXIMO = int(os.environ.get('PROCESSO_IMPORTACAO_MAXIMO', 1000))
+# Máximo de processos por POST /api/processos/bulk-update/ (limita o tempo de lock do UPDATE).
+PROCESSO_ATUALIZACAO_LOTE_MAXIMO = int(os.environ.get('PROCESSO_ATUALIZACAO_LOTE_MAXIMO', 500))
+
+
+# ===== LOGGING =====
+# Os registros vão para uma fila e são formatados/escritos por uma thread em
+# segundo plano (config/log.py). Níveis por logger via variáveis de ambiente.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'filters': {
+        # Só uma amostra dos eventos DEBUG do histórico (sinais e coletor) é registrada.
+        'amostragem_historico': {
+            '()': 'config.log.AmostragemFilter',
+            'taxa': float(os.environ.get('LOG_AMOSTRAGEM_HISTORICO', '0.01')),
+            'nivel_maximo': 'DEBUG',
+        },
+    },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
+            '()': 'config.log.FilaHandler',
+            'destino': 'ext://sys.stdout',
+            'estruturado': os.environ.get('LOG_JSON', 'true').lower() == 'true',
         },
     },
     'loggers': {
         '': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
+        },
+        'django.db.backends': {
+            'level': os.environ.get('LOG_LEVEL_DB', 'WARNING').upper(),
+        },
+        'processo': {
+            'level': os.environ.get('LOG_LEVEL_PROCESSO', LOG_LEVEL).upper(),
+        },
+        'processo.signals': {
+            'filters': ['amostragem_historico'],
+        },
+        'processo.historico': {
+            'filters': ['amostragem_historico'],
         },
     },
 }
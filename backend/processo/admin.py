@@ -1,14 +1,18 @@
 # processo/admin.py
 
 from django.contrib import admin
+from django.forms.models import BaseInlineFormSet
+from django.urls import reverse
 from django.utils.html import format_html
+from . import historico
 from .models import (
     # Modelos principais e de suporte
     Processo, Auditor, GrupoAuditor, Categoria, Atribuicao, Unidade, TipoDemanda,
     # Modelos de domínio (tabelas de opções)
     Tipo, Prioridade, OrgaoDemandante, Situacao,
     # Modelos de relação e submodelos
-    HierarquiaProcesso, Execucao, Resposta, HistoricoProcesso
+    HierarquiaProcesso, Execucao, Resposta, HistoricoProcesso, TransicaoSituacao,
+    HistoricoProcessoArquivado, ResumoHistoricoArquivado
 )
 
 # --- Inlines (sem alterações) ---
@@ -37,14 +41,31 @@ class SubprocessoInline(admin.TabularInline):
     def has_add_permission(self, request, obj=None):
         return False
 
+# O formulário do processo mostra só os registros mais recentes do histórico;
+# a lista completa (paginada) fica no link "Histórico completo".
+HISTORICO_INLINE_MAXIMO = 20
+
+
+class HistoricoRecenteFormSet(BaseInlineFormSet):
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            self._queryset = (
+                super().get_queryset().select_related('alterado_por')
+                .order_by('-data', '-id')[:HISTORICO_INLINE_MAXIMO]
+            )
+        return self._queryset
+
+
 class HistoricoProcessoInline(admin.TabularInline):
     model = HistoricoProcesso
+    formset = HistoricoRecenteFormSet
     extra = 0
+    max_num = HISTORICO_INLINE_MAXIMO
     fields = ('data', 'alterado_por', 'tipo_alteracao', 'display_alteracoes')
     readonly_fields = fields
     can_delete = False
     verbose_name = "Registro de Histórico"
-    verbose_name_plural = "Histórico de Alterações"
+    verbose_name_plural = f"Histórico de Alterações (últimos {HISTORICO_INLINE_MAXIMO})"
     def has_add_permission(self, request, obj=None):
         return False
     def has_change_permission(self, request, obj=None):
@@ -60,7 +81,7 @@ class ProcessoAdmin(admin.ModelAdmin):
     list_filter = ('tipo', 'situacao', 'prioridade', 'orgao_demandante')
     search_fields = ('numero', 'assunto', 'numero_processo_externo','documento_sei', 'numero_sei')
     filter_horizontal = ('unidades_auditadas', 'auditores_responsaveis')
-    readonly_fields = ('numero', 'data_cadastro', 'data_atualizacao')
+    readonly_fields = ('numero', 'data_cadastro', 'data_atualizacao', 'historico_completo')
     fieldsets = (
         ("1. Informações Centrais (Comum a Todos)", {
             'fields': (
@@ -84,7 +105,7 @@ class ProcessoAdmin(admin.ModelAdmin):
             'fields': ('auditores_responsaveis', 'unidades_auditadas')
         }),
         ("4. Datas de Controle", {
-            'fields': ('data_cadastro', 'data_atualizacao')
+            'fields': ('data_cadastro', 'data_atualizacao', 'historico_completo')
         })
     )
     inlines = [ExecucaoInline, RespostaInline, SubprocessoInline, HistoricoProcessoInline]
@@ -92,6 +113,11 @@ class ProcessoAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('tipo', 'situacao', 'prioridade', 'pai')
 
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        # Processo, ManyToMany e inlines salvos pelo formulário: um registro de histórico.
+        with historico.operacao():
+            return super().changeform_view(request, object_id, form_url, extra_context)
+
     @admin.display(description='Processo Pai')
     def get_pai_link(self, obj):
         if obj.pai:
@@ -99,6 +125,13 @@ class ProcessoAdmin(admin.ModelAdmin):
             return format_html('<a href="{}">{}</a>', link, obj.pai)
         return "-"
 
+    @admin.display(description='Histórico completo')
+    def historico_completo(self, obj):
+        if not obj.pk:
+            return "-"
+        link = reverse('admin:processo_historicoprocesso_changelist') + f'?processo__id__exact={obj.pk}'
+        return format_html('<a href="{}">Todos os registros de {}</a>', link, obj.numero)
+
 # --- Registro dos outros modelos no Admin (sem alterações) ---
 admin.site.register(Tipo)
 admin.site.register(Prioridade)
@@ -113,6 +146,12 @@ admin.site.register(GrupoAuditor)
 admin.site.register(HierarquiaProcesso)
 
 
+@admin.register(TransicaoSituacao)
+class TransicaoSituacaoAdmin(admin.ModelAdmin):
+    list_display = ('origem', 'destino')
+    list_filter = ('origem',)
+
+
 # --- [CORRIGIDO] Registro do HistóricoAdmin ---
 @admin.register(HistoricoProcesso)
 class HistoricoProcessoAdmin(admin.ModelAdmin):
@@ -135,3 +174,18 @@ class HistoricoProcessoAdmin(admin.ModelAdmin):
         return False
 
 
+
+
+@admin.register(HistoricoProcessoArquivado)
+class HistoricoProcessoArquivadoAdmin(HistoricoProcessoAdmin):
+    list_select_related = ('processo', 'alterado_por')
+
+
+@admin.register(ResumoHistoricoArquivado)
+class ResumoHistoricoArquivadoAdmin(admin.ModelAdmin):
+    list_display = ('processo', 'quantidade', 'primeira_data', 'ultima_data', 'atualizado_em')
+    search_fields = ('processo__numero',)
+    readonly_fields = ('processo', 'quantidade', 'primeira_data', 'ultima_data', 'alteracoes_por_campo', 'atualizado_em')
+
+    def has_add_permission(self, request):
+        return False
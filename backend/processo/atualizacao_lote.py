@@ -0,0 +1,101 @@
+# processo/atualizacao_lote.py
+
+"""
+Alteração de situação/prioridade/atribuição de vários processos de uma vez
+(POST /api/processos/bulk-update/).
+
+Em vez de um PATCH por processo (cada um relendo a linha no pre_save e
+gravando o histórico no post_save), os valores atuais das linhas afetadas
+são lidos (e travados) em uma query, a alteração é um único UPDATE e o histórico de
+todos os processos é gravado em lote pelo coletor de processo/historico.py.
+Como o UPDATE não dispara sinais, os contadores por situação são ajustados
+aqui.
+
+O mesmo caminho propaga a situação de um processo para a sua subárvore
+(PATCH /api/processos/{numero}/?propagar=true).
+"""
+
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import contadores, historico
+from .cache import situacoes_finais
+from .models import Processo
+
+# Campos que podem ser alterados em lote (FKs para tabelas de domínio).
+CAMPOS_ATUALIZACAO_LOTE = ('situacao', 'prioridade', 'atribuicao')
+
+
+def limite_atualizacao_lote():
+    return getattr(settings, 'PROCESSO_ATUALIZACAO_LOTE_MAXIMO', 500)
+
+
+@historico.operacao()
+def atualizar_em_lote(queryset, mudancas, contexto=None):
+    """
+    Aplica 'mudancas' ({campo: pk ou None}) aos processos de 'queryset' que
+    ainda não têm esses valores e retorna quantos foram alterados. 'contexto'
+    (ex.: {'propagado_de': numero}) é acrescentado ao histórico de cada um.
+    """
+    campos = {campo: Processo._meta.get_field(campo) for campo in mudancas}
+    difere = reduce(or_, (~Q(**{field.attname: mudancas[campo]}) for campo, field in campos.items()))
+    # As linhas ficam travadas até o fim da transação: os valores lidos (base do
+    # histórico e dos contadores) são os que o UPDATE vai substituir. A ordem
+    # por id evita deadlock entre dois lotes que se sobrepõem.
+    linhas = list(
+        queryset.filter(difere).select_for_update(of=('self',)).order_by('id')
+        .values('id', *(field.attname for field in campos.values()))
+    )
+    if not linhas:
+        return 0
+
+    Processo.objects.filter(id__in=[linha['id'] for linha in linhas]).update(
+        data_atualizacao=timezone.now(),
+        **{field.attname: mudancas[campo] for campo, field in campos.items()},
+    )
+
+    if 'situacao' in mudancas:
+        variacao = Counter()
+        for linha in linhas:
+            if linha['situacao_id'] != mudancas['situacao']:
+                variacao[linha['situacao_id']] -= 1
+                variacao[mudancas['situacao']] += 1
+        contadores.ajustar(variacao)
+
+    for linha in linhas:
+        alteracoes, ids = {}, {}
+        for campo, field in campos.items():
+            anterior, novo = linha[field.attname], mudancas[campo]
+            if anterior != novo:
+                alteracoes[campo] = {'anterior': historico.rotular(field, anterior), 'novo': historico.rotular(field, novo)}
+                ids[campo] = {'anterior': anterior, 'novo': novo}
+        alteracoes.update(contexto or {})
+        historico.registrar(Processo(pk=linha['id']), 'ATUALIZACAO', alteracoes, ids)
+    return len(linhas)
+
+
+def descendentes_para_propagar(processo):
+    """
+    Descendentes do processo (tabela de fechamento, uma query) que recebem a
+    propagação da situação: os que já estão em situação final ficam de fora.
+    """
+    return Processo.objects.filter(
+        ancestrais_rel__ancestral_id=processo.pk, ancestrais_rel__profundidade__gt=0
+    ).exclude(situacao_id__in=situacoes_finais())
+
+
+def propagar_situacao(processo):
+    """
+    Leva a situação atual de 'processo' aos seus descendentes. O histórico de
+    cada um registra de qual processo veio a mudança ('propagado_de').
+    Retorna quantos foram alterados.
+    """
+    return atualizar_em_lote(
+        descendentes_para_propagar(processo), {'situacao': processo.situacao_id},
+        contexto={'propagado_de': processo.numero},
+    )
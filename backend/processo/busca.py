@@ -0,0 +1,130 @@
+# processo/busca.py
+
+"""
+Índice de busca textual dos Processos (SQLite FTS5).
+
+A tabela virtual 'processo_processo_fts' espelha os campos de busca de cada
+processo (rowid = id do processo) e usa o tokenizador unicode61 com
+remove_diacritics, de modo que "acordao" encontra "Acórdão". É mantida pelos
+sinais de save/delete e pode ser recriada com 'reconstruir_indice_busca'.
+Em outros bancos o índice não existe e a busca volta ao SearchFilter padrão.
+"""
+
+from django.db import OperationalError, connection
+
+from .models import Processo
+
+TABELA_FTS = f"{Processo._meta.db_table}_fts"
+
+# Campos indexados e o peso de cada um no ranking bm25 (maior = mais relevante).
+CAMPOS_BUSCA = {
+    'numero': 10.0,
+    'assunto': 5.0,
+    'numero_processo_externo': 10.0,
+    'numero_sei': 10.0,
+    'descricao': 1.0,
+}
+
+_disponivel = {}
+
+
+def criar_indice():
+    """Cria a tabela FTS5, se ainda não existir (somente SQLite). Retorna False se não for possível."""
+    if connection.vendor != 'sqlite':
+        return False
+    colunas = ', '.join(CAMPOS_BUSCA)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA_FTS} USING fts5("
+                f"{colunas}, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+    except OperationalError:
+        # SQLite compilado sem FTS5: a busca continua usando LIKE.
+        return False
+    _disponivel.pop(connection.alias, None)
+    return True
+
+
+def fts_disponivel():
+    """Indica se o banco atual tem o índice FTS5 (resultado memorizado por conexão)."""
+    if connection.alias not in _disponivel:
+        _disponivel[connection.alias] = (
+            connection.vendor == 'sqlite'
+            and TABELA_FTS in connection.introspection.table_names()
+        )
+    return _disponivel[connection.alias]
+
+
+def indexar(processos):
+    """(Re)indexa os processos informados (instâncias ou dicts com 'id' e os campos de busca)."""
+    if not fts_disponivel():
+        return
+    linhas = []
+    for processo in processos:
+        if not isinstance(processo, dict):
+            processo = {campo: getattr(processo, campo) for campo in ['id', *CAMPOS_BUSCA]}
+        linhas.append([processo['id']] + [processo.get(campo) or '' for campo in CAMPOS_BUSCA])
+    if not linhas:
+        return
+
+    colunas = ', '.join(CAMPOS_BUSCA)
+    marcadores = ', '.join(['%s'] * (len(CAMPOS_BUSCA) + 1))
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABELA_FTS} WHERE rowid = %s", [[linha[0]] for linha in linhas])
+        cursor.executemany(f"INSERT INTO {TABELA_FTS} (rowid, {colunas}) VALUES ({marcadores})", linhas)
+
+
+def remover(processo_ids):
+    if not fts_disponivel():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABELA_FTS} WHERE rowid = %s", [[pk] for pk in processo_ids])
+
+
+def reconstruir_indice():
+    """Recria o conteúdo do índice a partir da tabela de processos. Retorna o nº de linhas."""
+    criar_indice()
+    if not fts_disponivel():
+        return 0
+    colunas = ', '.join(CAMPOS_BUSCA)
+    origem = ', '.join(f"COALESCE({campo}, '')" for campo in CAMPOS_BUSCA)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABELA_FTS}")
+        cursor.execute(
+            f"INSERT INTO {TABELA_FTS} (rowid, {colunas}) "
+            f"SELECT id, {origem} FROM {Processo._meta.db_table}"
+        )
+        cursor.execute(f"SELECT COUNT(*) FROM {TABELA_FTS}")
+        return cursor.fetchone()[0]
+
+
+def montar_consulta(termos):
+    """
+    Converte os termos digitados em uma expressão MATCH do FTS5: cada termo
+    vira uma frase entre aspas com busca por prefixo, todas obrigatórias.
+    """
+    frases = []
+    for termo in termos:
+        termo = termo.replace('"', '').strip()
+        if termo:
+            frases.append(f'"{termo}"*')
+    return ' AND '.join(frases)
+
+
+def sql_ids(consulta):
+    """SQL + parâmetros que retornam os ids dos processos encontrados."""
+    return f"SELECT rowid FROM {TABELA_FTS} WHERE {TABELA_FTS} MATCH %s", [consulta]
+
+
+def sql_relevancia(consulta):
+    """
+    SQL + parâmetros (subquery correlacionada) com o bm25 de cada processo
+    encontrado; valores menores indicam maior relevância.
+    """
+    pesos = ', '.join(str(peso) for peso in CAMPOS_BUSCA.values())
+    tabela = connection.ops.quote_name(Processo._meta.db_table)
+    return (
+        f"SELECT bm25({TABELA_FTS}, {pesos}) FROM {TABELA_FTS} "
+        f"WHERE {TABELA_FTS} MATCH %s AND rowid = {tabela}.id"
+    ), [consulta]
@@ -0,0 +1,127 @@
+# processo/cache.py
+
+"""
+Cache em memória das tabelas de domínio (Situação, Tipo, ...).
+
+São tabelas pequenas e que quase nunca mudam, mas lidas em toda requisição.
+Cada processo do servidor guarda uma cópia completa da tabela e a recarrega
+quando a versão publicada no cache do Django muda (os sinais de save/delete
+do modelo incrementam a versão) ou quando o TTL expira, o que cobre
+servidores com vários workers usando um cache local (LocMemCache).
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import (
+    Atribuicao, Categoria, OrgaoDemandante, Prioridade, Situacao, Tipo, TipoDemanda,
+    TransicaoSituacao, Unidade,
+)
+
+# Tabelas mantidas em memória; os sinais em processo/signals.py invalidam cada uma.
+MODELOS_DOMINIO = (
+    Tipo, Situacao, Prioridade, Categoria, OrgaoDemandante, Atribuicao, TipoDemanda, Unidade,
+    TransicaoSituacao,
+)
+
+
+class TabelaEmCache:
+    """Cópia em memória de uma tabela de domínio, indexada pela chave primária."""
+
+    def __init__(self, model):
+        self.model = model
+        self._objetos = None
+        self._versao = None
+        self._carregado_em = 0
+        self._lock = threading.Lock()
+
+    @property
+    def chave_versao(self):
+        return f"processo:cache:{self.model._meta.label_lower}:versao"
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'PROCESSO_CACHE_DOMINIO_TTL', 300)
+
+    def _versao_publicada(self):
+        versao = cache.get(self.chave_versao)
+        if versao is None:
+            cache.add(self.chave_versao, 1, timeout=None)
+            versao = cache.get(self.chave_versao, 1)
+        return versao
+
+    def objetos(self):
+        """Retorna {pk: instância} de toda a tabela, recarregando se estiver desatualizada."""
+        versao = self._versao_publicada()
+        expirado = time.monotonic() - self._carregado_em > self.ttl
+        if self._objetos is None or versao != self._versao or expirado:
+            with self._lock:
+                objetos = {obj.pk: obj for obj in self.model._default_manager.all()}
+                self._objetos, self._versao, self._carregado_em = objetos, versao, time.monotonic()
+        return self._objetos
+
+    def get(self, pk):
+        return self.objetos().get(pk)
+
+    def nome(self, pk):
+        """Rótulo (str) do objeto com a chave 'pk', ou None."""
+        obj = self.get(pk)
+        return str(obj) if obj is not None else None
+
+    def expirar(self):
+        """Descarta só a cópia local (ex.: após encontrar no banco um registro ausente do cache)."""
+        self._objetos = None
+
+    def invalidar(self):
+        """Descarta a cópia local e publica uma nova versão para os demais workers."""
+        self._objetos = None
+        try:
+            cache.incr(self.chave_versao)
+        except ValueError:
+            cache.set(self.chave_versao, 1, timeout=None)
+
+
+_tabelas = {}
+
+
+def em_cache(model):
+    return model in MODELOS_DOMINIO
+
+
+def tabela(model):
+    """Retorna (criando na primeira vez) o cache da tabela de domínio 'model'."""
+    if model not in _tabelas:
+        _tabelas[model] = TabelaEmCache(model)
+    return _tabelas[model]
+
+
+# --- Transições de situação ---
+
+_transicoes = {'origem': None, 'mapa': {}}
+
+
+def situacoes_destino(situacao_id):
+    """
+    Situações para as quais um processo em 'situacao_id' pode ir, a partir da
+    tabela TransicaoSituacao em memória. O agrupamento por origem só é refeito
+    quando uma das duas tabelas é recarregada.
+    """
+    transicoes = tabela(TransicaoSituacao).objetos()
+    situacoes = tabela(Situacao).objetos()
+    origem = (transicoes, situacoes)
+    if _transicoes['origem'] is None or any(a is not b for a, b in zip(origem, _transicoes['origem'])):
+        mapa = {}
+        for transicao in sorted(transicoes.values(), key=lambda t: t.destino_id):
+            destino = situacoes.get(transicao.destino_id)
+            if destino is not None:
+                mapa.setdefault(transicao.origem_id, []).append(destino)
+        _transicoes.update(origem=origem, mapa=mapa)
+    return _transicoes['mapa'].get(situacao_id, [])
+
+
+def situacoes_finais():
+    """Situações marcadas como finais (Situacao.final, ex.: 'Finalizado'), a partir do cache."""
+    return [situacao.pk for situacao in tabela(Situacao).objetos().values() if situacao.final]
@@ -0,0 +1,63 @@
+# processo/contadores.py
+
+"""
+Contagem de processos por situação.
+
+A contagem vem de um único GROUP BY em situacao_id ou, quando
+PROCESSO_CONTADORES_SITUACAO está ativo, da tabela ContadorSituacao,
+mantida incrementalmente pelos sinais de Processo. Nesse caso o dashboard
+tem custo constante, independente do tamanho da tabela de processos.
+"""
+
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import ContadorSituacao, Processo
+
+
+def contadores_ativos():
+    return getattr(settings, 'PROCESSO_CONTADORES_SITUACAO', False)
+
+
+def contar_por_situacao():
+    """Retorna {situacao_id: total} com um único GROUP BY."""
+    linhas = Processo.objects.order_by().values('situacao_id').annotate(total=Count('id'))
+    return {linha['situacao_id']: linha['total'] for linha in linhas}
+
+
+def totais_por_situacao():
+    """Retorna {situacao_id: total}, lendo os contadores quando estiverem ativos."""
+    if contadores_ativos():
+        return dict(ContadorSituacao.objects.values_list('situacao_id', 'total'))
+    return contar_por_situacao()
+
+
+def ajustar(deltas):
+    """
+    Aplica variações {situacao_id: delta} aos contadores, com UPDATE atômico
+    (total = total + delta). Não faz nada se os contadores estiverem inativos.
+    """
+    if not contadores_ativos():
+        return
+    for situacao_id, delta in Counter(deltas).items():
+        if not delta or situacao_id is None:
+            continue
+        atualizados = ContadorSituacao.objects.filter(situacao_id=situacao_id).update(total=F('total') + delta)
+        if not atualizados:
+            ContadorSituacao.objects.get_or_create(situacao_id=situacao_id)
+            ContadorSituacao.objects.filter(situacao_id=situacao_id).update(total=F('total') + delta)
+
+
+def reconstruir():
+    """Recalcula todos os contadores a partir da tabela de processos."""
+    totais = contar_por_situacao()
+    with transaction.atomic():
+        ContadorSituacao.objects.all().delete()
+        ContadorSituacao.objects.bulk_create([
+            ContadorSituacao(situacao_id=situacao_id, total=total)
+            for situacao_id, total in totais.items()
+        ])
+    return totais
@@ -0,0 +1,117 @@
+# processo/deltas.py
+
+"""
+Deltas de texto para o histórico dos campos longos do Processo.
+
+Em vez de guardar o texto anterior e o novo inteiros a cada edição, o
+histórico guarda um delta reverso por palavra: as operações que, aplicadas
+ao texto novo, devolvem o anterior. Como o valor atual está no próprio
+processo, qualquer versão passada é reconstruída aplicando os deltas do mais
+recente para o mais antigo (ver historico.versao_campo).
+
+Formato do delta: lista de operações sobre os tokens (palavras e espaços)
+do texto novo. Inteiro positivo = copia N tokens; negativo = pula N tokens;
+string = insere o texto. Deltas grandes são comprimidos (zlib + base64).
+"""
+
+import base64
+import json
+import re
+import zlib
+from difflib import SequenceMatcher
+
+from django.conf import settings
+
+# TextFields do Processo cujo histórico é guardado como delta.
+CAMPOS_TEXTO_LONGO = ('assunto', 'descricao', 'observacao', 'identificacao_achados')
+
+_TOKENS = re.compile(r'\s+|\S+')
+
+
+def _tamanho_minimo():
+    """Textos menores que isto (em caracteres) continuam guardados inteiros."""
+    return getattr(settings, 'PROCESSO_HISTORICO_DELTA_MINIMO', 500)
+
+
+def _limite_compressao():
+    """Deltas maiores que isto (em bytes de JSON) são comprimidos."""
+    return getattr(settings, 'PROCESSO_HISTORICO_COMPRIMIR_ACIMA', 2000)
+
+
+def calcular_delta(novo, anterior):
+    """Operações que transformam 'novo' em 'anterior'."""
+    tokens_novo = _TOKENS.findall(novo)
+    tokens_anterior = _TOKENS.findall(anterior)
+    operacoes = []
+    matcher = SequenceMatcher(None, tokens_novo, tokens_anterior, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            operacoes.append(i2 - i1)
+            continue
+        if i2 > i1:
+            operacoes.append(-(i2 - i1))
+        if j2 > j1:
+            operacoes.append(''.join(tokens_anterior[j1:j2]))
+    return operacoes
+
+
+def aplicar_delta(novo, operacoes):
+    """Reconstrói o texto anterior a partir do novo e do delta."""
+    tokens = _TOKENS.findall(novo or '')
+    partes = []
+    posicao = 0
+    for operacao in operacoes:
+        if isinstance(operacao, str):
+            partes.append(operacao)
+        elif operacao >= 0:
+            partes.extend(tokens[posicao:posicao + operacao])
+            posicao += operacao
+        else:
+            posicao -= operacao
+    return ''.join(partes)
+
+
+def compactar_alteracao(alteracao):
+    """
+    Recebe {'anterior': texto, 'novo': texto} e devolve {'delta': [...]} ou
+    {'delta_zlib': '...'}; devolve None quando não compensa (textos curtos,
+    valores vazios ou delta maior que o próprio texto anterior).
+    """
+    anterior, novo = alteracao.get('anterior'), alteracao.get('novo')
+    if not isinstance(anterior, str) or not isinstance(novo, str) or 'N/A' in (anterior, novo):
+        return None
+    if max(len(anterior), len(novo)) < _tamanho_minimo():
+        return None
+
+    serializado = json.dumps(calcular_delta(novo, anterior), ensure_ascii=False, separators=(',', ':'))
+    if len(serializado) >= len(anterior):
+        return None
+    if len(serializado.encode()) > _limite_compressao():
+        comprimido = base64.b64encode(zlib.compress(serializado.encode(), 9)).decode()
+        return {'delta_zlib': comprimido}
+    return {'delta': json.loads(serializado)}
+
+
+def compactar_alteracoes(alteracoes):
+    """Cópia de 'alteracoes' com os campos longos em delta. Retorna (alteracoes, houve_mudanca)."""
+    resultado = dict(alteracoes)
+    mudou = False
+    for campo in CAMPOS_TEXTO_LONGO:
+        valor = resultado.get(campo)
+        if isinstance(valor, dict) and 'anterior' in valor:
+            compactado = compactar_alteracao(valor)
+            if compactado is not None:
+                resultado[campo] = compactado
+                mudou = True
+    return resultado, mudou
+
+
+def valor_anterior(alteracao, valor_atual):
+    """Valor do campo antes da alteração registrada, dado o valor logo depois dela."""
+    if 'anterior' in alteracao:
+        anterior = alteracao['anterior']
+        return None if anterior == 'N/A' else anterior
+    if 'delta_zlib' in alteracao:
+        operacoes = json.loads(zlib.decompress(base64.b64decode(alteracao['delta_zlib'])).decode())
+        return aplicar_delta(valor_atual, operacoes)
+    return aplicar_delta(valor_atual, alteracao['delta'])
@@ -0,0 +1,181 @@
+# processo/filters.py
+
+import django_filters
+from django_filters.constants import EMPTY_VALUES
+from django.db.models import Count
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+from . import busca
+from .cache import tabela
+from .models import AlteracaoCampo, Atribuicao, Categoria, OrgaoDemandante, Prioridade, Processo, Situacao, Tipo
+
+# Campos que podem ser pedidos em ?facets= e a tabela de domínio de cada um.
+FACETAS_PROCESSO = {
+    'tipo': Tipo,
+    'situacao': Situacao,
+    'prioridade': Prioridade,
+    'categoria': Categoria,
+    'orgao_demandante': OrgaoDemandante,
+    'atribuicao': Atribuicao,
+}
+
+
+class NumberInFilter(django_filters.BaseInFilter, django_filters.NumberFilter):
+    """Aceita um ou mais valores separados por vírgula (ex.: ?tipo=1,3)."""
+
+
+class CharInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    """Aceita um ou mais textos separados por vírgula (ex.: ?campo=situacao,prioridade)."""
+
+
+class ProcessoFilter(django_filters.FilterSet):
+    """
+    Filtros da listagem de processos, executados no banco. As combinações
+    mais usadas (tipo/situação/prioridade/ano + data de cadastro) são
+    cobertas pelos índices compostos declarados em Processo.Meta.
+    """
+    tipo = NumberInFilter(field_name='tipo_id', lookup_expr='in')
+    situacao = NumberInFilter(field_name='situacao_id', lookup_expr='in')
+    prioridade = NumberInFilter(field_name='prioridade_id', lookup_expr='in')
+    categoria = NumberInFilter(field_name='categoria_id', lookup_expr='in')
+    orgao_demandante = NumberInFilter(field_name='orgao_demandante_id', lookup_expr='in')
+    ano_solicitacao = NumberInFilter(field_name='ano_solicitacao', lookup_expr='in')
+    auditor = NumberInFilter(field_name='auditores_responsaveis', lookup_expr='in', distinct=True)
+    unidade = NumberInFilter(field_name='unidades_auditadas', lookup_expr='in', distinct=True)
+    # ?data_cadastro_after=AAAA-MM-DD&data_cadastro_before=AAAA-MM-DD
+    data_cadastro = django_filters.DateFromToRangeFilter()
+    # ?prazo_inicial_after=...&prazo_inicial_before=...
+    prazo_inicial = django_filters.DateFromToRangeFilter(field_name='resposta__prazo_inicial')
+
+    # Navegação na hierarquia.
+    pai = django_filters.CharFilter(field_name='pai__numero')
+    raiz = django_filters.BooleanFilter(field_name='pai', lookup_expr='isnull')
+    descendentes_de = django_filters.CharFilter(method='filtrar_descendentes')
+
+    class Meta:
+        model = Processo
+        fields = []
+
+    def filtrar_descendentes(self, queryset, name, value):
+        # JOIN indexado na tabela de fechamento (ProcessoAncestral).
+        return queryset.filter(
+            ancestrais_rel__ancestral__numero=value,
+            ancestrais_rel__profundidade__gt=0,
+        )
+
+
+def parametros_do_filtro(filterset_class):
+    """
+    {parâmetro: filtro} com os nomes que o formulário do FilterSet realmente
+    lê. Filtros de intervalo não leem o próprio nome, e sim os sufixos do
+    widget (ex.: data_cadastro_after/data_cadastro_before).
+    """
+    parametros = {}
+    for nome, filtro in filterset_class.base_filters.items():
+        widget = filtro.field.widget
+        for sufixo in getattr(widget, 'suffixes', None) or [None]:
+            parametros[widget.suffixed(nome, sufixo) if sufixo else nome] = nome
+    return parametros
+
+
+def parametros_ignorados(filterset, dados):
+    """
+    Parâmetros de 'dados' que o formulário (já validado) do FilterSet
+    descartou, por não os conhecer ou por não entender o valor (ex.:
+    raiz=talvez vira None no BooleanFilter). Ignorados, eles deixariam a
+    seleção maior do que o pedido.
+    """
+    parametros = parametros_do_filtro(type(filterset))
+    limpos = filterset.form.cleaned_data
+    return sorted(
+        chave for chave in dados
+        if chave not in parametros or limpos.get(parametros[chave]) in EMPTY_VALUES
+    )
+
+
+def calcular_facetas(queryset, nomes):
+    """
+    Conta os processos do queryset (já filtrado) por valor de cada faceta.
+
+    Todas as facetas saem de um único GROUP BY sobre a combinação das colunas
+    pedidas; os totais de cada faceta são somados em memória e os nomes vêm
+    do cache das tabelas de domínio. Retorna
+    {faceta: [{'id', 'nome', 'total'}, ...]} ordenado por total decrescente.
+    """
+    colunas = {nome: Processo._meta.get_field(nome).attname for nome in nomes}
+    combinacoes = (
+        queryset.order_by()
+        .values(*colunas.values())
+        .annotate(total=Count('id', distinct=True))
+    )
+
+    totais = {nome: {} for nome in nomes}
+    for linha in combinacoes:
+        for nome, coluna in colunas.items():
+            valor = linha[coluna]
+            totais[nome][valor] = totais[nome].get(valor, 0) + linha['total']
+
+    facetas = {}
+    for nome, contagem in totais.items():
+        cache = tabela(FACETAS_PROCESSO[nome])
+        facetas[nome] = sorted(
+            (
+                {'id': pk, 'nome': cache.nome(pk) if pk is not None else None, 'total': total}
+                for pk, total in contagem.items()
+            ),
+            key=lambda item: (-item['total'], item['nome'] or ''),
+        )
+    return facetas
+
+
+class ProcessoSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter que, no SQLite, consulta o índice FTS5 (processo/busca.py)
+    em vez de encadear LIKE '%termo%' sobre os search_fields, e ordena os
+    resultados pela relevância (bm25) quando o cliente não pede ?ordering=.
+    Em outros bancos mantém o comportamento padrão do DRF.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        termos = self.get_search_terms(request)
+        if not termos or not busca.fts_disponivel():
+            return super().filter_queryset(request, queryset, view)
+
+        consulta = busca.montar_consulta(termos)
+        if not consulta:
+            return queryset
+
+        sql, params = busca.sql_ids(consulta)
+        queryset = queryset.filter(id__in=RawSQL(sql, params))
+        if request.query_params.get(_ordering_param(view)):
+            return queryset
+
+        sql, params = busca.sql_relevancia(consulta)
+        return queryset.annotate(relevancia=RawSQL(sql, params)).order_by('relevancia', '-data_cadastro')
+
+
+def _ordering_param(view):
+    """Nome do parâmetro de ordenação usado pelo OrderingFilter da view."""
+    for backend in getattr(view, 'filter_backends', []):
+        if issubclass(backend, filters.OrderingFilter):
+            return backend.ordering_param
+    return filters.OrderingFilter.ordering_param
+
+
+class AlteracaoCampoFilter(django_filters.FilterSet):
+    """
+    Filtros da consulta de auditoria (/api/historico/). 'campo' e
+    'alterado_por' com período (?data_after=&data_before=) usam os índices
+    (campo, data) e (alterado_por, data) de AlteracaoCampo.
+    """
+    campo = CharInFilter(field_name='campo', lookup_expr='in')
+    alterado_por = NumberInFilter(field_name='alterado_por_id', lookup_expr='in')
+    processo = django_filters.CharFilter(field_name='processo__numero')
+    id_anterior = django_filters.NumberFilter(field_name='id_anterior')
+    id_novo = django_filters.NumberFilter(field_name='id_novo')
+    data = django_filters.DateFromToRangeFilter(field_name='data')
+
+    class Meta:
+        model = AlteracaoCampo
+        fields = ['campo', 'alterado_por', 'processo', 'id_anterior', 'id_novo', 'data']
@@ -0,0 +1,251 @@
+# processo/hierarquia.py
+
+"""
+Consultas sobre a hierarquia de Processos (campo 'pai').
+
+As árvores são carregadas com uma única CTE recursiva em vez de percorrer
+'filhos' nó a nó, o que custaria uma query por nó (mais o 'tipo' de cada um).
+A tabela de fechamento (ProcessoAncestral) é mantida pelas funções do final
+deste módulo, chamadas a partir de processo/signals.py.
+"""
+
+from django.db import connection, transaction
+
+from .models import Processo, ProcessoAncestral, Tipo
+
+# Proteção contra ciclos acidentais em 'pai' (A -> B -> A).
+PROFUNDIDADE_MAXIMA = 100
+
+
+def _colunas():
+    """Nomes (já com aspas) das tabelas e colunas usadas nas CTEs."""
+    q = connection.ops.quote_name
+    campo = Processo._meta.get_field
+    return {
+        'processo': q(Processo._meta.db_table),
+        'tipo': q(Tipo._meta.db_table),
+        'id': q(campo('id').column),
+        'numero': q(campo('numero').column),
+        'assunto': q(campo('assunto').column),
+        'pai': q(campo('pai').column),
+        'tipo_fk': q(campo('tipo').column),
+        'data_cadastro': q(campo('data_cadastro').column),
+        'tipo_id': q(Tipo._meta.pk.column),
+        'tipo_nome': q(Tipo._meta.get_field('nome').column),
+    }
+
+
+def carregar_subarvore(numero, profundidade=None):
+    """
+    Carrega o processo 'numero' e todos os seus descendentes em uma query.
+
+    Retorna a árvore já montada em dicionários no formato
+    {'id', 'numero', 'assunto', 'tipo', 'pai', 'filhos': [...]}, com os filhos
+    ordenados por data de cadastro decrescente, ou None se o processo não existe.
+    'profundidade' limita quantos níveis abaixo da raiz são carregados.
+    """
+    if profundidade is None:
+        profundidade = PROFUNDIDADE_MAXIMA
+    profundidade = min(profundidade, PROFUNDIDADE_MAXIMA)
+
+    sql = """
+        WITH RECURSIVE arvore (id, nivel) AS (
+            SELECT {id}, 0 FROM {processo} WHERE {numero} = %s
+            UNION ALL
+            SELECT p.{id}, a.nivel + 1
+            FROM {processo} p
+            INNER JOIN arvore a ON p.{pai} = a.id
+            WHERE a.nivel < %s
+        )
+        SELECT p.{id}, p.{numero}, p.{assunto}, t.{tipo_nome}, p.{pai}, a.nivel
+        FROM arvore a
+        INNER JOIN {processo} p ON p.{id} = a.id
+        INNER JOIN {tipo} t ON t.{tipo_id} = p.{tipo_fk}
+        ORDER BY a.nivel, p.{data_cadastro} DESC, p.{id}
+    """.format(**_colunas())
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [numero, profundidade])
+        linhas = cursor.fetchall()
+
+    raiz = None
+    nos = {}
+    for id_, numero_, assunto, tipo, pai_id, nivel in linhas:
+        if id_ in nos:
+            # Só acontece se houver ciclo em 'pai'.
+            continue
+        no = {
+            'id': id_, 'numero': numero_, 'assunto': assunto,
+            'tipo': tipo, 'pai': pai_id, 'filhos': [],
+        }
+        nos[id_] = no
+        if nivel == 0:
+            raiz = no
+        else:
+            nos[pai_id]['filhos'].append(no)
+    return raiz
+
+
+def carregar_caminho(numero):
+    """
+    Carrega a cadeia de ancestrais do processo 'numero' em uma query.
+
+    Retorna a lista [{'numero', 'assunto', 'tipo'}, ...] da raiz até o
+    próprio processo (útil para breadcrumbs), ou None se ele não existe.
+    """
+    sql = """
+        WITH RECURSIVE caminho (id, nivel) AS (
+            SELECT {id}, 0 FROM {processo} WHERE {numero} = %s
+            UNION ALL
+            SELECT p.{pai}, c.nivel + 1
+            FROM caminho c
+            INNER JOIN {processo} p ON p.{id} = c.id
+            WHERE p.{pai} IS NOT NULL AND c.nivel < %s
+        )
+        SELECT p.{numero}, p.{assunto}, t.{tipo_nome}
+        FROM caminho c
+        INNER JOIN {processo} p ON p.{id} = c.id
+        INNER JOIN {tipo} t ON t.{tipo_id} = p.{tipo_fk}
+        ORDER BY c.nivel DESC
+    """.format(**_colunas())
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [numero, PROFUNDIDADE_MAXIMA])
+        linhas = cursor.fetchall()
+    if not linhas:
+        return None
+
+    caminho = []
+    vistos = set()
+    # Percorre do processo para cima, parando se 'pai' formar um ciclo.
+    for numero_, assunto, tipo in reversed(linhas):
+        if numero_ in vistos:
+            break
+        vistos.add(numero_)
+        caminho.append({'numero': numero_, 'assunto': assunto, 'tipo': tipo})
+    caminho.reverse()
+    return caminho
+
+
+# --- Manutenção da tabela de fechamento (ProcessoAncestral) ---
+
+def inserir_no(processo_id, pai_id):
+    """Registra um processo recém-criado e seus ancestrais na tabela de fechamento."""
+    linhas = [ProcessoAncestral(ancestral_id=processo_id, descendente_id=processo_id, profundidade=0)]
+    if pai_id:
+        ancestrais = ProcessoAncestral.objects.filter(descendente_id=pai_id).values_list('ancestral_id', 'profundidade')
+        linhas += [
+            ProcessoAncestral(ancestral_id=ancestral_id, descendente_id=processo_id, profundidade=profundidade + 1)
+            for ancestral_id, profundidade in ancestrais
+        ]
+    ProcessoAncestral.objects.bulk_create(linhas)
+
+
+def inserir_nos(pares):
+    """
+    Versão em lote de inserir_no para [(processo_id, pai_id)], com cada pai
+    antes dos seus filhos: os ancestrais dos pais já gravados vêm de uma
+    única query e os dos pais do próprio lote são montados em memória.
+    """
+    ids_lote = {processo_id for processo_id, _ in pares}
+    externos = {pai_id for _, pai_id in pares if pai_id and pai_id not in ids_lote}
+    ancestrais = {}
+    for descendente_id, ancestral_id, profundidade in ProcessoAncestral.objects.filter(
+        descendente_id__in=externos
+    ).values_list('descendente_id', 'ancestral_id', 'profundidade'):
+        ancestrais.setdefault(descendente_id, []).append((ancestral_id, profundidade))
+
+    linhas = []
+    for processo_id, pai_id in pares:
+        caminho = [(processo_id, 0)]
+        if pai_id:
+            caminho += [(ancestral_id, profundidade + 1) for ancestral_id, profundidade in ancestrais.get(pai_id, [])]
+        ancestrais[processo_id] = caminho
+        linhas += [
+            ProcessoAncestral(ancestral_id=ancestral_id, descendente_id=processo_id, profundidade=profundidade)
+            for ancestral_id, profundidade in caminho
+        ]
+    ProcessoAncestral.objects.bulk_create(linhas)
+
+
+def mover_subarvore(processo_id, novo_pai_id):
+    """
+    Reposiciona o processo e toda a sua subárvore sob 'novo_pai_id' (ou na raiz).
+
+    As ligações internas da subárvore são preservadas; só são trocadas as
+    ligações entre a subárvore e os ancestrais antigos/novos.
+    """
+    subarvore = list(
+        ProcessoAncestral.objects.filter(ancestral_id=processo_id).values_list('descendente_id', 'profundidade')
+    )
+    ids_subarvore = [descendente_id for descendente_id, _ in subarvore]
+
+    ProcessoAncestral.objects.filter(
+        descendente_id__in=ids_subarvore
+    ).exclude(ancestral_id__in=ids_subarvore).delete()
+
+    if novo_pai_id:
+        ancestrais = ProcessoAncestral.objects.filter(descendente_id=novo_pai_id).values_list('ancestral_id', 'profundidade')
+        ProcessoAncestral.objects.bulk_create([
+            ProcessoAncestral(
+                ancestral_id=ancestral_id,
+                descendente_id=descendente_id,
+                profundidade=prof_ancestral + prof_descendente + 1,
+            )
+            for ancestral_id, prof_ancestral in ancestrais
+            for descendente_id, prof_descendente in subarvore
+        ])
+
+
+def desligar_descendentes(processo_id):
+    """
+    Chamado antes de excluir um processo: seus filhos passam a ser raízes
+    (on_delete=SET_NULL), então as ligações entre os descendentes e os
+    ancestrais do processo excluído deixam de valer.
+    """
+    ancestrais = ProcessoAncestral.objects.filter(
+        descendente_id=processo_id, profundidade__gt=0
+    ).values_list('ancestral_id', flat=True)
+    descendentes = ProcessoAncestral.objects.filter(
+        ancestral_id=processo_id, profundidade__gt=0
+    ).values_list('descendente_id', flat=True)
+    ProcessoAncestral.objects.filter(
+        ancestral_id__in=list(ancestrais), descendente_id__in=list(descendentes)
+    ).delete()
+
+
+def eh_descendente(processo_id, ancestral_id):
+    """Indica se 'processo_id' está abaixo de 'ancestral_id' (ou é o próprio)."""
+    return ProcessoAncestral.objects.filter(ancestral_id=ancestral_id, descendente_id=processo_id).exists()
+
+
+def reconstruir_fechamento():
+    """Recria toda a tabela de fechamento a partir do campo 'pai'. Retorna o nº de linhas."""
+    colunas = _colunas()
+    q = connection.ops.quote_name
+    colunas.update({
+        'fechamento': q(ProcessoAncestral._meta.db_table),
+        'ancestral': q(ProcessoAncestral._meta.get_field('ancestral').column),
+        'descendente': q(ProcessoAncestral._meta.get_field('descendente').column),
+        'profundidade': q(ProcessoAncestral._meta.get_field('profundidade').column),
+    })
+    sql = """
+        INSERT INTO {fechamento} ({ancestral}, {descendente}, {profundidade})
+        WITH RECURSIVE caminhos (ancestral, descendente, profundidade) AS (
+            SELECT {id}, {id}, 0 FROM {processo}
+            UNION ALL
+            SELECT c.ancestral, p.{id}, c.profundidade + 1
+            FROM caminhos c
+            INNER JOIN {processo} p ON p.{pai} = c.descendente
+            WHERE c.profundidade < %s
+        )
+        SELECT ancestral, descendente, MIN(profundidade)
+        FROM caminhos
+        GROUP BY ancestral, descendente
+    """.format(**colunas)
+
+    with transaction.atomic():
+        ProcessoAncestral.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [PROFUNDIDADE_MAXIMA])
+    return ProcessoAncestral.objects.count()
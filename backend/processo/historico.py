@@ -0,0 +1,376 @@
+# processo/historico.py
+
+"""
+Coletor de alterações para o histórico dos Processos.
+
+Uma mesma operação (ex.: um PATCH) altera campos do processo, os
+ManyToMany e os submodelos Execucao/Resposta, e cada parte era gravada
+como um HistoricoProcesso separado. Dentro de um bloco operacao() (usado
+pelos serializers, pela importação e pela atualização em lote), cada
+entrega dos sinais entra no lote da operação por um transaction.on_commit
+registrado no bloco atômico em que aconteceu; quando a transação é
+confirmada, o lote é agrupado e gravado em um único registro por processo.
+Fora de uma operação o registro é gravado na hora, na transação corrente.
+
+Se um savepoint é desfeito, o Django descarta os callbacks registrados
+dentro dele, e com eles as entradas: o histórico nunca traz alterações
+desfeitas. A gravação do lote é registrada na saída do bloco operacao()
+mais externo, depois de todas as entradas, e roda por último no commit;
+o coletor não precisa saber quais entradas ainda estão pendentes.
+"""
+
+import copy
+import functools
+import logging
+import threading
+from contextlib import contextmanager
+from itertools import chain, zip_longest
+
+from django.db import transaction
+
+from . import deltas
+from .cache import em_cache, tabela
+from .middleware import get_current_user
+from .models import AlteracaoCampo, HistoricoProcesso, HistoricoProcessoArquivado, Processo, Tipo
+
+# Eventos DEBUG deste logger são amostrados (filtro 'amostragem_historico' em settings.LOGGING).
+logger = logging.getLogger(__name__)
+
+_estado = threading.local()
+
+
+# --- Rótulos dos valores ---
+
+def rotulo_processo(numero, assunto, tipo_id):
+    """Mesmo texto de Processo.__str__, com o tipo vindo do cache (sem query)."""
+    return f"{tabela(Tipo).nome(tipo_id)}: {numero} - {assunto}"
+
+
+def rotular(field, valor, instance=None):
+    """
+    Texto de 'valor' (para FKs, o *_id) do campo 'field' no histórico. Tabelas
+    de domínio usam o cache em memória; para o 'pai' aproveita-se o objeto já
+    carregado na instância, se houver, ou lê-se só numero/assunto/tipo.
+    """
+    if valor is None:
+        return 'N/A'
+    if not field.is_relation:
+        return str(valor)
+
+    model = field.related_model
+    if em_cache(model):
+        rotulo = tabela(model).nome(valor)
+        if rotulo is not None:
+            return rotulo
+    if instance is not None and field.is_cached(instance):
+        relacionado = field.get_cached_value(instance)
+        if relacionado is not None and relacionado.pk == valor:
+            if isinstance(relacionado, Processo):
+                return rotulo_processo(relacionado.numero, relacionado.assunto, relacionado.tipo_id)
+            return str(relacionado)
+    if model is Processo:
+        linha = Processo.objects.filter(pk=valor).values('numero', 'assunto', 'tipo_id').first()
+        return rotulo_processo(**linha) if linha else str(valor)
+    relacionado = model._default_manager.filter(pk=valor).first()
+    return str(relacionado) if relacionado is not None else str(valor)
+
+
+def alteracoes_criacao(instance):
+    """
+    Alterações e chaves do registro de criação de um processo: os campos
+    preenchidos em 'dados_iniciais', com rótulos vindos dos *_id (sem
+    carregar as relações).
+    """
+    preenchidos = [
+        field for field in instance._meta.concrete_fields
+        if field.name not in ['id', 'data_cadastro', 'data_atualizacao'] and getattr(instance, field.attname)
+    ]
+    alteracoes = {
+        'status': 'Processo criado.',
+        'dados_iniciais': {
+            field.name: rotular(field, getattr(instance, field.attname), instance) for field in preenchidos
+        },
+    }
+    ids = {
+        'dados_iniciais': {
+            field.name: getattr(instance, field.attname) for field in preenchidos if field.is_relation
+        },
+    }
+    return alteracoes, ids
+
+
+def mudancas_submodelo(instance):
+    """
+    Campos alterados de um submodelo (Execucao/Resposta) ainda não salvo, no
+    formato {campo: {'anterior', 'novo'}}. Um submodelo novo traz só os
+    campos preenchidos com algo além do padrão.
+    """
+    anteriores = instance.valores_carregados() or {}
+    if instance._state.adding:
+        campos = [
+            field for field in instance._meta.concrete_fields
+            if not field.primary_key and field.name != 'processo'
+            and getattr(instance, field.attname) != field.get_default()
+        ]
+    else:
+        campos = [field for field in instance.campos_alterados() if field.name != 'processo']
+
+    mudancas = {}
+    for field in campos:
+        anterior = anteriores.get(field.attname)
+        novo = getattr(instance, field.attname)
+        mudancas[field.name] = {
+            'anterior': str(anterior) if anterior is not None else 'N/A',
+            'novo': str(novo) if novo is not None else 'N/A',
+        }
+    return mudancas
+
+
+# --- Coletor ---
+
+def _mesclar(destino, novas):
+    """Acrescenta 'novas' às alterações já coletadas para o mesmo processo."""
+    for chave, valor in novas.items():
+        atual = destino.get(chave)
+        if isinstance(atual, dict) and isinstance(valor, dict):
+            if 'anterior' in atual and 'anterior' in valor:
+                # Campo alterado duas vezes: vale o primeiro 'anterior' e o último 'novo'.
+                destino[chave] = {'anterior': atual['anterior'], 'novo': valor['novo']}
+            else:
+                _mesclar(atual, valor)
+        elif isinstance(atual, list) and isinstance(valor, list):
+            # Sem remover repetidos: as listas de rótulos e de ids precisam ficar alinhadas.
+            atual.extend(valor)
+        else:
+            destino[chave] = valor
+
+
+def _sem_efeito(alteracoes):
+    """Remove os campos que voltaram ao valor original dentro da transação."""
+    resultado = {}
+    for chave, valor in alteracoes.items():
+        if isinstance(valor, dict) and 'anterior' in valor:
+            if valor['anterior'] == valor.get('novo'):
+                continue
+        elif isinstance(valor, dict) and all(isinstance(item, dict) for item in valor.values()):
+            # Submodelo (ex.: 'resposta': {'prazo_inicial': {...}}).
+            valor = _sem_efeito(valor)
+            if not valor:
+                continue
+        resultado[chave] = valor
+    return resultado
+
+
+def _truncar(rotulo):
+    return rotulo[:255] if isinstance(rotulo, str) else rotulo
+
+
+def _campos_alterados(alteracoes, ids, prefixo=''):
+    """
+    Gera (campo, id_anterior, id_novo, rotulo_anterior, rotulo_novo) para
+    cada campo de 'alteracoes'; 'ids' tem a mesma forma, com as chaves das
+    FKs/ManyToMany no lugar dos rótulos.
+    """
+    for chave, valor in alteracoes.items():
+        if not isinstance(valor, dict):
+            continue
+        ids_valor = ids.get(chave) if isinstance(ids.get(chave), dict) else {}
+        nome = prefixo + chave
+        if 'anterior' in valor:
+            yield nome, ids_valor.get('anterior'), ids_valor.get('novo'), valor['anterior'], valor['novo']
+        elif 'delta' in valor or 'delta_zlib' in valor:
+            # Texto longo já compactado: só o registro de que o campo mudou.
+            yield nome, None, None, None, None
+        elif chave == 'dados_iniciais':
+            for campo, rotulo in valor.items():
+                yield campo, None, ids_valor.get(campo), None, rotulo
+        elif 'adicionado' in valor or 'removido' in valor:
+            for rotulo, pk in zip_longest(valor.get('adicionado', []), ids_valor.get('adicionado', [])):
+                yield nome, None, pk, None, rotulo
+            for rotulo, pk in zip_longest(valor.get('removido', []), ids_valor.get('removido', [])):
+                yield nome, pk, None, rotulo, None
+        elif all(isinstance(item, dict) for item in valor.values()):
+            yield from _campos_alterados(valor, ids_valor, prefixo=nome + '.')
+
+
+@contextmanager
+def operacao():
+    """
+    Bloco atômico (também usado como decorador: @historico.operacao()) cujo
+    histórico vira um registro por processo. Cada registrar() feito dentro
+    dele entra no lote pelo on_commit do bloco atômico em que aconteceu; a
+    gravação do lote é registrada na saída do bloco mais externo, depois de
+    todas as entradas, e por isso roda por último no commit.
+    """
+    lotes = _lotes()
+    externo = not lotes
+    with transaction.atomic():
+        lotes.append([] if externo else lotes[-1])
+        try:
+            yield
+        finally:
+            lote = lotes.pop()
+        if externo:
+            transaction.on_commit(functools.partial(_gravar_lote, lote))
+
+
+def _lotes():
+    """Pilha dos blocos operacao() abertos nesta thread (todos com o mesmo lote)."""
+    if not hasattr(_estado, 'lotes'):
+        _estado.lotes = []
+    return _estado.lotes
+
+
+def _gravar_lote(lote):
+    _gravar(_agrupar(lote))
+
+
+def _agrupar(entradas):
+    """Junta as entradas confirmadas em uma por processo, na ordem em que foram feitas."""
+    por_processo = {}
+    for entrada in entradas:
+        if 'descartar' in entrada:
+            por_processo.pop(entrada['descartar'], None)
+            continue
+        atual = por_processo.setdefault(entrada['processo_id'], {
+            'processo_id': entrada['processo_id'],
+            'alterado_por': entrada['alterado_por'],
+            'tipo_alteracao': entrada['tipo_alteracao'],
+            'alteracoes': {},
+            'ids': {},
+        })
+        if entrada['tipo_alteracao'] == 'CRIACAO':
+            atual['tipo_alteracao'] = 'CRIACAO'
+        _mesclar(atual['alteracoes'], copy.deepcopy(entrada['alteracoes']))
+        _mesclar(atual['ids'], copy.deepcopy(entrada['ids']))
+    return list(por_processo.values())
+
+
+def _gravar(entradas):
+    registros = []
+    for entrada in entradas:
+        alteracoes = _sem_efeito(entrada['alteracoes'])
+        if alteracoes:
+            registros.append((HistoricoProcesso(
+                processo_id=entrada['processo_id'],
+                alterado_por=entrada['alterado_por'],
+                tipo_alteracao=entrada['tipo_alteracao'],
+                alteracoes=alteracoes,
+            ), entrada['ids']))
+    if not registros:
+        return
+
+    # As linhas normalizadas saem dos textos completos; só então os campos
+    # longos são guardados como delta no JSON do histórico.
+    linhas = []
+    for historico, ids in registros:
+        linhas.append(linhas_alteracoes_campos(historico, ids))
+        historico.alteracoes, _ = deltas.compactar_alteracoes(historico.alteracoes)
+
+    with transaction.atomic():
+        HistoricoProcesso.objects.bulk_create([historico for historico, _ in registros])
+        for (historico, _), linhas_historico in zip(registros, linhas):
+            for linha in linhas_historico:
+                linha.historico_id = historico.pk
+        AlteracaoCampo.objects.bulk_create([linha for linhas_historico in linhas for linha in linhas_historico])
+
+
+def linhas_alteracoes_campos(historico, ids=None):
+    """AlteracaoCampo (não salvas) de um HistoricoProcesso (ou HistoricoProcessoArquivado) já gravado."""
+    return [
+        AlteracaoCampo(
+            historico_id=historico.pk,
+            processo_id=historico.processo_id,
+            campo=campo,
+            id_anterior=id_anterior,
+            id_novo=id_novo,
+            rotulo_anterior=_truncar(rotulo_anterior),
+            rotulo_novo=_truncar(rotulo_novo),
+            alterado_por_id=historico.alterado_por_id,
+            data=historico.data,
+        )
+        for campo, id_anterior, id_novo, rotulo_anterior, rotulo_novo
+        in _campos_alterados(historico.alteracoes, ids or {})
+    ]
+
+
+def registrar(processo, tipo_alteracao, alteracoes, ids=None):
+    """
+    Entrega as alterações de um processo ao histórico (agrupadas por operacao()).
+    'ids' repete a forma de 'alteracoes' com as chaves de FKs e ManyToMany.
+    """
+    if not alteracoes:
+        return
+    entrada = {
+        'processo_id': processo.pk,
+        'alterado_por': get_current_user(),
+        'tipo_alteracao': tipo_alteracao,
+        'alteracoes': {},
+        'ids': {},
+    }
+    _mesclar(entrada['alteracoes'], alteracoes)
+    _mesclar(entrada['ids'], ids or {})
+    lotes = _lotes()
+    if lotes:
+        transaction.on_commit(functools.partial(lotes[-1].append, entrada))
+    else:
+        _gravar([entrada])
+
+
+def descartar(processo_id):
+    """Esquece as alterações pendentes de um processo excluído na mesma operacao()."""
+    lotes = _lotes()
+    if lotes:
+        transaction.on_commit(functools.partial(lotes[-1].append, {'descartar': processo_id}))
+
+
+def registrar_historico_m2m(processo, campo, adicionados=(), removidos=()):
+    """
+    Registra no histórico os itens adicionados/removidos do campo ManyToMany
+    'campo'. Usado pelo sinal m2m_changed (processo/signals.py), pela
+    sincronização em lote do serializer de escrita e pela importação (que
+    gravam na tabela intermediária sem disparar m2m_changed).
+    """
+    mudancas, chaves = {}, {}
+    if adicionados:
+        mudancas['adicionado'] = [str(item) for item in adicionados]
+        chaves['adicionado'] = [item.pk for item in adicionados]
+    if removidos:
+        mudancas['removido'] = [str(item) for item in removidos]
+        chaves['removido'] = [item.pk for item in removidos]
+    if not mudancas:
+        return
+
+    alteracoes = {campo: mudancas}
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "m2m: histórico de %s do Processo %s", campo, processo.numero,
+            extra={'processo': processo.numero, 'campo': campo, 'adicionados': len(adicionados), 'removidos': len(removidos)},
+        )
+    registrar(processo, 'ATUALIZACAO', alteracoes, {campo: chaves})
+
+
+# --- Reconstrução de versões ---
+
+def versao_campo(processo, campo, data):
+    """
+    Valor de 'campo' do processo no instante 'data': parte do valor atual e
+    desfaz, do mais recente para o mais antigo, as alterações registradas
+    depois de 'data' (textos longos guardados como delta e registros
+    arquivados inclusive).
+    Retorna None se o processo ainda não existia.
+    """
+    if processo.data_cadastro > data:
+        return None
+    valor = getattr(processo, campo)
+    # O arquivo guarda só registros mais antigos que os da tabela principal.
+    historicos = chain.from_iterable(
+        model.objects.filter(processo=processo, data__gt=data)
+        .order_by('-data', '-id').values_list('alteracoes', flat=True).iterator()
+        for model in (HistoricoProcesso, HistoricoProcessoArquivado)
+    )
+    for alteracoes in historicos:
+        alteracao = alteracoes.get(campo)
+        if isinstance(alteracao, dict):
+            valor = deltas.valor_anterior(alteracao, valor)
+    return valor
@@ -0,0 +1,255 @@
+# processo/importacao.py
+
+"""
+Importação de processos em lote (POST /api/processos/importar/).
+
+Criar processo a processo custa uma dúzia de queries por item (sinais,
+.set() dos ManyToMany, submodelos, histórico). Aqui o lote inteiro é
+validado antes de gravar qualquer coisa, com as chaves de todas as linhas
+lidas de uma vez, e a gravação usa bulk_create para processos, tabelas
+intermediárias, submodelos, tabela de fechamento e histórico, em uma única
+transação. Como bulk_create não dispara sinais, o que os sinais de
+processo/signals.py fariam (hierarquia, contadores, índice de busca,
+histórico) é feito aqui, em lote.
+
+Cada linha pode trazer uma 'ref' (identificador livre, só do lote) e
+apontar o pai por 'pai' (id de um processo já gravado) ou por 'pai_ref'
+(a 'ref' de outra linha do mesmo lote).
+"""
+
+import csv
+import io
+import re
+from collections import Counter
+
+from django.conf import settings
+
+from . import busca, contadores, hierarquia, historico
+from .models import Auditor, Execucao, Processo, Resposta
+from .serializers import CAMPOS_M2M_PROCESSO, ProcessoCreateUpdateSerializer
+
+SUBMODELOS = {'execucao': Execucao, 'resposta': Resposta}
+
+# Separadores aceitos nas células de ManyToMany do CSV (ex.: "1|4|7").
+_SEPARADOR_LISTA = re.compile(r'[|,;]')
+
+# Tentadas em ordem; 'utf-8-sig' também aceita o BOM que o Excel grava em UTF-8.
+CODIFICACOES_CSV = ('utf-8-sig', 'cp1252')
+
+
+def limite_importacao():
+    return getattr(settings, 'PROCESSO_IMPORTACAO_MAXIMO', 1000)
+
+
+# --- Leitura ---
+
+def _decodificar(conteudo):
+    """Texto do CSV em UTF-8 ou, se não for, em cp1252 (o padrão do Excel no Windows)."""
+    for codificacao in CODIFICACOES_CSV:
+        try:
+            return conteudo.decode(codificacao)
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"Codificação do arquivo não reconhecida (aceitas: {', '.join(CODIFICACOES_CSV)}).")
+
+
+def ler_csv(arquivo):
+    """
+    Converte um CSV (cabeçalho com os nomes dos campos do serializer de
+    escrita) em uma lista de dicts. Células vazias são ignoradas, colunas
+    'execucao.<campo>'/'resposta.<campo>' viram os dados aninhados e as de
+    ManyToMany são listas separadas por '|', ',' ou ';'. Levanta ValueError
+    se o arquivo não estiver em nenhuma das CODIFICACOES_CSV.
+    """
+    conteudo = arquivo.read()
+    if isinstance(conteudo, bytes):
+        conteudo = _decodificar(conteudo)
+    try:
+        dialeto = csv.Sniffer().sniff(conteudo[:4096], delimiters=',;\t')
+    except csv.Error:
+        dialeto = csv.excel
+
+    linhas = []
+    for registro in csv.DictReader(io.StringIO(conteudo), dialect=dialeto):
+        linha = {}
+        for coluna, valor in registro.items():
+            if coluna is None or valor is None or not valor.strip():
+                continue
+            coluna, valor = coluna.strip(), valor.strip()
+            if '.' in coluna:
+                relacao, campo = coluna.split('.', 1)
+                linha.setdefault(relacao, {})[campo] = valor
+            elif coluna in CAMPOS_M2M_PROCESSO:
+                linha[coluna] = [item.strip() for item in _SEPARADOR_LISTA.split(valor) if item.strip()]
+            else:
+                linha[coluna] = valor
+        linhas.append(linha)
+    return linhas
+
+
+# --- Validação ---
+
+def _chaves(linhas, campo):
+    """Chaves inteiras citadas em 'campo' (valor ou lista) de todas as linhas."""
+    chaves = set()
+    for linha in linhas:
+        valores = linha.get(campo)
+        for valor in valores if isinstance(valores, list) else [valores]:
+            try:
+                chaves.add(int(valor))
+            except (TypeError, ValueError):
+                continue
+    return chaves
+
+
+def _ordenar_por_nivel(itens, erros):
+    """
+    Ordena os itens de modo que cada 'pai_ref' venha antes dos seus filhos,
+    registrando em 'erros' as referências desconhecidas e os ciclos.
+    """
+    por_ref = {item['ref']: item for item in itens if item['ref'] is not None}
+    ordenados, posicionados = [], set()
+    pendentes = list(itens)
+    while pendentes:
+        restantes = []
+        for item in pendentes:
+            pai_ref = item['pai_ref']
+            if pai_ref is None or pai_ref in posicionados:
+                ordenados.append(item)
+                if item['ref'] is not None:
+                    posicionados.add(item['ref'])
+            elif pai_ref not in por_ref:
+                erros.setdefault(item['linha'], {})['pai_ref'] = [f"Nenhuma linha do lote tem ref '{pai_ref}'."]
+            else:
+                restantes.append(item)
+        if len(restantes) == len(pendentes):
+            for item in restantes:
+                erros.setdefault(item['linha'], {})['pai_ref'] = ['Referência circular entre linhas do lote.']
+            break
+        pendentes = restantes
+    return ordenados
+
+
+def validar_lote(linhas, context=None):
+    """
+    Valida todas as linhas com ProcessoCreateUpdateSerializer. Os pais e os
+    auditores citados no lote são lidos em uma query cada e entregues ao
+    serializer pelo contexto 'precarregados'.
+
+    Retorna (itens, erros): 'itens' em ordem de gravação (pais antes dos
+    filhos) e 'erros' como [{'linha', 'ref', 'erros'}], vazio se o lote é válido.
+    """
+    pais = Processo.objects.filter(pk__in=_chaves(linhas, 'pai')).only('id', 'numero', 'assunto', 'tipo_id')
+    contexto = dict(context or {})
+    contexto['precarregados'] = {
+        Processo: {processo.pk: processo for processo in pais},
+        Auditor: Auditor.objects.in_bulk(_chaves(linhas, 'auditores_responsaveis')),
+    }
+
+    itens, erros, refs = [], {}, Counter()
+    for numero_linha, linha in enumerate(linhas, start=1):
+        if not isinstance(linha, dict):
+            erros[numero_linha] = {'non_field_errors': ['Cada linha deve ser um objeto.']}
+            continue
+        dados = dict(linha)
+        ref = dados.pop('ref', None)
+        pai_ref = dados.pop('pai_ref', None)
+        ref = str(ref) if ref is not None else None
+        pai_ref = str(pai_ref) if pai_ref is not None else None
+        refs[ref] += 1
+
+        serializer = ProcessoCreateUpdateSerializer(data=dados, context=contexto)
+        if not serializer.is_valid():
+            erros[numero_linha] = dict(serializer.errors)
+        if pai_ref is not None and serializer.initial_data.get('pai') is not None:
+            erros.setdefault(numero_linha, {})['pai_ref'] = ["Informe 'pai' ou 'pai_ref', não ambos."]
+        itens.append({'linha': numero_linha, 'ref': ref, 'pai_ref': pai_ref, 'serializer': serializer})
+
+    for item in itens:
+        if item['ref'] is not None and refs[item['ref']] > 1:
+            erros.setdefault(item['linha'], {})['ref'] = [f"A ref '{item['ref']}' se repete no lote."]
+
+    refs_por_linha = {item['linha']: item['ref'] for item in itens}
+    itens = _ordenar_por_nivel(itens, erros)
+    lista_erros = [
+        {'linha': numero_linha, 'ref': refs_por_linha.get(numero_linha), 'erros': erros_linha}
+        for numero_linha, erros_linha in sorted(erros.items())
+    ]
+    return itens, lista_erros
+
+
+# --- Gravação ---
+
+def numeros_livres(quantidade):
+    """Gera 'quantidade' números de processo inéditos, conferidos contra o banco em lote."""
+    numeros = set()
+    while len(numeros) < quantidade:
+        candidatos = {Processo.gerar_numero() for _ in range(quantidade - len(numeros))} - numeros
+        em_uso = set(Processo.objects.filter(numero__in=candidatos).values_list('numero', flat=True))
+        numeros |= candidatos - em_uso
+    return list(numeros)
+
+
+@historico.operacao()
+def importar(itens):
+    """
+    Grava os itens validados (na ordem de validar_lote, pais antes dos
+    filhos) e preenche item['processo'] em cada um.
+    """
+    numeros = iter(numeros_livres(len(itens)))
+    por_ref, nivel_por_ref, niveis = {}, {}, {}
+    for item in itens:
+        dados = dict(item['serializer'].validated_data)
+        item['relacionados'] = {relacao: dados.pop(relacao, None) for relacao in (*SUBMODELOS, *CAMPOS_M2M_PROCESSO)}
+        processo = Processo(numero=next(numeros), **dados)
+        nivel = 0
+        if item['pai_ref'] is not None:
+            processo.pai = por_ref[item['pai_ref']]
+            nivel = nivel_por_ref[item['pai_ref']] + 1
+        if item['ref'] is not None:
+            por_ref[item['ref']] = processo
+            nivel_por_ref[item['ref']] = nivel
+        item['processo'] = processo
+        niveis.setdefault(nivel, []).append(processo)
+
+    # Um bulk_create por nível da hierarquia do lote: o id do pai precisa existir antes dos filhos.
+    for nivel in sorted(niveis):
+        Processo.objects.bulk_create(niveis[nivel])
+    processos = [item['processo'] for item in itens]
+
+    for campo in CAMPOS_M2M_PROCESSO:
+        relacao = Processo._meta.get_field(campo)
+        through = relacao.remote_field.through
+        coluna_processo = relacao.m2m_field_name() + '_id'
+        coluna_item = relacao.m2m_reverse_field_name() + '_id'
+        through.objects.bulk_create([
+            through(**{coluna_processo: item['processo'].pk, coluna_item: obj.pk})
+            for item in itens for obj in item['relacionados'][campo] or []
+        ])
+
+    submodelos = []
+    for relacao, model in SUBMODELOS.items():
+        objetos = [
+            model(processo=item['processo'], **item['relacionados'][relacao])
+            for item in itens if item['relacionados'][relacao]
+        ]
+        # O diff do histórico é calculado antes de gravar, enquanto a instância é nova.
+        submodelos += [(relacao, objeto, historico.mudancas_submodelo(objeto)) for objeto in objetos]
+        model.objects.bulk_create(objetos)
+
+    # O que os sinais de post_save fariam para cada processo, em lote.
+    hierarquia.inserir_nos([(processo.pk, processo.pai_id) for processo in processos])
+    busca.indexar(processos)
+    contadores.ajustar(Counter(processo.situacao_id for processo in processos))
+
+    # Histórico: um registro de criação por processo, gravado em lote no commit.
+    for item in itens:
+        processo = item['processo']
+        alteracoes, ids = historico.alteracoes_criacao(processo)
+        historico.registrar(processo, 'CRIACAO', alteracoes, ids)
+        for campo in CAMPOS_M2M_PROCESSO:
+            historico.registrar_historico_m2m(processo, campo, adicionados=item['relacionados'][campo] or [])
+    for relacao, objeto, mudancas in submodelos:
+        if mudancas:
+            historico.registrar(objeto.processo, 'ATUALIZACAO', {relacao: mudancas})
+    return processos
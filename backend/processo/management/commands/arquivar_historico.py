@@ -0,0 +1,44 @@
+# processo/management/commands/arquivar_historico.py
+
+from django.core.management.base import BaseCommand
+
+from processo.retencao import arquivar_lote, dias_retencao, historicos_para_arquivar
+
+
+class Command(BaseCommand):
+    help = (
+        "Move para HistoricoProcessoArquivado os registros de histórico mais antigos que --dias "
+        "e/ou (com --finalizados) os de processos em situação final, em lotes. "
+        "O registro mais recente de cada processo permanece na tabela principal."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int, default=None,
+            help="Idade mínima, em dias (padrão: PROCESSO_HISTORICO_RETENCAO_DIAS).",
+        )
+        parser.add_argument('--finalizados', action='store_true', help="Arquiva também o histórico de processos em situação final.")
+        parser.add_argument('--sem-idade', action='store_true', help="Ignora a idade (usar com --finalizados).")
+        parser.add_argument('--lote', type=int, default=500, help="Registros de histórico por transação.")
+        parser.add_argument('--max-lotes', type=int, default=None, help="Para depois deste número de lotes.")
+        parser.add_argument('--simular', action='store_true', help="Só conta os registros elegíveis.")
+
+    def handle(self, *args, **options):
+        dias = None if options['sem_idade'] else (options['dias'] if options['dias'] is not None else dias_retencao())
+        elegiveis = historicos_para_arquivar(dias=dias, finalizados=options['finalizados'])
+
+        if options['simular']:
+            self.stdout.write(f"Registros elegíveis para arquivamento: {elegiveis.count()}.")
+            return
+
+        ultimo_id, lotes, total = 0, 0, 0
+        while options['max_lotes'] is None or lotes < options['max_lotes']:
+            lote = list(elegiveis.filter(id__gt=ultimo_id)[:options['lote']])
+            if not lote:
+                break
+            arquivar_lote(lote)
+            ultimo_id = lote[-1].id
+            lotes += 1
+            total += len(lote)
+
+        self.stdout.write(self.style.SUCCESS(f"Histórico arquivado: {total} registros em {lotes} lotes."))
@@ -0,0 +1,41 @@
+# processo/management/commands/compactar_historico.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from processo.deltas import compactar_alteracoes
+from processo.models import HistoricoProcesso
+
+
+class Command(BaseCommand):
+    help = (
+        "Converte em delta (e comprime, acima do limite) os textos longos guardados inteiros "
+        "nos registros de histórico já existentes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help="Registros de histórico por transação.")
+
+    def handle(self, *args, **options):
+        ultimo_id, lidos, compactados = 0, 0, 0
+        while True:
+            lote = list(
+                HistoricoProcesso.objects.filter(id__gt=ultimo_id, tipo_alteracao='ATUALIZACAO')
+                .order_by('id').only('id', 'alteracoes')[:options['lote']]
+            )
+            if not lote:
+                break
+            alterados = []
+            for historico in lote:
+                historico.alteracoes, mudou = compactar_alteracoes(historico.alteracoes)
+                if mudou:
+                    alterados.append(historico)
+            with transaction.atomic():
+                HistoricoProcesso.objects.bulk_update(alterados, ['alteracoes'])
+            ultimo_id = lote[-1].id
+            lidos += len(lote)
+            compactados += len(alterados)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Histórico compactado: {compactados} de {lidos} registros de atualização."
+        ))
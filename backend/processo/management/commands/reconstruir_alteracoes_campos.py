@@ -0,0 +1,43 @@
+# processo/management/commands/reconstruir_alteracoes_campos.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from processo.historico import linhas_alteracoes_campos
+from processo.models import AlteracaoCampo, HistoricoProcesso, HistoricoProcessoArquivado
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera as linhas normalizadas (AlteracaoCampo) dos registros de histórico, da tabela principal "
+        "e do arquivo, que ainda não as têm. "
+        "Registros antigos não guardam as chaves das FKs: nesses, só os rótulos são preenchidos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help="Registros de histórico por transação.")
+
+    def handle(self, *args, **options):
+        total_historicos, total_linhas = 0, 0
+        # O arquivo guarda o id original do registro, que é o que AlteracaoCampo.historico aponta.
+        for model in (HistoricoProcesso, HistoricoProcessoArquivado):
+            pendentes = model.objects.filter(
+                ~Exists(AlteracaoCampo.objects.filter(historico_id=OuterRef('pk')))
+            ).order_by('id')
+
+            ultimo_id = 0
+            while True:
+                lote = list(pendentes.filter(id__gt=ultimo_id)[:options['lote']])
+                if not lote:
+                    break
+                linhas = [linha for historico in lote for linha in linhas_alteracoes_campos(historico)]
+                with transaction.atomic():
+                    AlteracaoCampo.objects.bulk_create(linhas)
+                ultimo_id = lote[-1].id
+                total_historicos += len(lote)
+                total_linhas += len(linhas)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Alterações normalizadas: {total_linhas} linhas a partir de {total_historicos} registros de histórico."
+        ))
@@ -0,0 +1,15 @@
+# processo/management/commands/reconstruir_contadores.py
+
+from django.core.management.base import BaseCommand
+
+from processo.contadores import reconstruir
+
+
+class Command(BaseCommand):
+    help = "Recalcula a tabela de contadores de processos por situação (ContadorSituacao)."
+
+    def handle(self, *args, **options):
+        totais = reconstruir()
+        self.stdout.write(self.style.SUCCESS(
+            f"Contadores recalculados: {sum(totais.values())} processos em {len(totais)} situações."
+        ))
@@ -0,0 +1,13 @@
+# processo/management/commands/reconstruir_hierarquia.py
+
+from django.core.management.base import BaseCommand
+
+from processo.hierarquia import reconstruir_fechamento
+
+
+class Command(BaseCommand):
+    help = "Reconstrói do zero a tabela de fechamento da hierarquia de processos (ProcessoAncestral)."
+
+    def handle(self, *args, **options):
+        total = reconstruir_fechamento()
+        self.stdout.write(self.style.SUCCESS(f"Tabela de hierarquia reconstruída: {total} ligações."))
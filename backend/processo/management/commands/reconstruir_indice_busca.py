@@ -0,0 +1,16 @@
+# processo/management/commands/reconstruir_indice_busca.py
+
+from django.core.management.base import BaseCommand
+
+from processo.busca import reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = "Recria o índice de busca textual (FTS5) dos processos. Só tem efeito no SQLite."
+
+    def handle(self, *args, **options):
+        total = reconstruir_indice()
+        if total:
+            self.stdout.write(self.style.SUCCESS(f"Índice de busca reconstruído: {total} processos."))
+        else:
+            self.stdout.write(self.style.WARNING("Índice de busca indisponível neste banco (ou sem processos)."))
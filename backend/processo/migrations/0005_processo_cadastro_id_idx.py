@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("processo", "0004_alter_historicoprocesso_options_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="processo",
+            index=models.Index(fields=["-data_cadastro", "id"], name="processo_cadastro_id_idx"),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2 on 2026-10-18 08:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def popular_hierarquia(apps, schema_editor):
+    """Preenche a tabela de fechamento a partir do campo 'pai' existente."""
+    Processo = apps.get_model("processo", "Processo")
+    ProcessoAncestral = apps.get_model("processo", "ProcessoAncestral")
+
+    pais = dict(Processo.objects.values_list("id", "pai_id"))
+    linhas = []
+    for processo_id in pais:
+        atual, profundidade, vistos = processo_id, 0, set()
+        while atual is not None and atual not in vistos:
+            vistos.add(atual)
+            linhas.append(
+                ProcessoAncestral(
+                    ancestral_id=atual,
+                    descendente_id=processo_id,
+                    profundidade=profundidade,
+                )
+            )
+            atual, profundidade = pais.get(atual), profundidade + 1
+    ProcessoAncestral.objects.bulk_create(linhas, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("processo", "0005_processo_cadastro_id_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProcessoAncestral",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("profundidade", models.PositiveIntegerField()),
+                (
+                    "ancestral",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="descendentes_rel",
+                        to="processo.processo",
+                    ),
+                ),
+                (
+                    "descendente",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ancestrais_rel",
+                        to="processo.processo",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ancestral do Processo",
+                "verbose_name_plural": "Ancestrais dos Processos",
+                "indexes": [
+                    models.Index(
+                        fields=["descendente", "profundidade"],
+                        name="processo_ancestral_desc_idx",
+                    )
+                ],
+                "unique_together": {("ancestral", "descendente")},
+            },
+        ),
+        migrations.RunPython(popular_hierarquia, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-18 08:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def popular_contadores(apps, schema_editor):
+    Processo = apps.get_model("processo", "Processo")
+    ContadorSituacao = apps.get_model("processo", "ContadorSituacao")
+
+    linhas = Processo.objects.order_by().values("situacao_id").annotate(total=Count("id"))
+    ContadorSituacao.objects.bulk_create(
+        [
+            ContadorSituacao(situacao_id=linha["situacao_id"], total=linha["total"])
+            for linha in linhas
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("processo", "0006_processoancestral"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ContadorSituacao",
+            fields=[
+                (
+                    "situacao",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="contador",
+                        serialize=False,
+                        to="processo.situacao",
+                    ),
+                ),
+                ("total", models.IntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Contador por Situação",
+                "verbose_name_plural": "Contadores por Situação",
+            },
+        ),
+        migrations.RunPython(popular_contadores, migrations.RunPython.noop),
+    ]
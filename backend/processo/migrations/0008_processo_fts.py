@@ -0,0 +1,40 @@
+# Migração escrita à mão: a tabela virtual FTS5 não é um modelo do Django.
+
+from django.db import OperationalError, migrations
+
+CAMPOS = "numero, assunto, numero_processo_externo, numero_sei, descricao"
+
+
+def criar_indice_busca(apps, schema_editor):
+    """Cria e popula a tabela FTS5 de busca (somente SQLite com FTS5)."""
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    origem = ", ".join(f"COALESCE({campo}, '')" for campo in CAMPOS.split(", "))
+    try:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS processo_processo_fts USING fts5("
+            f"{CAMPOS}, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    except OperationalError:
+        # SQLite sem FTS5: a busca continua usando LIKE.
+        return
+    schema_editor.execute(
+        f"INSERT INTO processo_processo_fts (rowid, {CAMPOS}) "
+        f"SELECT id, {origem} FROM processo_processo"
+    )
+
+
+def remover_indice_busca(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS processo_processo_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("processo", "0007_contadorsituacao"),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice_busca, remover_indice_busca),
+    ]
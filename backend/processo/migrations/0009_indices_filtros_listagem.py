@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 08:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("processo", "0008_processo_fts"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="processo",
+            index=models.Index(fields=["tipo", "situacao", "-data_cadastro"], name="processo_tipo_sit_cad_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="processo",
+            index=models.Index(fields=["situacao", "-data_cadastro"], name="processo_sit_cad_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="processo",
+            index=models.Index(fields=["prioridade", "-data_cadastro"], name="processo_prior_cad_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="processo",
+            index=models.Index(fields=["ano_solicitacao", "tipo"], name="processo_ano_tipo_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="resposta",
+            index=models.Index(fields=["prazo_inicial", "processo"], name="resposta_prazo_idx"),
+        ),
+    ]
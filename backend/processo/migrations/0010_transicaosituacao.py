@@ -0,0 +1,71 @@
+# Generated by Django 5.2 on 2026-10-18 08:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def popular_transicoes(apps, schema_editor):
+    """
+    Reproduz a regra que era fixa no serializer: toda situação que não é de
+    encerramento ('finalizado'/'concluído' no nome) pode ir para 'Finalizado'
+    ou 'Suspenso'.
+    """
+    Situacao = apps.get_model("processo", "Situacao")
+    TransicaoSituacao = apps.get_model("processo", "TransicaoSituacao")
+
+    destinos = list(Situacao.objects.filter(nome__in=["Finalizado", "Suspenso"]))
+    TransicaoSituacao.objects.bulk_create(
+        [
+            TransicaoSituacao(origem=origem, destino=destino)
+            for origem in Situacao.objects.all()
+            if "finalizado" not in origem.nome.lower()
+            and "concluído" not in origem.nome.lower()
+            for destino in destinos
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("processo", "0009_indices_filtros_listagem"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TransicaoSituacao",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "destino",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="transicoes_de_entrada",
+                        to="processo.situacao",
+                    ),
+                ),
+                (
+                    "origem",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="transicoes",
+                        to="processo.situacao",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Transição de Situação",
+                "verbose_name_plural": "Transições de Situação",
+                "unique_together": {("origem", "destino")},
+            },
+        ),
+        migrations.RunPython(popular_transicoes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 09:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("processo", "0010_transicaosituacao"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="historicoprocesso",
+            index=models.Index(fields=["processo", "-data"], name="historico_processo_data_idx"),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2 on 2026-10-18 09:03
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("processo", "0011_historico_processo_data_idx"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AlteracaoCampo",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("campo", models.CharField(max_length=100)),
+                ("id_anterior", models.BigIntegerField(blank=True, null=True)),
+                ("id_novo", models.BigIntegerField(blank=True, null=True)),
+                (
+                    "rotulo_anterior",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                (
+                    "rotulo_novo",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("data", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "alterado_por",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "historico",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="campos",
+                        to="processo.historicoprocesso",
+                    ),
+                ),
+                (
+                    "processo",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="alteracoes_campos",
+                        to="processo.processo",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Alteração de Campo",
+                "verbose_name_plural": "Alterações de Campos",
+                "indexes": [
+                    models.Index(
+                        fields=["campo", "-data"], name="alteracao_campo_data_idx"
+                    ),
+                    models.Index(
+                        fields=["alterado_por", "-data"],
+                        name="alteracao_usuario_data_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2 on 2026-10-18 09:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("processo", "0012_alteracaocampo"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResumoHistoricoArquivado",
+            fields=[
+                (
+                    "processo",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="resumo_arquivo",
+                        serialize=False,
+                        to="processo.processo",
+                    ),
+                ),
+                ("quantidade", models.IntegerField(default=0)),
+                ("primeira_data", models.DateTimeField(blank=True, null=True)),
+                ("ultima_data", models.DateTimeField(blank=True, null=True)),
+                ("alteracoes_por_campo", models.JSONField(default=dict)),
+                ("atualizado_em", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Resumo do Histórico Arquivado",
+                "verbose_name_plural": "Resumos dos Históricos Arquivados",
+            },
+        ),
+        migrations.CreateModel(
+            name="HistoricoProcessoArquivado",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("data", models.DateTimeField()),
+                (
+                    "tipo_alteracao",
+                    models.CharField(
+                        choices=[
+                            ("CRIACAO", "Criação"),
+                            ("ATUALIZACAO", "Atualização"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("alteracoes", models.JSONField(default=dict)),
+                ("observacao_geral", models.TextField(blank=True, null=True)),
+                (
+                    "arquivado_em",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "alterado_por",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "processo",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="historicos_arquivados",
+                        to="processo.processo",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Histórico Arquivado",
+                "verbose_name_plural": "Históricos Arquivados",
+                "ordering": ["-data"],
+                "indexes": [
+                    models.Index(
+                        fields=["processo", "-data"], name="historico_arquivo_data_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 09:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("processo", "0013_historicoprocessoarquivado"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="alteracaocampo",
+            name="historico",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="campos",
+                to="processo.historicoprocesso",
+            ),
+        ),
+    ]
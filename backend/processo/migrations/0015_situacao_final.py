@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 09:28
+
+from django.db import migrations, models
+
+
+def marcar_situacoes_finais(apps, schema_editor):
+    """
+    Marca como finais as situações de encerramento pela mesma regra de nome
+    de 0010 ('finalizado'/'concluído'), até aqui usada de forma implícita.
+    """
+    Situacao = apps.get_model("processo", "Situacao")
+    finais = [
+        situacao.pk
+        for situacao in Situacao.objects.all()
+        if "finalizado" in situacao.nome.lower() or "concluído" in situacao.nome.lower()
+    ]
+    Situacao.objects.filter(pk__in=finais).update(final=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("processo", "0014_alteracaocampo_historico_sem_cascata"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="situacao",
+            name="final",
+            field=models.BooleanField(
+                default=False,
+                help_text="Situação de encerramento: não recebe a propagação da situação do pai e libera o histórico para arquivamento (arquivar_historico --finalizados).",
+            ),
+        ),
+        migrations.RunPython(marcar_situacoes_finais, migrations.RunPython.noop),
+    ]
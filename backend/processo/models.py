@@ -96,14 +96,30 @@ class OrgaoDemandante(models.Model):
     def __str__(self):
         return self.nome
 
+def nome_de_situacao_final(nome):
+    """Regra histórica: situações de encerramento têm 'finalizado' ou 'concluído' no nome."""
+    nome = nome.lower()
+    return 'finalizado' in nome or 'concluído' in nome
+
 class Situacao(models.Model):
     nome = models.CharField(max_length=50, unique=True)
+    final = models.BooleanField(
+        default=False,
+        help_text="Situação de encerramento: não recebe a propagação da situação do pai e libera o "
+                  "histórico para arquivamento (arquivar_historico --finalizados).",
+    )
     class Meta:
         verbose_name = 'Situação'
         verbose_name_plural = 'Situações'
     def __str__(self):
         return self.nome
 
+    def save(self, *args, **kwargs):
+        # Situações novas seguem a regra pelo nome, salvo se marcadas como finais explicitamente.
+        if self._state.adding and not self.final:
+            self.final = nome_de_situacao_final(self.nome)
+        super().save(*args, **kwargs)
+
 class HierarquiaProcesso(models.Model):
     tipo_pai = models.ForeignKey(Tipo, on_delete=models.CASCADE, related_name='filhos_permitidos')
     tipo_filho = models.ForeignKey(Tipo, on_delete=models.CASCADE, related_name='pais_permitidos')
@@ -115,9 +131,88 @@ class HierarquiaProcesso(models.Model):
         return f"{self.tipo_pai.nome} -> {self.tipo_filho.nome}"
 
 
+# --- Rastreamento de alterações em memória ---
+
+class CamposRastreadosMixin:
+    """
+    Guarda os valores das colunas no momento em que a instância é carregada
+    do banco (from_db), de modo que as alterações possam ser calculadas em
+    memória, sem reler a linha antes de salvar.
+
+    Ao salvar uma instância carregada do banco sem 'update_fields', apenas as
+    colunas alteradas (e as de auto_now) entram no UPDATE.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._registrar_valores_carregados()
+        return instance
+
+    def _registrar_valores_carregados(self):
+        self._valores_carregados = {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # Colunas relidas voltam a ser o estado "carregado"; as demais mantêm o que tinham.
+        relidas = {self._meta.get_field(campo).attname for campo in fields} if fields else None
+        carregados = getattr(self, '_valores_carregados', {})
+        carregados.update({
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__ and (relidas is None or field.attname in relidas)
+        })
+        self._valores_carregados = carregados
+
+    def valores_carregados(self):
+        """{attname: valor} das colunas como estavam no banco, ou None se a instância não veio do banco."""
+        return getattr(self, '_valores_carregados', None)
+
+    @classmethod
+    def campos_de_controle(cls):
+        """Colunas mantidas pelo próprio Django (auto_now/auto_now_add), fora de qualquer diff."""
+        return [
+            field for field in cls._meta.concrete_fields
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+        ]
+
+    def campos_alterados(self):
+        """
+        Campos (Field) cujo valor atual difere do carregado, sem contar a chave
+        primária e os campos de controle. Colunas que não foram carregadas
+        (adiadas) e depois receberam valor contam como alteradas.
+        """
+        carregados = self.valores_carregados() or {}
+        ignorados = {field.attname for field in self.campos_de_controle()}
+        return [
+            field for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname not in ignorados
+            and field.attname in self.__dict__ and (
+                field.attname not in carregados or carregados[field.attname] != self.__dict__[field.attname]
+            )
+        ]
+
+    def save(self, *args, **kwargs):
+        if (
+            kwargs.get('update_fields') is None and not kwargs.get('force_insert')
+            and not self._state.adding and self.valores_carregados() is not None
+        ):
+            campos = {field.name for field in self.campos_alterados()}
+            campos.update(
+                field.name for field in self._meta.concrete_fields if getattr(field, 'auto_now', False)
+            )
+            kwargs['update_fields'] = sorted(campos)
+        super().save(*args, **kwargs)
+        self._registrar_valores_carregados()
+
+
 # --- Modelo Principal Unificado e Completo ---
 
-class Processo(models.Model):
+class Processo(CamposRastreadosMixin, models.Model):
     # (O restante do modelo Processo continua o mesmo)
     # --- Campos Comuns a TODOS os Tipos ---
     numero = models.CharField("Identificador", max_length=20, unique=True, editable=False)
@@ -162,20 +257,96 @@ class Processo(models.Model):
         verbose_name = 'Processo'
         verbose_name_plural = 'Processos'
         ordering = ['-data_cadastro']
+        indexes = [
+            # Chave da paginação por cursor da listagem (ver processo/pagination.py).
+            models.Index(fields=['-data_cadastro', 'id'], name='processo_cadastro_id_idx'),
+            # Combinações de filtros da listagem (ver processo/filters.py), já na ordem padrão.
+            models.Index(fields=['tipo', 'situacao', '-data_cadastro'], name='processo_tipo_sit_cad_idx'),
+            models.Index(fields=['situacao', '-data_cadastro'], name='processo_sit_cad_idx'),
+            models.Index(fields=['prioridade', '-data_cadastro'], name='processo_prior_cad_idx'),
+            models.Index(fields=['ano_solicitacao', 'tipo'], name='processo_ano_tipo_idx'),
+        ]
+
+    @staticmethod
+    def gerar_numero():
+        """Identificador aleatório de 10 dígitos (a unicidade é garantida pelo banco)."""
+        unique_id = uuid.uuid4().hex
+        hash_hex = hashlib.sha256(unique_id.encode()).hexdigest()
+        return str(int(hash_hex, 16) % 10**10).zfill(10)
 
     def save(self, *args, **kwargs):
         if not self.numero:
-            unique_id = uuid.uuid4().hex
-            hash_hex = hashlib.sha256(unique_id.encode()).hexdigest()
-            self.numero = str(int(hash_hex, 16) % 10**10).zfill(10)
+            self.numero = self.gerar_numero()
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.tipo.nome}: {self.numero} - {self.assunto}"
 
+class ProcessoAncestral(models.Model):
+    """
+    Tabela de fechamento (closure table) da hierarquia de Processos.
+
+    Guarda uma linha para cada par (ancestral, descendente), inclusive o
+    próprio processo com profundidade 0, de modo que "todos os descendentes
+    de X" ou "Y está abaixo de X" viram um JOIN indexado em vez de uma
+    recursão sobre 'pai'. Mantida pelos sinais em processo/signals.py e
+    reconstruída pelo comando 'reconstruir_hierarquia'.
+    """
+    ancestral = models.ForeignKey(Processo, on_delete=models.CASCADE, related_name='descendentes_rel')
+    descendente = models.ForeignKey(Processo, on_delete=models.CASCADE, related_name='ancestrais_rel')
+    profundidade = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = 'Ancestral do Processo'
+        verbose_name_plural = 'Ancestrais dos Processos'
+        unique_together = ('ancestral', 'descendente')
+        indexes = [
+            models.Index(fields=['descendente', 'profundidade'], name='processo_ancestral_desc_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestral_id} -> {self.descendente_id} ({self.profundidade})"
+
+class ContadorSituacao(models.Model):
+    """
+    Total de processos em cada situação, atualizado incrementalmente pelos
+    sinais de Processo (ver processo/contadores.py). Permite ao dashboard
+    ler as contagens sem varrer a tabela de processos.
+    """
+    situacao = models.OneToOneField(Situacao, on_delete=models.CASCADE, primary_key=True, related_name='contador')
+    total = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Contador por Situação'
+        verbose_name_plural = 'Contadores por Situação'
+
+    def __str__(self):
+        return f"{self.situacao_id}: {self.total}"
+
+class TransicaoSituacao(models.Model):
+    """
+    Transição permitida entre situações: um processo em 'origem' pode passar
+    para 'destino'. Define as 'situacoes_disponiveis' de cada processo e é
+    servida pelo cache em memória (ver processo/cache.py). Situações novas
+    recebem as transições padrão (SITUACOES_DESTINO_PADRAO) em processo/signals.py.
+    """
+    origem = models.ForeignKey(Situacao, on_delete=models.CASCADE, related_name='transicoes')
+    destino = models.ForeignKey(Situacao, on_delete=models.CASCADE, related_name='transicoes_de_entrada')
+
+    class Meta:
+        verbose_name = 'Transição de Situação'
+        verbose_name_plural = 'Transições de Situação'
+        unique_together = ('origem', 'destino')
+
+    def __str__(self):
+        return f"{self.origem} -> {self.destino}"
+
+# Destinos que toda situação não final ganha por padrão (mesma regra da migração 0010).
+SITUACOES_DESTINO_PADRAO = ('Finalizado', 'Suspenso')
+
 # --- Submodelos para Organização ---
 
-class Execucao(models.Model):
+class Execucao(CamposRastreadosMixin, models.Model):
     processo = models.OneToOneField(Processo, on_delete=models.CASCADE, related_name='execucao')
     local_acao = models.CharField("Local da Ação", max_length=200, blank=True, null=True)
     forma_execucao = models.TextField('Forma de Execução', blank=True, null=True)
@@ -185,12 +356,18 @@ class Execucao(models.Model):
     def __str__(self):
         return f"Execução de {self.processo.numero}"
 
-class Resposta(models.Model):
+class Resposta(CamposRastreadosMixin, models.Model):
     processo = models.OneToOneField(Processo, on_delete=models.CASCADE, related_name='resposta')
     prazo_inicial = models.DateField(null=True, blank=True, help_text="Prazo para Demanda, Recomendação, Determinação, Ação")
     documento_resposta = models.CharField("Número do Documento de Resposta", max_length=50, blank=True, null=True, help_text="Usado para Demanda")
     solicitacao_prorrogacao = models.BooleanField("Solicitação de Prorrogação", default=False, help_text="Para Demanda, Recomendação, Determinação")
 
+    class Meta:
+        indexes = [
+            # Filtro por faixa de prazo na listagem de processos.
+            models.Index(fields=['prazo_inicial', 'processo'], name='resposta_prazo_idx'),
+        ]
+
     def __str__(self):
         return f"Resposta de {self.processo.numero}"
 
@@ -233,6 +410,11 @@ class HistoricoProcesso(models.Model):
         verbose_name = 'Histórico do Processo'
         verbose_name_plural = 'Históricos dos Processos'
         ordering = ['-data']
+        indexes = [
+            # Histórico paginado de um processo (/api/processos/{numero}/historico/)
+            # e o resumo 'ultima_alteracao' da listagem.
+            models.Index(fields=['processo', '-data'], name='historico_processo_data_idx'),
+        ]
 
     def __str__(self):
         return f"Alteração em {self.processo.numero} em {self.data.strftime('%d/%m/%Y %H:%M')}"
@@ -243,4 +425,98 @@ class HistoricoProcesso(models.Model):
         from django.utils.html import format_html
         formatted_json = json.dumps(self.alteracoes, indent=4, ensure_ascii=False)
         return format_html("<pre>{}</pre>", formatted_json)
-    display_alteracoes.short_description = "Detalhes da Alteração"
\ No newline at end of file
+    display_alteracoes.short_description = "Detalhes da Alteração"
+
+class AlteracaoCampo(models.Model):
+    """
+    Uma linha por campo alterado em um HistoricoProcesso (o mesmo conteúdo de
+    'alteracoes', normalizado). Permite consultas de auditoria entre processos
+    ("quem passou a situação para Finalizado", "o que o usuário X alterou
+    hoje") por índice, sem varrer e interpretar o JSON.
+
+    Para FKs e ManyToMany, 'id_anterior'/'id_novo' guardam as chaves; os
+    rótulos são o texto exibido no histórico. Nos ManyToMany há uma linha por
+    item adicionado (só 'novo') ou removido (só 'anterior').
+
+    As linhas sobrevivem ao arquivamento do registro de origem: 'historico'
+    guarda o id original, que passa a ser o de um HistoricoProcessoArquivado
+    (por isso a FK não tem restrição no banco nem cascata).
+    """
+    historico = models.ForeignKey(
+        HistoricoProcesso, on_delete=models.DO_NOTHING, db_constraint=False, related_name='campos'
+    )
+    processo = models.ForeignKey(Processo, on_delete=models.CASCADE, related_name='alteracoes_campos')
+    campo = models.CharField(max_length=100)
+    id_anterior = models.BigIntegerField(null=True, blank=True)
+    id_novo = models.BigIntegerField(null=True, blank=True)
+    rotulo_anterior = models.CharField(max_length=255, null=True, blank=True)
+    rotulo_novo = models.CharField(max_length=255, null=True, blank=True)
+    alterado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    data = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Alteração de Campo'
+        verbose_name_plural = 'Alterações de Campos'
+        indexes = [
+            models.Index(fields=['campo', '-data'], name='alteracao_campo_data_idx'),
+            models.Index(fields=['alterado_por', '-data'], name='alteracao_usuario_data_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.campo}: {self.rotulo_anterior} -> {self.rotulo_novo}"
+
+
+class HistoricoProcessoArquivado(models.Model):
+    """
+    Registros de HistoricoProcesso retirados da tabela principal pela
+    retenção (ver processo/retencao.py e o comando arquivar_historico).
+    Guardam o mesmo conteúdo e o id original, para que a paginação e a
+    reconstrução de versões continuem funcionando sobre o arquivo. As
+    linhas de AlteracaoCampo desses registros continuam onde estavam.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    processo = models.ForeignKey(Processo, on_delete=models.CASCADE, related_name='historicos_arquivados')
+    data = models.DateTimeField()
+    alterado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    tipo_alteracao = models.CharField(max_length=20, choices=HistoricoProcesso.TIPO_ALTERACAO_CHOICES)
+    alteracoes = models.JSONField(default=dict)
+    observacao_geral = models.TextField(blank=True, null=True)
+    arquivado_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Histórico Arquivado'
+        verbose_name_plural = 'Históricos Arquivados'
+        ordering = ['-data']
+        indexes = [
+            models.Index(fields=['processo', '-data'], name='historico_arquivo_data_idx'),
+        ]
+
+    def __str__(self):
+        return f"Alteração arquivada em {self.processo_id} em {self.data.strftime('%d/%m/%Y %H:%M')}"
+
+    display_alteracoes = HistoricoProcesso.display_alteracoes
+
+
+class ResumoHistoricoArquivado(models.Model):
+    """
+    Resumo, por processo, do que foi arquivado: quantos registros, o período
+    coberto e quantas vezes cada campo foi alterado. Atualizado a cada lote
+    arquivado, para que a visão geral não precise ler o arquivo.
+    """
+    processo = models.OneToOneField(Processo, on_delete=models.CASCADE, primary_key=True, related_name='resumo_arquivo')
+    quantidade = models.IntegerField(default=0)
+    primeira_data = models.DateTimeField(null=True, blank=True)
+    ultima_data = models.DateTimeField(null=True, blank=True)
+    alteracoes_por_campo = models.JSONField(default=dict)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Resumo do Histórico Arquivado'
+        verbose_name_plural = 'Resumos dos Históricos Arquivados'
+
+    def __str__(self):
+        return f"{self.processo_id}: {self.quantidade} registros arquivados"
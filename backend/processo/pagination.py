@@ -0,0 +1,195 @@
+# processo/pagination.py
+
+import base64
+import json
+from datetime import date, datetime
+
+from django.db.models import F, Q
+from rest_framework import filters, pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Paginação por cursor (keyset) sobre uma chave composta.
+
+    Em vez de OFFSET + COUNT(*), cada página filtra a partir dos valores da
+    chave do último item visto ("data_cadastro < x OR (data_cadastro = x AND id > y)"),
+    de modo que a página 500 custa o mesmo que a página 1.
+
+    Se a view tiver um OrderingFilter e o cliente enviar ?ordering=, os campos
+    pedidos passam à frente e a ordenação padrão é usada como desempate.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    ordering = ('-data_cadastro', 'id')
+    # Se False, ignora o OrderingFilter da view (ex.: ações sobre outro modelo).
+    usa_ordering_filter = True
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.chaves = self.get_ordering(request, queryset, view)
+
+        valores, reverso = self.decode_cursor(request)
+        self.tem_cursor = valores is not None
+
+        # Os valores da chave são lidos de anotações para não depender de
+        # relações carregadas (ex.: 'prioridade__nome').
+        queryset = queryset.annotate(**{
+            self._apelido(i): F(campo) for i, (campo, _) in enumerate(self.chaves)
+        })
+        if valores is not None:
+            queryset = queryset.filter(self._filtro_apos(valores, reverso))
+        queryset = queryset.order_by(*self._order_by(reverso))
+
+        resultados = list(queryset[:self.page_size + 1])
+        mais_itens = len(resultados) > self.page_size
+        resultados = resultados[:self.page_size]
+
+        if reverso:
+            resultados.reverse()
+            self.tem_proxima = self.tem_cursor
+            self.tem_anterior = mais_itens
+        else:
+            self.tem_proxima = mais_itens
+            self.tem_anterior = self.tem_cursor
+
+        self.page = resultados
+        return resultados
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Retorna a lista de (campo, descendente) que compõe a chave do cursor.
+        """
+        ordenacao = []
+        backends = getattr(view, 'filter_backends', [])
+        if self.usa_ordering_filter and any(issubclass(backend, filters.OrderingFilter) for backend in backends):
+            ordenacao = filters.OrderingFilter().get_ordering(request, queryset, view) or []
+
+        chaves = []
+        for termo in list(ordenacao) + list(self.ordering):
+            campo = termo.lstrip('-')
+            if campo not in [c for c, _ in chaves]:
+                chaves.append((campo, termo.startswith('-')))
+        return chaves
+
+    def get_next_link(self):
+        if not self.tem_proxima or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverso=False)
+
+    def get_previous_link(self):
+        if not self.tem_anterior or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverso=True)
+
+    def encode_cursor(self, obj, reverso):
+        valores = [self._serializar(getattr(obj, self._apelido(i))) for i in range(len(self.chaves))]
+        dados = {'o': [('-' if desc else '') + campo for campo, desc in self.chaves], 'v': valores}
+        if reverso:
+            dados['r'] = 1
+        token = base64.urlsafe_b64encode(json.dumps(dados).encode()).decode()
+        url = remove_query_param(self.base_url, 'page')
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            dados = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+            ordem = [('-' if desc else '') + campo for campo, desc in self.chaves]
+            valores = dados['v']
+            if dados['o'] != ordem or len(valores) != len(self.chaves):
+                raise ValueError
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return valores, bool(dados.get('r'))
+
+    # --- Auxiliares ---
+
+    def _apelido(self, indice):
+        return f'_cursor_{indice}'
+
+    def _order_by(self, reverso):
+        termos = []
+        for campo, desc in self.chaves:
+            termos.append(F(campo).desc() if desc != reverso else F(campo).asc())
+        return termos
+
+    def _filtro_apos(self, valores, reverso):
+        """
+        Monta o predicado "depois do cursor" na forma
+        k1 <= v1 AND (k1 < v1 OR (k1 = v1 AND ...)),
+        cujo primeiro termo permite ao banco usar o índice como intervalo.
+        """
+        def operador(desc, estrito):
+            menor = desc != reverso
+            return ('lt' if menor else 'gt') + ('' if estrito else 'e')
+
+        filtro = None
+        for (campo, desc), valor in reversed(list(zip(self.chaves, valores))):
+            estrito = Q(**{f'{campo}__{operador(desc, True)}': valor})
+            filtro = estrito if filtro is None else estrito | (Q(**{campo: valor}) & filtro)
+
+        campo, desc = self.chaves[0]
+        return Q(**{f'{campo}__{operador(desc, False)}': valores[0]}) & filtro
+
+    def _serializar(self, valor):
+        if isinstance(valor, (datetime, date)):
+            return valor.isoformat()
+        return valor
+
+
+class HistoricoPagination(KeysetPagination):
+    """Cursor sobre registros de histórico (campo 'data'), do mais recente ao mais antigo."""
+    page_size = 20
+    ordering = ('-data', 'id')
+    usa_ordering_filter = False
+
+
+class ProcessoPagination(pagination.PageNumberPagination):
+    """
+    Paginação por número de página (padrão) com um modo cursor opcional,
+    ativado por ?paginacao=cursor ou pela presença de ?cursor=.
+    """
+    keyset_class = KeysetPagination
+    mode_query_param = 'paginacao'
+
+    def usa_cursor(self, request):
+        return (request.query_params.get(self.mode_query_param) == 'cursor'
+                or self.keyset_class.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.keyset_class() if self.usa_cursor(request) else None
+        if self.keyset is not None:
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,100 @@
+# processo/retencao.py
+
+"""
+Retenção do histórico dos Processos.
+
+HistoricoProcesso só cresce. Os registros antigos (mais velhos que
+PROCESSO_HISTORICO_RETENCAO_DIAS) ou de processos em situação final
+(Situacao.final) são movidos, em lotes, para
+HistoricoProcessoArquivado; o ResumoHistoricoArquivado de cada processo é
+atualizado no mesmo lote. O registro mais recente de cada processo fica
+sempre na tabela principal, pois é dele que sai o resumo 'ultima_alteracao'.
+As linhas de AlteracaoCampo não são movidas: a consulta de auditoria
+(/api/historico/) continua vendo as alterações arquivadas.
+"""
+
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .cache import situacoes_finais
+from .models import (
+    HistoricoProcesso, HistoricoProcessoArquivado, ResumoHistoricoArquivado,
+)
+
+
+def dias_retencao():
+    return getattr(settings, 'PROCESSO_HISTORICO_RETENCAO_DIAS', 365)
+
+
+def historicos_para_arquivar(dias=None, finalizados=False):
+    """
+    Registros elegíveis: mais antigos que 'dias' e/ou de processos em
+    situação final, exceto o último de cada processo.
+    """
+    criterio = Q()
+    if dias is not None:
+        criterio |= Q(data__lt=timezone.now() - timedelta(days=dias))
+    if finalizados:
+        criterio |= Q(processo__situacao_id__in=situacoes_finais())
+    if not criterio:
+        return HistoricoProcesso.objects.none()
+
+    mais_recente = HistoricoProcesso.objects.filter(processo=OuterRef('processo'), data__gt=OuterRef('data'))
+    return HistoricoProcesso.objects.filter(criterio).filter(Exists(mais_recente)).order_by('id')
+
+
+def arquivar_lote(historicos):
+    """
+    Move 'historicos' (instâncias de HistoricoProcesso) para o arquivo e
+    atualiza os resumos dos processos envolvidos, em uma transação.
+    """
+    if not historicos:
+        return
+    por_processo = {}
+    for historico in historicos:
+        por_processo.setdefault(historico.processo_id, []).append(historico)
+
+    agora = timezone.now()
+    with transaction.atomic():
+        HistoricoProcessoArquivado.objects.bulk_create([
+            HistoricoProcessoArquivado(
+                id=historico.id,
+                processo_id=historico.processo_id,
+                data=historico.data,
+                alterado_por_id=historico.alterado_por_id,
+                tipo_alteracao=historico.tipo_alteracao,
+                alteracoes=historico.alteracoes,
+                observacao_geral=historico.observacao_geral,
+                arquivado_em=agora,
+            )
+            for historico in historicos
+        ])
+
+        resumos = ResumoHistoricoArquivado.objects.select_for_update().in_bulk(list(por_processo))
+        novos, alterados = [], []
+        for processo_id, itens in por_processo.items():
+            resumo = resumos.get(processo_id)
+            if resumo is None:
+                resumo = ResumoHistoricoArquivado(processo_id=processo_id)
+                novos.append(resumo)
+            else:
+                alterados.append(resumo)
+            datas = [item.data for item in itens] + [d for d in (resumo.primeira_data, resumo.ultima_data) if d]
+            campos = Counter(resumo.alteracoes_por_campo)
+            campos.update(campo for item in itens for campo in item.alteracoes)
+            resumo.quantidade += len(itens)
+            resumo.primeira_data, resumo.ultima_data = min(datas), max(datas)
+            resumo.alteracoes_por_campo = dict(campos)
+            resumo.atualizado_em = agora
+        ResumoHistoricoArquivado.objects.bulk_create(novos)
+        ResumoHistoricoArquivado.objects.bulk_update(
+            alterados, ['quantidade', 'primeira_data', 'ultima_data', 'alteracoes_por_campo', 'atualizado_em']
+        )
+
+        # AlteracaoCampo.historico não tem cascata: as linhas normalizadas ficam.
+        HistoricoProcesso.objects.filter(id__in=[historico.id for historico in historicos]).delete()
@@ -1,7 +1,19 @@
+import copy
+import functools
+from contextlib import contextmanager
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+from .atualizacao_lote import CAMPOS_ATUALIZACAO_LOTE
+from .cache import em_cache, situacoes_destino, tabela
+from .filters import ProcessoFilter, parametros_do_filtro
+from .hierarquia import eh_descendente
+from . import historico
 from .models import (
-    Processo, Execucao, Resposta, HistoricoProcesso,
-    Tipo, Prioridade, OrgaoDemandante, Situacao, Categoria, Atribuicao,
+    Processo, Execucao, Resposta, HistoricoProcesso, AlteracaoCampo,
+    HistoricoProcessoArquivado, ResumoHistoricoArquivado, Tipo, Prioridade, OrgaoDemandante, Situacao, Categoria, Atribuicao,
     Unidade, Auditor, GrupoAuditor, TipoDemanda
 )
 
@@ -59,6 +71,182 @@ class GrupoAuditorSerializer(serializers.ModelSerializer):
 class TipoDemandaSerializer(serializers.ModelSerializer):
     class Meta: model = TipoDemanda; fields = '__all__'
 
+def precarregados(field, model):
+    """
+    Objetos {pk: obj} de 'model' já carregados por quem usa o serializer
+    (contexto 'precarregados'), como a importação em lote, que lê de uma vez
+    as chaves de todas as linhas antes de validá-las.
+    """
+    return field.context.get('precarregados', {}).get(model, {})
+
+
+class DominioPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField que resolve as tabelas de domínio (Tipo, Situação,
+    Unidade, ...) pelo cache em memória (processo/cache.py), consultando o
+    banco apenas quando a chave não está no cache.
+    """
+    def to_internal_value(self, data):
+        queryset = self.get_queryset()
+        carregados = precarregados(self, queryset.model)
+        if carregados and not queryset.query.where and not isinstance(data, bool):
+            try:
+                return carregados[queryset.model._meta.pk.to_python(data)]
+            except (KeyError, TypeError, ValueError, DjangoValidationError):
+                pass
+        if not em_cache(queryset.model) or queryset.query.where:
+            # Querysets restritos (limit_choices_to, filtros) seguem pelo banco.
+            return super().to_internal_value(data)
+
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            pk = queryset.model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        cache = tabela(queryset.model)
+        obj = cache.get(pk)
+        if obj is None:
+            obj = queryset.filter(pk=pk).first()
+            if obj is None:
+                self.fail('does_not_exist', pk_value=data)
+            # Registro criado depois da última carga: recarrega na próxima leitura.
+            cache.expirar()
+        # Cópia, para que a instância compartilhada do cache nunca seja alterada.
+        return copy.copy(obj)
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        # Listas de chaves (M2M) são resolvidas em lote pelo campo abaixo.
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for chave in kwargs:
+            if chave in MANY_RELATION_KWARGS:
+                list_kwargs[chave] = kwargs[chave]
+        return DominioManyRelatedField(**list_kwargs)
+
+
+class DominioManyRelatedField(serializers.ManyRelatedField):
+    """
+    Lista de chaves primárias resolvida de uma vez: uma única query 'pk__in'
+    (ou nenhuma, para tabelas em cache), informando todas as chaves
+    inexistentes em um só erro em vez de parar na primeira.
+    """
+    default_error_messages = {
+        'does_not_exist': 'Pks inválidos {pk_values} - objetos não existem.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        queryset = child.get_queryset()
+        model = queryset.model
+
+        pks = []
+        for item in data:
+            if child.pk_field is not None:
+                item = child.pk_field.to_internal_value(item)
+            try:
+                if isinstance(item, bool):
+                    raise TypeError
+                pk = model._meta.pk.to_python(item)
+            except (TypeError, ValueError, DjangoValidationError):
+                child.fail('incorrect_type', data_type=type(item).__name__)
+            if pk not in pks:
+                pks.append(pk)
+
+        encontrados = {}
+        if not queryset.query.where:
+            carregados = precarregados(self, model)
+            encontrados.update({pk: carregados[pk] for pk in pks if pk in carregados})
+        usa_cache = em_cache(model) and not queryset.query.where
+        if usa_cache:
+            cache = tabela(model)
+            for pk in pks:
+                obj = cache.get(pk) if pk not in encontrados else None
+                if obj is not None:
+                    encontrados[pk] = copy.copy(obj)
+        faltando = [pk for pk in pks if pk not in encontrados]
+        if faltando:
+            encontrados.update({obj.pk: obj for obj in queryset.filter(pk__in=faltando)})
+            if usa_cache:
+                # Registros criados depois da última carga: recarrega na próxima leitura.
+                cache.expirar()
+
+        inexistentes = [pk for pk in pks if pk not in encontrados]
+        if inexistentes:
+            self.fail('does_not_exist', pk_values=inexistentes)
+        return [encontrados[pk] for pk in pks]
+
+
+def chaves_removidas(serializer):
+    """
+    Erros {campo: [mensagem]} das chaves validadas por campos Dominio* de
+    'serializer' que não existem mais no banco (uma query por tabela). As
+    tabelas em cache afetadas são invalidadas em todos os workers.
+    """
+    por_campo = {}
+    for nome, field in serializer.fields.items():
+        valor = serializer.validated_data.get(nome)
+        if isinstance(field, DominioPrimaryKeyRelatedField) and valor is not None:
+            por_campo[nome] = (field, field.get_queryset().model, [valor.pk])
+        elif isinstance(field, DominioManyRelatedField) and valor:
+            por_campo[nome] = (field, field.child_relation.get_queryset().model, [obj.pk for obj in valor])
+
+    pks_por_model = {}
+    for _, model, pks in por_campo.values():
+        pks_por_model.setdefault(model, set()).update(pks)
+    existentes = {
+        model: set(model._default_manager.filter(pk__in=pks).values_list('pk', flat=True))
+        for model, pks in pks_por_model.items()
+    }
+
+    erros = {}
+    for nome, (field, model, pks) in por_campo.items():
+        removidas = [pk for pk in pks if pk not in existentes[model]]
+        if not removidas:
+            continue
+        if em_cache(model):
+            tabela(model).invalidar()
+        if isinstance(field, DominioManyRelatedField):
+            erros[nome] = [field.error_messages['does_not_exist'].format(pk_values=removidas)]
+        else:
+            erros[nome] = [field.error_messages['does_not_exist'].format(pk_value=removidas[0])]
+    return erros
+
+
+@contextmanager
+def conferir_chaves_removidas(serializer):
+    """
+    As chaves de domínio são validadas pelo cache de cada worker, que só vê
+    a exclusão feita em outro worker quando a versão publicada muda ou o
+    TTL expira. Se a gravação falhar por uma delas, a resposta é o mesmo
+    400 da validação (e não um 500). Deve envolver a transação mais externa:
+    as FKs são conferidas no commit.
+    """
+    try:
+        yield
+    except IntegrityError:
+        erros = chaves_removidas(serializer)
+        if not erros:
+            raise
+        raise serializers.ValidationError(erros)
+
+
+def _conferindo_chaves_removidas(metodo):
+    @functools.wraps(metodo)
+    def wrapper(self, *args, **kwargs):
+        with conferir_chaves_removidas(self):
+            return metodo(self, *args, **kwargs)
+    return wrapper
+
+
 # --- Serializers para Submodelos (Dados Aninhados) ---
 
 class ExecucaoSerializer(serializers.ModelSerializer):
@@ -81,6 +269,25 @@ class HistoricoProcessoSerializer(serializers.ModelSerializer):
         model = HistoricoProcesso
         fields = ['data', 'alterado_por', 'tipo_alteracao', 'alteracoes', 'observacao_geral']
 
+class HistoricoProcessoArquivadoSerializer(HistoricoProcessoSerializer):
+    class Meta(HistoricoProcessoSerializer.Meta):
+        model = HistoricoProcessoArquivado
+
+class ResumoHistoricoArquivadoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ResumoHistoricoArquivado
+        fields = ['quantidade', 'primeira_data', 'ultima_data', 'alteracoes_por_campo']
+
+class AlteracaoCampoSerializer(serializers.ModelSerializer):
+    processo = serializers.SlugRelatedField(slug_field='numero', read_only=True)
+    alterado_por = serializers.StringRelatedField()
+    class Meta:
+        model = AlteracaoCampo
+        fields = [
+            'id', 'historico', 'processo', 'campo', 'id_anterior', 'id_novo',
+            'rotulo_anterior', 'rotulo_novo', 'alterado_por', 'data',
+        ]
+
 class ProcessoPaiSerializer(serializers.ModelSerializer):
     class Meta:
         model = Processo
@@ -88,7 +295,20 @@ class ProcessoPaiSerializer(serializers.ModelSerializer):
 
 # --- Serializers para o Modelo Principal: Processo ---
 
-class ProcessoListSerializer(serializers.ModelSerializer):
+class CamposDinamicosMixin:
+    """
+    Permite restringir os campos serializados através da chave 'campos' do
+    contexto (preenchida pela view a partir de ?fields= / ?omit=).
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        campos = self.context.get('campos')
+        if campos is not None:
+            for nome in set(self.fields) - set(campos):
+                self.fields.pop(nome)
+
+
+class ProcessoListSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """
     Serializer para LEITURA (GET). Mostra os dados de forma aninhada e legível.
     """
@@ -109,9 +329,12 @@ class ProcessoListSerializer(serializers.ModelSerializer):
     unidades_auditadas = UnidadeSerializer(many=True, read_only=True)
     auditores_responsaveis = AuditorSerializer(many=True, read_only=True)
     filhos = serializers.SerializerMethodField()
+    # Anotado pela view (subquery de contagem); permite expandir a árvore sob demanda.
+    num_filhos = serializers.IntegerField(read_only=True)
     execucao = ExecucaoSerializer(read_only=True)
     resposta = RespostaSerializer(read_only=True)
-    historicos = HistoricoProcessoSerializer(many=True, read_only=True)
+    # Só o resumo da última alteração; o histórico completo fica em /historico/.
+    ultima_alteracao = serializers.SerializerMethodField()
     situacoes_disponiveis = serializers.SerializerMethodField()
 
     class Meta:
@@ -129,13 +352,86 @@ class ProcessoListSerializer(serializers.ModelSerializer):
             # --- FIM DA ALTERAÇÃO ---
         return []
 
+    def get_ultima_alteracao(self, obj):
+        # Anotado pela view (subqueries sobre o índice de histórico por processo).
+        data = getattr(obj, 'ultima_alteracao_data', None)
+        if data is None:
+            return None
+        return {
+            'data': serializers.DateTimeField().to_representation(data),
+            'tipo_alteracao': obj.ultima_alteracao_tipo,
+            'alterado_por': obj.ultima_alteracao_por,
+        }
+
     def get_situacoes_disponiveis(self, obj):
-        # ... (sem alteração aqui)
-        situacao_atual = obj.situacao.nome.lower()
-        if 'finalizado' not in situacao_atual and 'concluído' not in situacao_atual:
-            queryset = Situacao.objects.filter(nome__in=['Finalizado', 'Suspenso'])
-            return SituacaoSerializer(queryset, many=True).data
-        return []
+        # Transições configuradas em TransicaoSituacao, lidas do cache em memória
+        # (nenhuma query por linha da listagem).
+        return SituacaoSerializer(situacoes_destino(obj.situacao_id), many=True).data
+
+
+CAMPOS_M2M_PROCESSO = ('unidades_auditadas', 'auditores_responsaveis')
+
+
+def sincronizar_m2m(processo, campo, objetos, criado=False):
+    """
+    Substitui o conteúdo do ManyToMany 'campo' por 'objetos' gravando
+    diretamente na tabela intermediária: um DELETE e um INSERT em lote, em vez
+    do .set() (que dispara m2m_changed por operação), e um único registro de
+    histórico para o campo. Com 'criado', o processo acabou de ser inserido e
+    não há itens atuais a consultar.
+    """
+    relacao = Processo._meta.get_field(campo)
+    through = relacao.remote_field.through
+    coluna_processo = relacao.m2m_field_name() + '_id'
+    coluna_item = relacao.m2m_reverse_field_name() + '_id'
+
+    atuais = {} if criado else {obj.pk: obj for obj in getattr(processo, campo).all()}
+    novos = {obj.pk: obj for obj in objetos}
+    removidos = [obj for pk, obj in atuais.items() if pk not in novos]
+    adicionados = [obj for pk, obj in novos.items() if pk not in atuais]
+
+    if removidos:
+        through.objects.filter(**{
+            coluna_processo: processo.pk,
+            f'{coluna_item}__in': [obj.pk for obj in removidos],
+        }).delete()
+    if adicionados:
+        through.objects.bulk_create([
+            through(**{coluna_processo: processo.pk, coluna_item: obj.pk})
+            for obj in adicionados
+        ])
+    if removidos or adicionados:
+        # Descarta o prefetch da instância, que não reflete mais o banco.
+        getattr(processo, '_prefetched_objects_cache', {}).pop(relacao.name, None)
+        historico.registrar_historico_m2m(processo, campo, adicionados=adicionados, removidos=removidos)
+
+
+def salvar_submodelo(processo, model, relacao, dados):
+    """
+    Aplica 'dados' ao submodelo (Execucao/Resposta) do processo, gravando só
+    se algo mudou. Um submodelo inexistente não é criado quando os dados
+    enviados são apenas os valores padrão dos campos.
+    """
+    if not dados:
+        return
+    try:
+        submodelo = getattr(processo, relacao)
+    except model.DoesNotExist:
+        submodelo = None
+
+    if submodelo is None:
+        if all(model._meta.get_field(attr).get_default() == value for attr, value in dados.items()):
+            return
+        submodelo = model(processo=processo)
+        for attr, value in dados.items():
+            setattr(submodelo, attr, value)
+        submodelo.save()
+        return
+
+    for attr, value in dados.items():
+        setattr(submodelo, attr, value)
+    if submodelo.campos_alterados():
+        submodelo.save()
 
 
 class ProcessoCreateUpdateSerializer(serializers.ModelSerializer):
@@ -145,6 +441,9 @@ class ProcessoCreateUpdateSerializer(serializers.ModelSerializer):
     execucao = ExecucaoSerializer(required=False, allow_null=True)
     resposta = RespostaSerializer(required=False, allow_null=True)
 
+    # FKs para tabelas de domínio são validadas pelo cache em memória.
+    serializer_related_field = DominioPrimaryKeyRelatedField
+
     class Meta:
         model = Processo
         # [CORRIGIDO] Removi o campo 'id' da lista, pois ele não deve ser escrito diretamente.
@@ -156,6 +455,21 @@ class ProcessoCreateUpdateSerializer(serializers.ModelSerializer):
             'data_documento_sei', 'identificacao_achados', 'execucao', 'resposta'
         ]
 
+    def validate_pai(self, value):
+        # Consulta a tabela de fechamento: impede ciclos na hierarquia.
+        if (
+            value is not None and self.instance is not None and value.pk != self.instance.pai_id
+            and eh_descendente(value.pk, self.instance.pk)
+        ):
+            raise serializers.ValidationError(
+                'Um processo não pode ser subordinado a si mesmo nem a um de seus descendentes.'
+            )
+        return value
+
+    # create/update rodam em uma operacao() do histórico: toda a operação
+    # (campos, ManyToMany e submodelos) vira um único registro no commit.
+    @_conferindo_chaves_removidas
+    @historico.operacao()
     def create(self, validated_data):
         # 1. Separar dados aninhados e ManyToMany.
         execucao_data = validated_data.pop('execucao', None)
@@ -166,9 +480,9 @@ class ProcessoCreateUpdateSerializer(serializers.ModelSerializer):
         # 2. Criar o objeto Processo principal.
         processo = Processo.objects.create(**validated_data)
 
-        # 3. Lidar com relacionamentos ManyToMany.
-        processo.unidades_auditadas.set(unidades_data)
-        processo.auditores_responsaveis.set(auditores_data)
+        # 3. Lidar com relacionamentos ManyToMany (em lote, um histórico por campo).
+        sincronizar_m2m(processo, 'unidades_auditadas', unidades_data, criado=True)
+        sincronizar_m2m(processo, 'auditores_responsaveis', auditores_data, criado=True)
 
         # 4. Criar submodelos, ligando-os ao processo recém-criado.
         if execucao_data:
@@ -178,37 +492,72 @@ class ProcessoCreateUpdateSerializer(serializers.ModelSerializer):
 
         return processo
 
+    @_conferindo_chaves_removidas
+    @historico.operacao()
     def update(self, instance, validated_data):
-        # Lógica de atualização para submodelos.
         execucao_data = validated_data.pop('execucao', None)
         resposta_data = validated_data.pop('resposta', None)
+        # ManyToMany fora do 'update' padrão (que usaria .set() item a item).
+        m2m_data = {
+            campo: validated_data.pop(campo)
+            for campo in CAMPOS_M2M_PROCESSO if campo in validated_data
+        }
+
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # Nada mudou (ex.: "salvar" repetido na tela): sem UPDATE e sem histórico.
+        if instance.campos_alterados():
+            instance.save()
 
-        if resposta_data:
-            resposta_instance, _ = Resposta.objects.get_or_create(processo=instance)
-            for attr, value in resposta_data.items():
-                setattr(resposta_instance, attr, value)
-            resposta_instance.save()
-
-        if execucao_data:
-            execucao_instance, _ = Execucao.objects.get_or_create(processo=instance)
-            for attr, value in execucao_data.items():
-                setattr(execucao_instance, attr, value)
-            execucao_instance.save()
-        
-        # Chama o método 'update' pai para salvar os campos do Processo.
-        return super().update(instance, validated_data)
-
-
-class ProcessoArvoreSerializer(serializers.ModelSerializer):
-    filhos = serializers.SerializerMethodField()
-    tipo = serializers.StringRelatedField()
-
-    class Meta:
-        model = Processo
-        fields = ['id', 'numero', 'assunto', 'tipo', 'pai', 'filhos']
+        # Lógica de atualização para submodelos.
+        salvar_submodelo(instance, Resposta, 'resposta', resposta_data)
+        salvar_submodelo(instance, Execucao, 'execucao', execucao_data)
 
-    def get_filhos(self, obj):
-        return ProcessoArvoreSerializer(obj.filhos.all(), many=True, context=self.context).data
-    
+        for campo, objetos in m2m_data.items():
+            sincronizar_m2m(instance, campo, objetos)
+        return instance
 
 
+class AtualizacaoLoteSerializer(serializers.Serializer):
+    """
+    Entrada de POST /api/processos/bulk-update/: os processos, por 'numeros'
+    ou por 'filtro' (os mesmos parâmetros de ProcessoFilter da listagem), e
+    os novos valores de situação, prioridade e/ou atribuição.
+    """
+    numeros = serializers.ListField(child=serializers.CharField(), required=False, allow_empty=False)
+    filtro = serializers.DictField(required=False, allow_empty=False)
+    situacao = DominioPrimaryKeyRelatedField(queryset=Situacao.objects.all(), required=False)
+    prioridade = DominioPrimaryKeyRelatedField(queryset=Prioridade.objects.all(), required=False)
+    atribuicao = DominioPrimaryKeyRelatedField(queryset=Atribuicao.objects.all(), required=False, allow_null=True)
+
+    def validate_filtro(self, value):
+        # Uma chave que o formulário do FilterSet não lê (ou um valor vazio) seria
+        # ignorada em silêncio e o lote passaria a valer para todos os processos.
+        desconhecidos = sorted(set(value) - set(parametros_do_filtro(ProcessoFilter)))
+        if desconhecidos:
+            raise serializers.ValidationError(f"Filtros desconhecidos: {', '.join(desconhecidos)}.")
+        # Mesmo formato da query string: listas viram "1,2,3".
+        filtro = {
+            chave: ','.join(str(item) for item in valor) if isinstance(valor, list) else str(valor)
+            for chave, valor in value.items()
+        }
+        vazios = sorted(chave for chave, valor in filtro.items() if not valor.strip())
+        if vazios:
+            raise serializers.ValidationError(f"Filtros sem valor: {', '.join(vazios)}.")
+        return filtro
+
+    def validate(self, attrs):
+        if ('numeros' in attrs) == ('filtro' in attrs):
+            raise serializers.ValidationError("Informe 'numeros' ou 'filtro' (um dos dois).")
+        if not any(campo in attrs for campo in CAMPOS_ATUALIZACAO_LOTE):
+            raise serializers.ValidationError(
+                f"Informe ao menos um destes campos: {', '.join(CAMPOS_ATUALIZACAO_LOTE)}."
+            )
+        return attrs
+
+    def mudancas(self):
+        """{campo: pk ou None} dos campos informados."""
+        return {
+            campo: getattr(self.validated_data[campo], 'pk', None)
+            for campo in CAMPOS_ATUALIZACAO_LOTE if campo in self.validated_data
+        }
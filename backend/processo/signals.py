@@ -1,33 +1,37 @@
 # processo/signals.py
 
+import logging
+
 # Importe o 'pre_save' junto com os outros sinais
-from django.db.models.signals import pre_save, post_save, m2m_changed 
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed 
 from django.dispatch import receiver
-from .models import Processo, HistoricoProcesso
-from .middleware import get_current_user
+from . import busca, contadores, hierarquia, historico
+from .historico import registrar_historico_m2m
+from .cache import MODELOS_DOMINIO, tabela
+from .models import Processo, Execucao, Resposta, Situacao, TransicaoSituacao, SITUACOES_DESTINO_PADRAO
+
+# Eventos DEBUG deste logger são amostrados (filtro 'amostragem_historico' em settings.LOGGING).
+logger = logging.getLogger(__name__)
 
 # --- CORREÇÃO PRINCIPAL: Usar 'pre_save' para capturar os valores antigos ---
 @receiver(pre_save, sender=Processo, dispatch_uid="capture_old_processo_on_save")
 def capture_old_values(sender, instance, **kwargs):
     """
-    Executado ANTES de salvar. Armazena uma cópia dos valores antigos diretamente
-    no objeto da instância para uso posterior no post_save.
+    Executado ANTES de salvar. Armazena os valores antigos ({attname: valor})
+    na instância para uso posterior no post_save. Instâncias carregadas do
+    banco já trazem esses valores (CamposRastreadosMixin); só as demais
+    (ex.: montadas à mão com pk) precisam reler a linha.
     """
-    if instance.pk:
-        try:
-            # LOG: Mostra que estamos tentando capturar o estado antigo
-            print(f"--- [PRE_SAVE] Capturando estado antigo do Processo {instance.numero} ---")
-            
-            old_instance = sender.objects.get(pk=instance.pk)
-            instance._old_values = {
-                field.name: getattr(old_instance, field.name)
-                for field in instance._meta.fields
-            }
-        except sender.DoesNotExist:
-            instance._old_values = {}
+    if instance.pk and not instance._state.adding:
+        carregados = instance.valores_carregados()
+        if carregados is not None:
+            instance._old_values = dict(carregados)
+            return
+
+        logger.debug("pre_save: relendo o estado antigo do Processo %s", instance.numero)
+        attnames = [field.attname for field in instance._meta.concrete_fields]
+        instance._old_values = sender.objects.filter(pk=instance.pk).values(*attnames).first() or {}
     else:
-        # LOG: Indica que é um processo novo
-        print(f"--- [PRE_SAVE] Instância de Processo nova, sem estado antigo para capturar ---")
         instance._old_values = {}
 
 
@@ -36,48 +40,39 @@ def registrar_alteracao_processo(sender, instance, created, **kwargs):
     """
     Executado DEPOIS de salvar. Compara o estado novo com o antigo e cria o histórico.
     """
-    # LOG: Início do processamento pós-salvamento
-    print(f"\n--- [POST_SAVE] Iniciando para Processo {instance.numero}. Criado: {created} ---")
-    
     alteracoes = {}
+    # Chaves das FKs alteradas, para as linhas normalizadas (AlteracaoCampo).
+    ids = {}
     tipo_alteracao = 'CRIACAO' if created else 'ATUALIZACAO'
 
     if created:
-        alteracoes['status'] = 'Processo criado.'
-        # Simplificando o log de criação para ser mais limpo
-        alteracoes['dados_iniciais'] = {
-            field.name: str(getattr(instance, field.name))
-            for field in instance._meta.fields 
-            if field.name not in ['id', 'data_cadastro', 'data_atualizacao'] and getattr(instance, field.name)
-        }
+        alteracoes, ids = historico.alteracoes_criacao(instance)
     else:
         if hasattr(instance, '_old_values') and instance._old_values:
-            # LOG: Mostra os valores antigos e novos que serão comparados
-            print(f"[POST_SAVE] Valores antigos encontrados: {instance._old_values}")
-            
-            for field_name, old_value in instance._old_values.items():
-                new_value = getattr(instance, field_name)
+            # Datas de controle (data_atualizacao muda a cada save) não entram no histórico.
+            controle = {field.attname for field in sender.campos_de_controle()}
+            for field in instance._meta.concrete_fields:
+                if field.attname not in instance._old_values or field.attname in controle:
+                    continue
+                old_value = instance._old_values[field.attname]
+                new_value = getattr(instance, field.attname)
                 if old_value != new_value:
-                    # LOG: Mostra cada alteração detectada
-                    print(f"[POST_SAVE] Mudança detectada no campo '{field_name}': '{old_value}' -> '{new_value}'")
-                    alteracoes[field_name] = {
-                        'anterior': str(old_value) if old_value is not None else 'N/A',
-                        'novo': str(new_value) if new_value is not None else 'N/A'
+                    alteracoes[field.name] = {
+                        'anterior': historico.rotular(field, old_value),
+                        'novo': historico.rotular(field, new_value, instance),
                     }
+                    if field.is_relation:
+                        ids[field.name] = {'anterior': old_value, 'novo': new_value}
         else:
-             print("[POST_SAVE] ATENÇÃO: Nenhum valor antigo (_old_values) foi encontrado na instância.")
+            logger.warning("post_save: Processo %s salvo sem valores antigos (_old_values)", instance.numero)
 
     if alteracoes:
-        # LOG: Mostra que um registro de histórico será criado
-        print(f"[POST_SAVE] Criando registro de Histórico com as seguintes alterações: {alteracoes}")
-        HistoricoProcesso.objects.create(
-            processo=instance,
-            alterado_por=get_current_user(),
-            tipo_alteracao=tipo_alteracao,
-            alteracoes=alteracoes
-        )
-    else:
-        print("[POST_SAVE] Nenhuma alteração detectada para registrar no histórico.")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "post_save: histórico do Processo %s", instance.numero,
+                extra={'processo': instance.numero, 'tipo_alteracao': tipo_alteracao, 'campos': sorted(alteracoes)},
+            )
+        historico.registrar(instance, tipo_alteracao, alteracoes, ids)
 
 
 @receiver(m2m_changed, sender=Processo.unidades_auditadas.through)
@@ -88,10 +83,7 @@ def registrar_alteracao_m2m(sender, instance, action, pk_set, **kwargs):
     """
     if action not in ['post_add', 'post_remove', 'post_clear']:
         return
-    
-    # LOG: Mostra a ação M2M
-    print(f"\n--- [M2M_CHANGED] Ação '{action}' detectada para o Processo {instance.numero} ---")
-    
+
     field_name = sender._meta.db_table.split('_', 1)[1]
     
     related_model = None
@@ -104,21 +96,139 @@ def registrar_alteracao_m2m(sender, instance, action, pk_set, **kwargs):
     else:
         return
 
-    alteracoes = {}
     if action == 'post_add':
-        items = related_model.objects.filter(pk__in=pk_set)
-        alteracoes[field_name] = {'adicionado': [str(item) for item in items]}
+        registrar_historico_m2m(instance, field_name, adicionados=related_model.objects.filter(pk__in=pk_set))
     elif action == 'post_remove':
-        items = related_model.objects.filter(pk__in=pk_set)
-        alteracoes[field_name] = {'removido': [str(item) for item in items]}
+        registrar_historico_m2m(instance, field_name, removidos=related_model.objects.filter(pk__in=pk_set))
     elif action == 'post_clear':
-        alteracoes[field_name] = {'status': 'Todos os itens foram removidos.'}
+        alteracoes = {field_name: {'status': 'Todos os itens foram removidos.'}}
+        logger.debug("m2m_changed: %s do Processo %s esvaziado", field_name, instance.numero)
+        historico.registrar(instance, 'ATUALIZACAO', alteracoes)
 
-    if alteracoes:
-        print(f"[M2M_CHANGED] Criando registro de Histórico com as seguintes alterações: {alteracoes}")
-        HistoricoProcesso.objects.create(
-            processo=instance,
-            alterado_por=get_current_user(),
-            tipo_alteracao='ATUALIZACAO',
-            alteracoes=alteracoes
-        )
\ No newline at end of file
+
+# --- Histórico dos submodelos (Execucao/Resposta) ---
+
+@receiver(pre_save, sender=Execucao, dispatch_uid="historico_execucao")
+@receiver(pre_save, sender=Resposta, dispatch_uid="historico_resposta")
+def registrar_alteracao_submodelo(sender, instance, raw=False, **kwargs):
+    """
+    Registra as mudanças de Execucao/Resposta no histórico do processo, sob a
+    chave do submodelo ('execucao'/'resposta'). Antes do save a instância
+    ainda guarda os valores carregados, então o diff sai da memória.
+    """
+    if raw:
+        return
+    mudancas = historico.mudancas_submodelo(instance)
+    if mudancas:
+        relacao = sender._meta.get_field('processo').remote_field.related_name
+        historico.registrar(instance.processo, 'ATUALIZACAO', {relacao: mudancas})
+
+
+@receiver(pre_delete, sender=Processo, dispatch_uid="descartar_historico_processo")
+def descartar_historico(sender, instance, **kwargs):
+    """Alterações ainda não gravadas de um processo excluído são descartadas."""
+    historico.descartar(instance.pk)
+
+
+# --- Manutenção da tabela de fechamento da hierarquia (ProcessoAncestral) ---
+
+@receiver(post_save, sender=Processo, dispatch_uid="manter_hierarquia_processo")
+def manter_hierarquia(sender, instance, created, raw=False, **kwargs):
+    """
+    Mantém a tabela de fechamento em dia quando um processo é criado ou
+    quando o seu 'pai' muda (o que move a subárvore inteira).
+    """
+    if raw:
+        return
+    if created:
+        hierarquia.inserir_no(instance.pk, instance.pai_id)
+        return
+
+    old_values = getattr(instance, '_old_values', None)
+    if old_values and 'pai_id' in old_values and old_values['pai_id'] != instance.pai_id:
+        hierarquia.mover_subarvore(instance.pk, instance.pai_id)
+
+
+@receiver(pre_delete, sender=Processo, dispatch_uid="desligar_hierarquia_processo")
+def desligar_hierarquia(sender, instance, **kwargs):
+    """Os filhos de um processo excluído viram raízes (on_delete=SET_NULL)."""
+    hierarquia.desligar_descendentes(instance.pk)
+
+
+# --- Contadores de processos por situação (dashboard) ---
+
+@receiver(post_save, sender=Processo, dispatch_uid="contar_processo_salvo")
+def contar_processo_salvo(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        contadores.ajustar({instance.situacao_id: 1})
+        return
+
+    old_values = getattr(instance, '_old_values', None)
+    if old_values and 'situacao_id' in old_values:
+        situacao_antiga_id = old_values['situacao_id']
+        if situacao_antiga_id != instance.situacao_id:
+            contadores.ajustar({situacao_antiga_id: -1, instance.situacao_id: 1})
+
+
+@receiver(post_delete, sender=Processo, dispatch_uid="contar_processo_excluido")
+def contar_processo_excluido(sender, instance, **kwargs):
+    contadores.ajustar({instance.situacao_id: -1})
+
+
+# --- Índice de busca textual (FTS5) ---
+
+@receiver(post_save, sender=Processo, dispatch_uid="indexar_processo_busca")
+def indexar_processo(sender, instance, created, raw=False, **kwargs):
+    """Reindexa o processo quando ele é criado ou algum campo de busca muda."""
+    if raw:
+        return
+    old_values = getattr(instance, '_old_values', None) or {}
+    if created or any(
+        campo in old_values and old_values[campo] != getattr(instance, campo) for campo in busca.CAMPOS_BUSCA
+    ):
+        busca.indexar([instance])
+
+
+@receiver(post_delete, sender=Processo, dispatch_uid="remover_processo_busca")
+def remover_processo_indice(sender, instance, **kwargs):
+    busca.remover([instance.pk])
+
+
+# --- Transições padrão das situações ---
+
+@receiver(post_save, sender=Situacao, dispatch_uid="transicoes_padrao_situacao")
+def criar_transicoes_padrao(sender, instance, created, raw=False, **kwargs):
+    """
+    Aplica a uma situação recém-criada a regra de transições da migração 0010:
+    se não é final, pode ir para as SITUACOES_DESTINO_PADRAO; se é uma delas,
+    toda situação não final pode ir para ela. Transições já cadastradas ficam.
+    """
+    if not created or raw:
+        return
+    pares = set()
+    if not instance.final:
+        destinos = Situacao.objects.filter(nome__in=SITUACOES_DESTINO_PADRAO).values_list('pk', flat=True)
+        pares.update((instance.pk, destino_id) for destino_id in destinos)
+    if instance.nome in SITUACOES_DESTINO_PADRAO:
+        origens = Situacao.objects.filter(final=False).values_list('pk', flat=True)
+        pares.update((origem_id, instance.pk) for origem_id in origens)
+    if pares:
+        TransicaoSituacao.objects.bulk_create(
+            [TransicaoSituacao(origem_id=origem_id, destino_id=destino_id) for origem_id, destino_id in pares],
+            ignore_conflicts=True,
+        )
+        # bulk_create não dispara o post_save que invalida o cache das transições.
+        tabela(TransicaoSituacao).invalidar()
+
+
+# --- Invalidação do cache das tabelas de domínio ---
+
+def invalidar_cache_dominio(sender, **kwargs):
+    tabela(sender).invalidar()
+
+
+for _model in MODELOS_DOMINIO:
+    post_save.connect(invalidar_cache_dominio, sender=_model, dispatch_uid=f"invalidar_cache_{_model.__name__}_save")
+    post_delete.connect(invalidar_cache_dominio, sender=_model, dispatch_uid=f"invalidar_cache_{_model.__name__}_delete")
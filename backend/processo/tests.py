@@ -1,3 +1,1485 @@
-from django.test import TestCase
+import atexit
+import io
+import json
+import logging
+import re
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from config.log import AmostragemFilter, FilaHandler
+
+from . import busca, hierarquia, historico, importacao, retencao
+from .admin import HISTORICO_INLINE_MAXIMO
+from .atualizacao_lote import propagar_situacao
+from .cache import MODELOS_DOMINIO, situacoes_destino, situacoes_finais, tabela
+from .contadores import contar_por_situacao, totais_por_situacao
+from .models import (
+    AlteracaoCampo, Atribuicao, Auditor, Categoria, Execucao, HistoricoProcesso, HistoricoProcessoArquivado,
+    OrgaoDemandante, Prioridade, Processo, ProcessoAncestral, Resposta, Situacao, Tipo, TipoDemanda, Unidade,
+)
+from .historico import versao_campo
+from .pagination import KeysetPagination
+from .serializers import ProcessoCreateUpdateSerializer
+from .views import contagem_filhos
+
+
+def criar_processo(**campos):
+    """Processo mínimo válido; os domínios são criados na primeira chamada."""
+    padrao = {
+        'assunto': 'Processo de teste',
+        'tipo': Tipo.objects.get_or_create(nome='Processo')[0],
+        'situacao': Situacao.objects.get_or_create(nome='Em andamento')[0],
+        'prioridade': Prioridade.objects.get_or_create(nome='Alta')[0],
+    }
+    padrao.update(campos)
+    return Processo.objects.create(**padrao)
+
+
+class CamposEsparsosTests(TestCase):
+    """?fields= / ?omit= na listagem: colunas lidas e relações carregadas."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(email='leitor@example.com', password='x'))
+        self.unidade = Unidade.objects.create(nome='Unidade A')
+        self.criar(3)
+
+    def criar(self, quantidade):
+        for _ in range(quantidade):
+            processo = criar_processo(descricao='Texto longo ' * 100)
+            processo.unidades_auditadas.add(self.unidade)
+
+    def listar(self, **params):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get('/api/processos/', params)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta, [consulta['sql'] for consulta in consultas]
+
+    def test_fields_le_so_as_colunas_pedidas(self):
+        resposta, consultas = self.listar(fields='numero,assunto')
+
+        self.assertEqual(set(resposta.data['results'][0]), {'numero', 'assunto'})
+        # COUNT da página + a própria página, sem prefetch.
+        self.assertEqual(len(consultas), 2)
+        self.assertIn('"assunto"', consultas[-1])
+        self.assertNotIn('"descricao"', consultas[-1])
+
+    def test_omit_nao_carrega_a_relacao_omitida(self):
+        resposta, consultas = self.listar(omit='unidades_auditadas')
+
+        self.assertNotIn('unidades_auditadas', resposta.data['results'][0])
+        self.assertIn('auditores_responsaveis', resposta.data['results'][0])
+        self.assertFalse([sql for sql in consultas if 'unidades_auditadas' in sql])
+
+    def test_numero_de_queries_nao_depende_do_tamanho_da_pagina(self):
+        params = {'fields': 'numero,tipo,pai,unidades_auditadas'}
+        self.listar(**params)  # aquece o cache das tabelas de domínio
+        _, poucos = self.listar(**params)
+        self.criar(10)
+        resposta, muitos = self.listar(**params)
+
+        self.assertEqual(len(resposta.data['results']), 13)
+        self.assertEqual(len(muitos), len(poucos))
+
+    def test_campo_invalido_e_recusado(self):
+        resposta = self.client.get('/api/processos/', {'fields': 'numero,inexistente'})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('inexistente', str(resposta.data['fields']))
+
+
+@mock.patch.object(KeysetPagination, 'page_size', 3)
+class PaginacaoCursorTests(TestCase):
+    """?paginacao=cursor na listagem: sem COUNT nem OFFSET."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(email='leitor@example.com', password='x'))
+        baixa = Prioridade.objects.create(nome='Baixa')
+        for indice in range(8):
+            criar_processo(**({'prioridade': baixa} if indice % 2 else {}))
+        # Datas repetidas: o id desempata.
+        Processo.objects.filter(id__in=Processo.objects.order_by('id').values('id')[:4]).update(
+            data_cadastro=timezone.now() - timedelta(days=1)
+        )
+
+    def paginas(self, **params):
+        """Segue os links 'next' e devolve (números de cada página, queries de cada página)."""
+        numeros, consultas = [], []
+        url, params = '/api/processos/', {'paginacao': 'cursor', 'fields': 'numero', **params}
+        while url:
+            with CaptureQueriesContext(connection) as capturadas:
+                resposta = self.client.get(url, params)
+            self.assertEqual(resposta.status_code, 200)
+            numeros.append([item['numero'] for item in resposta.data['results']])
+            consultas.append([consulta['sql'] for consulta in capturadas])
+            url, params = resposta.data['next'], None
+        return numeros, consultas
+
+    def test_percorre_tudo_na_ordem_sem_repetir(self):
+        numeros, _ = self.paginas()
+
+        esperado = list(Processo.objects.order_by('-data_cadastro', 'id').values_list('numero', flat=True))
+        self.assertEqual([numero for pagina in numeros for numero in pagina], esperado)
+        self.assertEqual([len(pagina) for pagina in numeros], [3, 3, 2])
+
+    def test_ultima_pagina_custa_o_mesmo_que_a_primeira_e_sem_count(self):
+        _, consultas = self.paginas()
+
+        self.assertEqual(len({len(pagina) for pagina in consultas}), 1)
+        self.assertFalse([sql for pagina in consultas for sql in pagina if 'COUNT(' in sql.upper()])
+        self.assertFalse([sql for pagina in consultas for sql in pagina if 'OFFSET' in sql.upper()])
+
+    def test_ordenacao_por_prioridade(self):
+        numeros, _ = self.paginas(ordering='prioridade__nome')
+
+        esperado = list(
+            Processo.objects.order_by('prioridade__nome', '-data_cadastro', 'id').values_list('numero', flat=True)
+        )
+        self.assertEqual([numero for pagina in numeros for numero in pagina], esperado)
+
+    def test_previous_volta_para_a_pagina_anterior(self):
+        primeira = self.client.get('/api/processos/', {'paginacao': 'cursor', 'fields': 'numero'})
+        segunda = self.client.get(primeira.data['next'])
+        de_volta = self.client.get(segunda.data['previous'])
+
+        self.assertEqual(de_volta.data['results'], primeira.data['results'])
+        self.assertIsNone(de_volta.data['previous'])
+
+    def test_cursor_invalido(self):
+        resposta = self.client.get('/api/processos/', {'cursor': 'nao-e-um-cursor'})
+        self.assertEqual(resposta.status_code, 404)
+
+
+class ArvoreProcessoTests(TestCase):
+    """/api/processos/{numero}/arvore/ carregada por uma CTE recursiva."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(email='leitor@example.com', password='x'))
+        self.raiz = criar_processo(assunto='Raiz')
+        self.filhos = [criar_processo(assunto=f'Filho {i}', pai=self.raiz) for i in range(2)]
+        self.netos = [criar_processo(assunto=f'Neto {i}', pai=filho) for filho in self.filhos for i in range(2)]
+
+    def arvore(self, **params):
+        return self.client.get(f'/api/processos/{self.raiz.numero}/arvore/', params)
+
+    def test_subarvore_inteira_em_uma_query(self):
+        with self.assertNumQueries(1):
+            resposta = self.arvore()
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data['assunto'], 'Raiz')
+        self.assertEqual(resposta.data['tipo'], 'Processo')
+        self.assertEqual(set(resposta.data), {'id', 'numero', 'assunto', 'tipo', 'pai', 'filhos'})
+        self.assertEqual(
+            {filho['numero']: {neto['numero'] for neto in filho['filhos']} for filho in resposta.data['filhos']},
+            {filho.numero: {neto.numero for neto in self.netos if neto.pai_id == filho.pk} for filho in self.filhos},
+        )
+
+    def test_numero_de_queries_nao_depende_do_tamanho(self):
+        for neto in self.netos:
+            criar_processo(assunto='Bisneto', pai=neto)
+
+        with self.assertNumQueries(1):
+            resposta = self.arvore()
+        self.assertEqual(len(resposta.data['filhos'][0]['filhos'][0]['filhos']), 1)
+
+    def test_depth_limita_os_niveis(self):
+        resposta = self.arvore(depth=1)
+
+        self.assertEqual(len(resposta.data['filhos']), 2)
+        self.assertEqual([filho['filhos'] for filho in resposta.data['filhos']], [[], []])
+
+    def test_depth_invalido_e_processo_inexistente(self):
+        self.assertEqual(self.arvore(depth=-1).status_code, 400)
+        self.assertEqual(self.client.get('/api/processos/inexistente/arvore/').status_code, 404)
+
+
+class CaminhoProcessoTests(TestCase):
+    """/api/processos/{numero}/caminho/ e ?expand=caminho (breadcrumb em uma query)."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(email='leitor@example.com', password='x'))
+        self.cadeia = [criar_processo(assunto='Nível 0')]
+        for nivel in range(1, 5):
+            self.cadeia.append(criar_processo(assunto=f'Nível {nivel}', pai=self.cadeia[-1]))
+
+    def test_caminho_da_raiz_ate_o_processo_em_uma_query(self):
+        folha = self.cadeia[-1]
+        with self.assertNumQueries(1):
+            resposta = self.client.get(f'/api/processos/{folha.numero}/caminho/')
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(
+            resposta.data,
+            [{'numero': p.numero, 'assunto': p.assunto, 'tipo': 'Processo'} for p in self.cadeia],
+        )
+
+    def test_raiz_tem_caminho_so_com_ela(self):
+        resposta = self.client.get(f'/api/processos/{self.cadeia[0].numero}/caminho/')
+        self.assertEqual([item['numero'] for item in resposta.data], [self.cadeia[0].numero])
+
+    def test_expand_caminho_custa_uma_query_a_mais(self):
+        url = f'/api/processos/{self.cadeia[-1].numero}/'
+        self.client.get(url)  # aquece o cache das tabelas de domínio
+        with CaptureQueriesContext(connection) as sem_caminho:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as com_caminho:
+            resposta = self.client.get(url, {'expand': 'caminho'})
+
+        self.assertEqual(len(com_caminho), len(sem_caminho) + 1)
+        self.assertEqual([item['numero'] for item in resposta.data['caminho']], [p.numero for p in self.cadeia])
+
+    def test_expansao_invalida_e_processo_inexistente(self):
+        self.assertEqual(self.client.get(f'/api/processos/{self.cadeia[0].numero}/', {'expand': 'tudo'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/processos/inexistente/caminho/').status_code, 404)
+
+
+class NavegacaoArvoreTests(TestCase):
+    """?raiz=true e ?pai=<numero> com 'num_filhos', sem carregar listas de filhos."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(email='leitor@example.com', password='x'))
+        self.raizes = [criar_processo(assunto=f'Raiz {i}') for i in range(2)]
+        self.filhos = [criar_processo(assunto=f'Filho {i}', pai=self.raizes[0]) for i in range(3)]
+        criar_processo(assunto='Neto', pai=self.filhos[0])
+
+    def listar(self, **params):
+        resposta = self.client.get('/api/processos/', {'fields': 'numero,num_filhos', **params})
+        self.assertEqual(resposta.status_code, 200)
+        return {item['numero']: item['num_filhos'] for item in resposta.data['results']}
+
+    def test_raiz_lista_so_processos_sem_pai(self):
+        self.assertEqual(self.listar(raiz='true'), {self.raizes[0].numero: 3, self.raizes[1].numero: 0})
+
+    def test_pai_lista_os_filhos_diretos(self):
+        esperado = {filho.numero: 0 for filho in self.filhos}
+        esperado[self.filhos[0].numero] = 1
+        self.assertEqual(self.listar(pai=self.raizes[0].numero), esperado)
+
+    def test_numero_de_queries_nao_depende_dos_filhos(self):
+        params = {'fields': 'numero,num_filhos,filhos', 'raiz': 'true'}
+        self.client.get('/api/processos/', params)  # aquece o cache das tabelas de domínio
+        with CaptureQueriesContext(connection) as antes:
+            self.client.get('/api/processos/', params)
+        for i in range(5):
+            criar_processo(assunto=f'Outro filho {i}', pai=self.raizes[1])
+        with CaptureQueriesContext(connection) as depois:
+            resposta = self.client.get('/api/processos/', params)
+
+        self.assertEqual(len(depois), len(antes))
+        # Fora do detalhe, 'filhos' não é carregado: a contagem basta para expandir.
+        self.assertEqual({item['numero']: item['filhos'] for item in resposta.data['results']},
+                         {raiz.numero: [] for raiz in self.raizes})
+        self.assertEqual({item['numero']: item['num_filhos'] for item in resposta.data['results']},
+                         {self.raizes[0].numero: 3, self.raizes[1].numero: 5})
+
+    def test_contagem_de_filhos_usa_o_indice_de_pai(self):
+        plano = Processo.objects.filter(pai__isnull=True).annotate(num_filhos=contagem_filhos()).explain()
+        self.assertRegex(plano, r'SEARCH U0 USING (COVERING )?INDEX \S*pai_id')
+
+
+class BuscaTextualTests(TestCase):
+    """?search= pelo índice FTS5 (processo/busca.py) e o SearchFilter padrão como alternativa."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(email='leitor@example.com', password='x'))
+        self.no_assunto = criar_processo(assunto='Acórdão sobre a licitação')
+        self.na_descricao = criar_processo(assunto='Outro tema', descricao='Cita o acórdão de passagem.')
+        self.auditoria = criar_processo(assunto='Auditoria de contratos')
+
+    def buscar(self, termo, **params):
+        resposta = self.client.get('/api/processos/', {'search': termo, 'fields': 'numero', **params})
+        self.assertEqual(resposta.status_code, 200)
+        return [item['numero'] for item in resposta.data['results']]
+
+    def test_ignora_acentos_e_ordena_por_relevancia(self):
+        self.assertEqual(self.buscar('acordao'), [self.no_assunto.numero, self.na_descricao.numero])
+
+    def test_busca_por_prefixo_e_todos_os_termos(self):
+        self.assertEqual(self.buscar('audit'), [self.auditoria.numero])
+        self.assertEqual(self.buscar('acordao licitacao'), [self.no_assunto.numero])
+
+    def test_ordering_explicito_substitui_a_relevancia(self):
+        esperado = sorted([self.no_assunto, self.na_descricao], key=lambda p: (p.data_cadastro, p.pk))
+        self.assertEqual(self.buscar('acordao', ordering='data_cadastro'), [p.numero for p in esperado])
+
+    def test_indice_acompanha_save_e_delete(self):
+        self.auditoria.assunto = 'Inspeção de contratos'
+        self.auditoria.save()
+        self.na_descricao.delete()
+
+        self.assertEqual(self.buscar('auditoria'), [])
+        self.assertEqual(self.buscar('inspecao'), [self.auditoria.numero])
+        self.assertEqual(self.buscar('acordao'), [self.no_assunto.numero])
+
+    def test_reconstruir_indice_busca(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {busca.TABELA_FTS}")
+        self.assertEqual(self.buscar('acordao'), [])
+
+        call_command('reconstruir_indice_busca', stdout=io.StringIO())
+
+        self.assertEqual(self.buscar('acordao'), [self.no_assunto.numero, self.na_descricao.numero])
+
+    def test_sem_fts_usa_o_search_filter_padrao(self):
+        with mock.patch.object(busca, 'fts_disponivel', return_value=False), CaptureQueriesContext(connection) as consultas:
+            sem_acento = self.buscar('acordao')
+            com_acento = self.buscar('Acórdão')
+
+        self.assertEqual(sem_acento, [])
+        self.assertEqual(set(com_acento), {self.no_assunto.numero, self.na_descricao.numero})
+        self.assertFalse([c for c in consultas if busca.TABELA_FTS in c['sql']])
+
+
+class FiltrosListagemTests(TestCase):
+    """Filtros de ProcessoFilter executados no banco, com os índices compostos de Processo.Meta."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(email='leitor@example.com', password='x'))
+        self.demanda = Tipo.objects.create(nome='Demanda')
+        self.suspenso = Situacao.objects.create(nome='Suspenso')
+        self.auditores = [Auditor.objects.create(nome=nome) for nome in ('Ana', 'Bruno')]
+        self.a = criar_processo(ano_solicitacao=2023)
+        self.b = criar_processo(tipo=self.demanda, ano_solicitacao=2024)
+        self.c = criar_processo(tipo=self.demanda, situacao=self.suspenso, ano_solicitacao=2024)
+        self.a.auditores_responsaveis.add(*self.auditores)
+        self.b.auditores_responsaveis.add(self.auditores[1])
+        Resposta.objects.create(processo=self.a, prazo_inicial=date(2024, 1, 10))
+        Resposta.objects.create(processo=self.c, prazo_inicial=date(2024, 3, 10))
+        Processo.objects.filter(pk=self.a.pk).update(data_cadastro=timezone.now() - timedelta(days=30))
+
+    def filtrar(self, **params):
+        resposta = self.client.get('/api/processos/', {'fields': 'numero', **params})
+        self.assertEqual(resposta.status_code, 200)
+        return sorted(item['numero'] for item in resposta.data['results'])
+
+    def numeros(self, *processos):
+        return sorted(p.numero for p in processos)
+
+    def test_listas_de_valores(self):
+        self.assertEqual(self.filtrar(tipo=self.demanda.pk), self.numeros(self.b, self.c))
+        self.assertEqual(
+            self.filtrar(tipo=self.demanda.pk, situacao=f'{self.suspenso.pk},{self.a.situacao_id}'),
+            self.numeros(self.b, self.c),
+        )
+        self.assertEqual(self.filtrar(tipo=self.demanda.pk, situacao=self.suspenso.pk), self.numeros(self.c))
+        self.assertEqual(self.filtrar(ano_solicitacao='2023,2024'), self.numeros(self.a, self.b, self.c))
+
+    def test_manytomany_sem_linhas_repetidas(self):
+        ids = ','.join(str(auditor.pk) for auditor in self.auditores)
+        self.assertEqual(self.filtrar(auditor=ids), self.numeros(self.a, self.b))
+
+    def test_intervalos_de_datas(self):
+        ontem = (timezone.now() - timedelta(days=1)).date().isoformat()
+        self.assertEqual(self.filtrar(data_cadastro_after=ontem), self.numeros(self.b, self.c))
+        self.assertEqual(
+            self.filtrar(prazo_inicial_after='2024-02-01', prazo_inicial_before='2024-12-31'),
+            self.numeros(self.c),
+        )
+
+    def test_valor_invalido_e_recusado(self):
+        self.assertEqual(self.client.get('/api/processos/', {'tipo': 'abc'}).status_code, 400)
+
+    def test_combinacoes_usam_os_indices_compostos(self):
+        tabela_processo = Processo._meta.db_table
+        with connection.cursor() as cursor:
+            indices = connection.introspection.get_constraints(cursor, tabela_processo)
+        for nome, colunas in {
+            'processo_tipo_sit_cad_idx': ['tipo_id', 'situacao_id', 'data_cadastro'],
+            'processo_sit_cad_idx': ['situacao_id', 'data_cadastro'],
+            'processo_prior_cad_idx': ['prioridade_id', 'data_cadastro'],
+            'processo_ano_tipo_idx': ['ano_solicitacao', 'tipo_id'],
+        }.items():
+            self.assertEqual(indices[nome]['columns'], colunas)
+
+        plano = Processo.objects.filter(situacao_id__in=[self.suspenso.pk]).order_by('-data_cadastro').explain()
+        self.assertRegex(plano, r'INDEX processo_(sit_cad|tipo_sit_cad)_idx')
+
+
+class FacetasListagemTests(TestCase):
+    """?facets= na listagem: contagens do resultado filtrado em um único GROUP BY."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(email='leitor@example.com', password='x'))
+        self.demanda = Tipo.objects.create(nome='Demanda')
+        self.suspenso = Situacao.objects.create(nome='Suspenso')
+        criar_processo()
+        criar_processo(tipo=self.demanda)
+        criar_processo(tipo=self.demanda, situacao=self.suspenso)
+        self.em_andamento = Situacao.objects.get(nome='Em andamento')
+
+    def listar(self, **params):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get('/api/processos/', {'fields': 'numero', **params})
+        self.assertEqual(resposta.status_code, 200)
+        return resposta, [consulta['sql'] for consulta in consultas]
+
+    def test_contagens_por_faceta(self):
+        resposta, _ = self.listar(facets='tipo,situacao,prioridade')
+
+        facetas = resposta.data['facets']
+        self.assertEqual(facetas['tipo'], [
+            {'id': self.demanda.pk, 'nome': 'Demanda', 'total': 2},
+            {'id': Tipo.objects.get(nome='Processo').pk, 'nome': 'Processo', 'total': 1},
+        ])
+        self.assertEqual({item['nome']: item['total'] for item in facetas['situacao']},
+                         {'Em andamento': 2, 'Suspenso': 1})
+        self.assertEqual([item['total'] for item in facetas['prioridade']], [3])
+
+    def test_facetas_seguem_os_filtros(self):
+        resposta, _ = self.listar(facets='situacao', tipo=self.demanda.pk)
+
+        self.assertEqual(len(resposta.data['results']), 2)
+        self.assertEqual({item['id']: item['total'] for item in resposta.data['facets']['situacao']},
+                         {self.em_andamento.pk: 1, self.suspenso.pk: 1})
+
+    def test_todas_as_facetas_em_uma_query(self):
+        self.listar(facets='tipo,situacao,prioridade')  # aquece o cache das tabelas de domínio
+        _, sem_facetas = self.listar()
+        _, com_facetas = self.listar(facets='tipo,situacao,prioridade')
+
+        self.assertEqual(len(com_facetas), len(sem_facetas) + 1)
+        self.assertIn('GROUP BY', com_facetas[-1])
+
+    def test_faceta_invalida(self):
+        resposta = self.client.get('/api/processos/', {'facets': 'tipo,assunto'})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('assunto', str(resposta.data['facets']))
+
+
+class CamposRastreadosTests(TestCase):
+    """Diff em memória (CamposRastreadosMixin) em vez de reler a linha no pre_save."""
+
+    def setUp(self):
+        criar_processo()
+        self.processo = Processo.objects.get()
+
+    def salvar(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.processo.save()
+        tabela_processo = f'"{Processo._meta.db_table}"'
+        return (
+            [c['sql'] for c in consultas if c['sql'].startswith('SELECT') and f'FROM {tabela_processo}' in c['sql']],
+            [c['sql'] for c in consultas if c['sql'].startswith(f'UPDATE {tabela_processo}')],
+        )
+
+    def test_update_so_das_colunas_alteradas_sem_reler_a_linha(self):
+        self.processo.observacao = 'Anotação'
+        selects, updates = self.salvar()
+
+        self.assertEqual(selects, [])
+        self.assertEqual(len(updates), 1)
+        colunas = re.findall(r'"(\w+)" = ', updates[0].split(' WHERE ')[0])
+        self.assertEqual(sorted(colunas), ['data_atualizacao', 'observacao'])
+
+        registro = self.processo.historicos.order_by('-id').first()
+        self.assertEqual(registro.alteracoes, {'observacao': {'anterior': 'N/A', 'novo': 'Anotação'}})
+
+    def test_salvar_de_novo_compara_com_o_que_foi_gravado(self):
+        self.processo.observacao = 'Primeira'
+        self.processo.save()
+        self.processo.assunto = 'Outro assunto'
+        _, updates = self.salvar()
+
+        colunas = re.findall(r'"(\w+)" = ', updates[0].split(' WHERE ')[0])
+        self.assertEqual(sorted(colunas), ['assunto', 'data_atualizacao'])
+
+    def test_refresh_from_db_renova_os_valores_carregados(self):
+        Processo.objects.filter(pk=self.processo.pk).update(observacao='Gravada por outro')
+        self.processo.refresh_from_db()
+        self.processo.assunto = 'Outro assunto'
+        self.processo.save()
+
+        registro = self.processo.historicos.order_by('-id').first()
+        self.assertEqual(set(registro.alteracoes), {'assunto'})
+        self.assertEqual(Processo.objects.get().observacao, 'Gravada por outro')
+
+
+class AtualizacaoSemEfeitoTests(TestCase):
+    """PATCH que não muda nada: nenhuma escrita e nenhum histórico."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(email='editor@example.com', password='x'))
+        self.unidade = Unidade.objects.create(nome='Unidade A')
+        self.processo = criar_processo(observacao='Anotação')
+        self.processo.unidades_auditadas.add(self.unidade)
+        Resposta.objects.create(processo=self.processo, prazo_inicial=date(2024, 1, 10))
+        self.dados = {
+            'assunto': self.processo.assunto,
+            'observacao': 'Anotação',
+            'situacao': self.processo.situacao_id,
+            'unidades_auditadas': [self.unidade.pk],
+            'resposta': {'prazo_inicial': '2024-01-10'},
+            'execucao': None,
+        }
+
+    def patch(self, dados):
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.patch(f'/api/processos/{self.processo.numero}/', dados, format='json')
+        self.assertEqual(resposta.status_code, 200, resposta.data)
+        return [c['sql'] for c in consultas if c['sql'].split(' ')[0] in ('INSERT', 'UPDATE', 'DELETE')]
+
+    def test_patch_sem_mudancas_nao_escreve_nada(self):
+        historicos = self.processo.historicos.count()
+        data_atualizacao = Processo.objects.get().data_atualizacao
+
+        self.assertEqual(self.patch(self.dados), [])
+        self.assertEqual(self.processo.historicos.count(), historicos)
+        self.assertEqual(Processo.objects.get().data_atualizacao, data_atualizacao)
+        self.assertFalse(Execucao.objects.exists())
+
+    def test_patch_com_uma_mudanca_grava_so_ela(self):
+        escritas = self.patch({**self.dados, 'observacao': 'Nova anotação'})
+
+        self.assertEqual(len([sql for sql in escritas if sql.startswith('UPDATE')]), 1)
+        registro = self.processo.historicos.order_by('-id').first()
+        self.assertEqual(set(registro.alteracoes), {'observacao'})
+
+    def test_save_sem_mudancas_nao_gera_historico(self):
+        processo = Processo.objects.get()
+        historicos = processo.historicos.count()
+        processo.save()
+        self.assertEqual(processo.historicos.count(), historicos)
+
+
+class RotulosHistoricoTests(TestCase):
+    """Rótulos do histórico a partir dos *_id e do cache das tabelas de domínio."""
+
+    def setUp(self):
+        for model in MODELOS_DOMINIO:
+            tabela(model).invalidar()
+        self.pai = criar_processo(assunto='Processo pai')
+        self.categoria = Categoria.objects.create(nome='Fiscalização')
+        self.suspenso = Situacao.objects.create(nome='Suspenso')
+        for model in MODELOS_DOMINIO:
+            tabela(model).objetos()
+
+    def tearDown(self):
+        for model in MODELOS_DOMINIO:
+            tabela(model).invalidar()
+
+    def consultas_de_leitura(self, consultas):
+        dominio = tuple(f'FROM "{model._meta.db_table}"' for model in MODELOS_DOMINIO)
+        return [c['sql'] for c in consultas if c['sql'].startswith('SELECT') and any(t in c['sql'] for t in dominio)]
+
+    def test_criacao_registra_os_dados_iniciais_sem_carregar_relacoes(self):
+        pai = Processo.objects.get(pk=self.pai.pk)
+        with CaptureQueriesContext(connection) as consultas:
+            processo = Processo.objects.create(
+                assunto='Filho', pai=pai, categoria_id=self.categoria.pk,
+                tipo_id=pai.tipo_id, situacao_id=pai.situacao_id, prioridade_id=pai.prioridade_id,
+            )
+
+        self.assertEqual(self.consultas_de_leitura(consultas), [])
+        # O rótulo do 'pai' sai da instância já carregada.
+        tabela_processo = f'FROM "{Processo._meta.db_table}"'
+        self.assertFalse([c for c in consultas if c['sql'].startswith('SELECT') and tabela_processo in c['sql']])
+        dados = processo.historicos.get().alteracoes['dados_iniciais']
+        self.assertEqual(dados['categoria'], 'Fiscalização')
+        self.assertEqual(dados['tipo'], 'Processo')
+        self.assertEqual(dados['situacao'], 'Em andamento')
+        self.assertEqual(dados['pai'], str(pai))
+
+    def test_alteracao_de_fk_usa_o_cache(self):
+        processo = Processo.objects.get(pk=self.pai.pk)
+        processo.situacao_id = self.suspenso.pk
+        with CaptureQueriesContext(connection) as consultas:
+            processo.save()
+
+        self.assertEqual(self.consultas_de_leitura(consultas), [])
+        alteracao = processo.historicos.order_by('-id').first().alteracoes['situacao']
+        self.assertEqual(alteracao, {'anterior': 'Em andamento', 'novo': 'Suspenso'})
+
+
+class HistoricoPaginadoTests(TestCase):
+    """Histórico fora do detalhe: resumo 'ultima_alteracao' e /historico/ por cursor."""
+
+    def setUp(self):
+        self.usuario = get_user_model().objects.create_user(email='leitor@example.com', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.processo = criar_processo()
+        agora = timezone.now()
+        # Datas repetidas aos pares: o id desempata.
+        HistoricoProcesso.objects.bulk_create([
+            HistoricoProcesso(
+                processo=self.processo, data=agora - timedelta(minutes=indice // 2),
+                alteracoes={'assunto': {'novo': str(indice)}},
+            )
+            for indice in range(44)
+        ])
+        self.ultimo = HistoricoProcesso.objects.create(
+            processo=self.processo, data=agora + timedelta(days=1), alterado_por=self.usuario,
+        )
+
+    def paginas(self):
+        """Segue os links 'next' e devolve (registros de cada página, queries de cada página)."""
+        registros, consultas = [], []
+        url = f'/api/processos/{self.processo.numero}/historico/'
+        while url:
+            with CaptureQueriesContext(connection) as capturadas:
+                resposta = self.client.get(url)
+            self.assertEqual(resposta.status_code, 200)
+            registros.append(resposta.data['results'])
+            consultas.append([consulta['sql'] for consulta in capturadas])
+            url = resposta.data['next']
+        return registros, consultas
+
+    def test_percorre_o_historico_do_mais_recente_ao_mais_antigo(self):
+        registros, consultas = self.paginas()
+
+        self.assertEqual([len(pagina) for pagina in registros], [20, 20, 6])
+        esperado = list(self.processo.historicos.order_by('-data', 'id').values_list('alteracoes', flat=True))
+        self.assertEqual([registro['alteracoes'] for pagina in registros for registro in pagina], esperado)
+        self.assertEqual(len({len(pagina) for pagina in consultas}), 1)
+        self.assertFalse([sql for pagina in consultas for sql in pagina if 'COUNT(' in sql.upper()])
+        self.assertFalse([sql for pagina in consultas for sql in pagina if 'OFFSET' in sql.upper()])
+
+    def test_listagem_e_detalhe_trazem_so_o_resumo(self):
+        resumo = {
+            'data': serializers.DateTimeField().to_representation(self.ultimo.data),
+            'tipo_alteracao': 'ATUALIZACAO',
+            'alterado_por': 'leitor@example.com',
+        }
+        item = self.client.get('/api/processos/').data['results'][0]
+        detalhe = self.client.get(f'/api/processos/{self.processo.numero}/').data
+
+        for dados in (item, detalhe):
+            self.assertEqual(dados['ultima_alteracao'], resumo)
+            self.assertNotIn('historicos', dados)
+
+    def test_listagem_nao_cresce_com_o_historico(self):
+        def consultas():
+            with CaptureQueriesContext(connection) as capturadas:
+                self.client.get('/api/processos/')
+            return len(capturadas)
+
+        consultas()  # aquece o cache das tabelas de domínio
+        antes = consultas()
+        HistoricoProcesso.objects.bulk_create([HistoricoProcesso(processo=self.processo) for _ in range(50)])
+        self.assertEqual(consultas(), antes)
+
+
+class ConsultaAuditoriaTests(TestCase):
+    """/api/historico/: uma linha por campo alterado, filtrada por índice."""
+
+    def setUp(self):
+        self.editor = get_user_model().objects.create_user(email='editor@example.com', password='x')
+        self.revisor = get_user_model().objects.create_user(email='revisor@example.com', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.revisor)
+        self.processo = criar_processo()
+        self.andamento = self.processo.situacao
+        self.suspenso = Situacao.objects.create(nome='Suspenso')
+
+        with mock.patch('processo.historico.get_current_user', return_value=self.editor):
+            self.processo.situacao = self.suspenso
+            self.processo.assunto = 'Outro assunto'
+            self.processo.save()
+        with mock.patch('processo.historico.get_current_user', return_value=self.revisor):
+            self.processo.observacao = 'Revisado'
+            self.processo.save()
+
+    def consultar(self, **params):
+        resposta = self.client.get('/api/historico/', params)
+        self.assertEqual(resposta.status_code, 200, resposta.data)
+        return resposta.data['results']
+
+    def test_uma_linha_por_campo_com_ids_e_rotulos(self):
+        linhas = self.consultar(processo=self.processo.numero, alterado_por=self.editor.pk)
+
+        self.assertEqual(sorted(linha['campo'] for linha in linhas), ['assunto', 'situacao'])
+        self.assertEqual(len({linha['historico'] for linha in linhas}), 1)
+        situacao = next(linha for linha in linhas if linha['campo'] == 'situacao')
+        self.assertEqual(
+            (situacao['id_anterior'], situacao['id_novo'], situacao['rotulo_anterior'], situacao['rotulo_novo']),
+            (self.andamento.pk, self.suspenso.pk, 'Em andamento', 'Suspenso'),
+        )
+        self.assertEqual(situacao['alterado_por'], str(self.editor))
+
+    def test_filtros_por_campo_valor_usuario_e_periodo(self):
+        hoje = timezone.localdate()
+        self.assertEqual(len(self.consultar(campo='situacao', id_novo=self.suspenso.pk)), 1)
+        self.assertEqual([l['campo'] for l in self.consultar(alterado_por=self.revisor.pk)], ['observacao'])
+        # Inclui as linhas dos dados iniciais, gravadas na criação.
+        self.assertEqual(
+            len(self.consultar(campo='situacao,observacao', data_after=hoje.isoformat())),
+            AlteracaoCampo.objects.filter(campo__in=['situacao', 'observacao']).count(),
+        )
+        self.assertEqual(self.consultar(data_after=(hoje + timedelta(days=1)).isoformat()), [])
+        self.assertEqual(self.consultar(data_before=(hoje - timedelta(days=1)).isoformat()), [])
+
+    def test_campo_com_periodo_usa_o_indice(self):
+        plano = AlteracaoCampo.objects.filter(campo='situacao', data__gte=timezone.now()).order_by('-data').explain()
+        self.assertRegex(plano, r'INDEX alteracao_campo_data_idx')
+
+    def test_pagina_por_cursor_com_queries_constantes(self):
+        historico = self.processo.historicos.order_by('-id').first()
+        agora = timezone.now()
+        AlteracaoCampo.objects.bulk_create([
+            AlteracaoCampo(
+                historico=historico, processo=self.processo, campo='assunto',
+                rotulo_novo=str(indice), data=agora - timedelta(minutes=indice // 2),
+            )
+            for indice in range(25)
+        ])
+
+        ids, consultas = [], []
+        url, params = '/api/historico/', {'campo': 'assunto'}
+        while url:
+            with CaptureQueriesContext(connection) as capturadas:
+                resposta = self.client.get(url, params)
+            ids.append([linha['id'] for linha in resposta.data['results']])
+            consultas.append(len(capturadas))
+            url, params = resposta.data['next'], None
+
+        esperado = list(AlteracaoCampo.objects.filter(campo='assunto').order_by('-data', 'id').values_list('id', flat=True))
+        self.assertEqual([len(pagina) for pagina in ids], [20, len(esperado) - 20])
+        self.assertEqual([pk for pagina in ids for pk in pagina], esperado)
+        self.assertEqual(len(set(consultas)), 1)
+
+
+class LogEstruturadoTests(TestCase):
+    """Peças do LOGGING (config/log.py) e o caminho dos sinais sem print()."""
+
+    def registro(self, nivel=logging.DEBUG, **extra):
+        registro = logging.LogRecord('processo.signals', nivel, __file__, 1, 'Processo %s salvo', ('P-1',), None)
+        registro.__dict__.update(extra)
+        return registro
+
+    def test_fila_escreve_json_na_thread_do_listener(self):
+        destino = io.StringIO()
+        handler = FilaHandler(destino=destino)
+        handler.handle(self.registro(campos=['assunto']))
+        # stop() esvazia a fila e encerra a thread de escrita.
+        handler.listener.stop()
+        atexit.unregister(handler.listener.stop)
+
+        linha = json.loads(destino.getvalue())
+        self.assertEqual(linha['mensagem'], 'Processo P-1 salvo')
+        self.assertEqual((linha['nivel'], linha['logger'], linha['campos']), ('DEBUG', 'processo.signals', ['assunto']))
+
+    def test_amostragem_so_dos_niveis_baixos(self):
+        filtro = AmostragemFilter(taxa=0, nivel_maximo='DEBUG')
+        self.assertFalse(filtro.filter(self.registro()))
+        self.assertTrue(filtro.filter(self.registro(nivel=logging.WARNING)))
+        self.assertTrue(AmostragemFilter(taxa=1).filter(self.registro()))
+
+    def test_sinais_nao_usam_print(self):
+        with mock.patch('builtins.print') as print_:
+            processo = criar_processo()
+            processo.assunto = 'Outro assunto'
+            processo.save()
+            processo.unidades_auditadas.add(Unidade.objects.create(nome='Unidade A'))
+
+        print_.assert_not_called()
+
+
+class ColetorHistoricoTests(TestCase):
+    """Agrupamento do histórico por operação (processo/historico.py)."""
+
+    def setUp(self):
+        # O histórico só é gravado no commit: os callbacks precisam rodar aqui também.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.processo = criar_processo()
+        self.processo.historicos.all().delete()
+
+    def test_um_registro_por_operacao(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with historico.operacao():
+                self.processo.assunto = 'Novo assunto'
+                self.processo.save()
+                with historico.operacao():
+                    self.processo.observacao = 'Anotação'
+                    self.processo.save()
+
+        historicos = list(HistoricoProcesso.objects.filter(processo=self.processo))
+        self.assertEqual(len(historicos), 1)
+        self.assertEqual(set(historicos[0].alteracoes), {'assunto', 'observacao'})
+
+    def test_savepoint_desfeito_nao_entra_no_historico(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with historico.operacao():
+                self.processo.assunto = 'Novo assunto'
+                self.processo.save()
+                try:
+                    with transaction.atomic():
+                        self.processo.observacao = 'Desfeita'
+                        self.processo.save()
+                        raise RuntimeError
+                except RuntimeError:
+                    self.processo.refresh_from_db()
+
+        historicos = list(HistoricoProcesso.objects.filter(processo=self.processo))
+        self.assertEqual(len(historicos), 1)
+        self.assertEqual(set(historicos[0].alteracoes), {'assunto'})
+
+    def test_savepoint_desfeito_por_ultimo_nao_impede_a_gravacao(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with historico.operacao():
+                self.processo.assunto = 'Novo assunto'
+                self.processo.save()
+                try:
+                    with transaction.atomic():
+                        self.processo.observacao = 'Desfeita'
+                        self.processo.save()
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+
+        registro = HistoricoProcesso.objects.get(processo=self.processo)
+        self.assertEqual(registro.alteracoes['assunto']['novo'], 'Novo assunto')
+        self.assertNotIn('observacao', registro.alteracoes)
+
+    def test_callbacks_descartados_nao_dependem_do_coletor_de_lixo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with historico.operacao():
+                self.processo.assunto = 'Novo assunto'
+                self.processo.save()
+                try:
+                    with transaction.atomic():
+                        self.processo.observacao = 'Desfeita'
+                        self.processo.save()
+                        # Referências fortes aos callbacks que o rollback vai descartar.
+                        descartados = list(connection.run_on_commit)
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+        self.processo.refresh_from_db()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with historico.operacao():
+                self.processo.prioridade = Prioridade.objects.create(nome='Baixa')
+                self.processo.save()
+
+        alteracoes = [h.alteracoes for h in HistoricoProcesso.objects.filter(processo=self.processo).order_by('id')]
+        self.assertTrue(descartados)
+        self.assertEqual([set(a) for a in alteracoes], [{'assunto'}, {'prioridade'}])
+
+    def test_operacao_desfeita_nao_deixa_pendencias(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with historico.operacao():
+                    self.processo.assunto = 'Desfeito'
+                    self.processo.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.processo.refresh_from_db()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with historico.operacao():
+                self.processo.observacao = 'Confirmada'
+                self.processo.save()
+
+        registro = HistoricoProcesso.objects.get(processo=self.processo)
+        self.assertEqual(set(registro.alteracoes), {'observacao'})
+
+    def test_fora_de_uma_operacao_grava_na_hora(self):
+        try:
+            with transaction.atomic():
+                self.processo.assunto = 'Desfeito'
+                self.processo.save()
+                self.assertTrue(HistoricoProcesso.objects.filter(processo=self.processo).exists())
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+        self.assertFalse(HistoricoProcesso.objects.filter(processo=self.processo).exists())
+
+
+class RetencaoHistoricoTests(TestCase):
+    """Arquivamento do histórico (processo/retencao.py) e as linhas de AlteracaoCampo."""
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.processo = criar_processo()
+        for assunto in ('Primeiro', 'Segundo', 'Terceiro'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.processo.assunto = assunto
+                self.processo.save()
+        antigos = self.processo.historicos.order_by('data', 'id')[:3]
+        HistoricoProcesso.objects.filter(id__in=[h.id for h in antigos]).update(
+            data=timezone.now() - timedelta(days=400)
+        )
+
+    def arquivar(self):
+        historicos = list(retencao.historicos_para_arquivar(dias=365))
+        retencao.arquivar_lote(historicos)
+        return [historico.id for historico in historicos]
+
+    def test_arquivar_mantem_alteracoes_campos(self):
+        antes = AlteracaoCampo.objects.filter(processo=self.processo).count()
+        arquivados = self.arquivar()
+
+        self.assertEqual(len(arquivados), 3)
+        self.assertEqual(HistoricoProcessoArquivado.objects.filter(id__in=arquivados).count(), 3)
+        self.assertEqual(AlteracaoCampo.objects.filter(processo=self.processo).count(), antes)
+        self.assertTrue(AlteracaoCampo.objects.filter(historico_id__in=arquivados).exists())
+
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(email='auditor@example.com', password='x'))
+        resposta = client.get('/api/historico/', {'processo': self.processo.numero, 'campo': 'assunto'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('Primeiro', {linha['rotulo_novo'] for linha in resposta.data['results']})
+
+    def test_reconstruir_alteracoes_campos_le_o_arquivo(self):
+        arquivados = self.arquivar()
+        AlteracaoCampo.objects.all().delete()
+
+        call_command('reconstruir_alteracoes_campos', stdout=io.StringIO())
+
+        self.assertEqual(
+            set(AlteracaoCampo.objects.values_list('historico_id', flat=True)),
+            set(arquivados) | set(self.processo.historicos.values_list('id', flat=True)),
+        )
+
+
+class AdminHistoricoTests(TestCase):
+    """O formulário do processo no admin não carrega o histórico inteiro."""
+
+    def test_inline_mostra_so_os_registros_recentes(self):
+        processo = criar_processo()
+        HistoricoProcesso.objects.bulk_create([
+            HistoricoProcesso(processo=processo, tipo_alteracao='ATUALIZACAO', alteracoes={'assunto': {'novo': str(i)}})
+            for i in range(HISTORICO_INLINE_MAXIMO + 5)
+        ])
+        self.client.force_login(get_user_model().objects.create_superuser(email='admin@example.com', password='x'))
+
+        resposta = self.client.get(f'/admin/processo/processo/{processo.pk}/change/')
+
+        self.assertEqual(resposta.status_code, 200)
+        inline = next(
+            formset for formset in resposta.context['inline_admin_formsets']
+            if formset.formset.model is HistoricoProcesso
+        )
+        self.assertEqual(len(inline.formset.forms), HISTORICO_INLINE_MAXIMO)
+        self.assertContains(resposta, f'?processo__id__exact={processo.pk}')
+        lista = self.client.get(f'/admin/processo/historicoprocesso/?processo__id__exact={processo.pk}')
+        self.assertEqual(lista.status_code, 200)
+        self.assertEqual(lista.context['cl'].result_count, processo.historicos.count())
+
+
+class SituacaoFinalTests(TestCase):
+    """Situacao.final e os pontos que o usam (propagação e arquivamento)."""
+
+    def test_nova_situacao_segue_a_regra_do_nome(self):
+        finalizado = Situacao.objects.create(nome='Finalizado')
+        pendente = Situacao.objects.create(nome='Pendente')
+        arquivado = Situacao.objects.create(nome='Arquivado', final=True)
+
+        self.assertTrue(finalizado.final)
+        self.assertFalse(pendente.final)
+        self.assertEqual(set(situacoes_finais()), {finalizado.pk, arquivado.pk})
+
+    def test_propagacao_ignora_descendentes_em_situacao_final(self):
+        arquivado = Situacao.objects.create(nome='Arquivado', final=True)
+        # Sem transições de saída, mas não final: recebe a propagação.
+        sem_saida = Situacao.objects.create(nome='Aguardando')
+        suspenso = Situacao.objects.create(nome='Suspenso')
+        with self.captureOnCommitCallbacks(execute=True):
+            pai = criar_processo(situacao=suspenso)
+            filho = criar_processo(pai=pai, situacao=sem_saida)
+            neto = criar_processo(pai=filho, situacao=arquivado)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(propagar_situacao(pai), 1)
+
+        filho.refresh_from_db()
+        neto.refresh_from_db()
+        self.assertEqual(filho.situacao_id, suspenso.pk)
+        self.assertEqual(neto.situacao_id, arquivado.pk)
+
+
+class TransicoesPadraoTests(TestCase):
+    """Transições padrão de situações criadas depois da migração 0010."""
+
+    def destinos(self, situacao):
+        return {destino.nome for destino in situacoes_destino(situacao.pk)}
+
+    def test_nova_situacao_ganha_as_transicoes_padrao(self):
+        Situacao.objects.create(nome='Finalizado')
+        suspenso = Situacao.objects.create(nome='Suspenso')
+        pendente = Situacao.objects.create(nome='Pendente')
+
+        self.assertEqual(self.destinos(pendente), {'Finalizado', 'Suspenso'})
+        self.assertEqual(self.destinos(suspenso), {'Finalizado', 'Suspenso'})
+
+    def test_destino_padrao_criado_depois_recebe_as_origens(self):
+        pendente = Situacao.objects.create(nome='Pendente')
+        concluido = Situacao.objects.create(nome='Concluído')
+        Situacao.objects.create(nome='Finalizado')
+
+        self.assertEqual(self.destinos(pendente), {'Finalizado'})
+        self.assertEqual(self.destinos(concluido), set())
+
+
+@override_settings(PROCESSO_CONTADORES_SITUACAO=True)
+class AtualizacaoLoteTests(TestCase):
+    """POST /api/processos/bulk-update/ (processo/atualizacao_lote.py)."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(email='gestor@example.com', password='x'))
+        self.suspenso = Situacao.objects.create(nome='Suspenso')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.processos = [criar_processo() for _ in range(3)]
+
+    def contadores_conferem(self):
+        mantidos = {situacao_id: total for situacao_id, total in totais_por_situacao().items() if total}
+        self.assertEqual(mantidos, contar_por_situacao())
+
+    def test_numeros_inexistentes_voltam_em_nao_encontrados(self):
+        numeros = [processo.numero for processo in self.processos[:2]] + ['inexistente']
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(
+                '/api/processos/bulk-update/', {'numeros': numeros, 'situacao': self.suspenso.pk}, format='json'
+            )
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data['selecionados'], 2)
+        self.assertEqual(resposta.data['atualizados'], 2)
+        self.assertEqual(resposta.data['nao_encontrados'], ['inexistente'])
+        self.contadores_conferem()
+
+    def test_repetir_o_lote_nao_altera_os_contadores(self):
+        dados = {'numeros': [processo.numero for processo in self.processos], 'situacao': self.suspenso.pk}
+        for esperado in (3, 0):
+            with self.captureOnCommitCallbacks(execute=True):
+                resposta = self.client.post('/api/processos/bulk-update/', dados, format='json')
+            self.assertEqual(resposta.data['atualizados'], esperado)
+            self.contadores_conferem()
+        self.assertEqual(totais_por_situacao()[self.suspenso.pk], 3)
+
+    def test_filtro_que_seria_ignorado_e_recusado(self):
+        for filtro in ({'data_cadastro': '2099-01-01'}, {'raiz': 'talvez'}, {'situacao': ''}, {'xx': '1'}):
+            with self.subTest(filtro=filtro):
+                resposta = self.client.post(
+                    '/api/processos/bulk-update/', {'filtro': filtro, 'situacao': self.suspenso.pk}, format='json'
+                )
+                self.assertEqual(resposta.status_code, 400)
+                self.assertIn('filtro', resposta.data)
+                self.assertFalse(Processo.objects.filter(situacao=self.suspenso).exists())
+
+    def test_filtro_de_intervalo_pelos_parametros_da_listagem(self):
+        dados = {'filtro': {'data_cadastro_after': '2099-01-01'}, 'situacao': self.suspenso.pk}
+        resposta = self.client.post('/api/processos/bulk-update/', dados, format='json')
+
+        self.assertEqual(resposta.status_code, 200, resposta.data)
+        self.assertEqual((resposta.data['selecionados'], resposta.data['atualizados']), (0, 0))
+
+    def test_propagacao_ajusta_os_contadores(self):
+        raiz, filho, neto = self.processos
+        with self.captureOnCommitCallbacks(execute=True):
+            filho.pai = raiz
+            filho.save()
+            neto.pai = filho
+            neto.save()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.patch(
+                f'/api/processos/{raiz.numero}/?propagar=true', {'situacao': self.suspenso.pk}, format='json'
+            )
+
+        self.assertEqual(resposta.status_code, 200, resposta.data)
+        self.assertEqual(Processo.objects.filter(situacao=self.suspenso).count(), 3)
+        self.assertEqual(HistoricoProcesso.objects.filter(alteracoes__propagado_de=raiz.numero).count(), 2)
+        self.contadores_conferem()
+
+
+def linhas_fechamento():
+    return set(ProcessoAncestral.objects.values_list('ancestral_id', 'descendente_id', 'profundidade'))
+
+
+class FechamentoMixin:
+    def assertFechamentoConsistente(self):
+        """A tabela de fechamento mantida em dia é a mesma que reconstruir_fechamento() gera."""
+        mantidas = linhas_fechamento()
+        hierarquia.reconstruir_fechamento()
+        self.assertEqual(mantidas, linhas_fechamento())
+
+
+class FechamentoHierarquiaTests(FechamentoMixin, TestCase):
+    """Manutenção de ProcessoAncestral por inserir_no(s), mover_subarvore e desligar_descendentes."""
+
+    def test_insercao_movimentacao_e_exclusao(self):
+        raiz = criar_processo()
+        a = criar_processo(pai=raiz)
+        b = criar_processo(pai=raiz)
+        a1 = criar_processo(pai=a)
+        a2 = criar_processo(pai=a)
+        a11 = criar_processo(pai=a1)
+        self.assertFechamentoConsistente()
+
+        # Subárvore inteira para baixo de um irmão, depois para a raiz.
+        a.pai = b
+        a.save()
+        self.assertFechamentoConsistente()
+        self.assertTrue(hierarquia.eh_descendente(a11.pk, b.pk))
+
+        a1.pai = None
+        a1.save()
+        self.assertFechamentoConsistente()
+        self.assertFalse(hierarquia.eh_descendente(a11.pk, raiz.pk))
+
+        a1.pai = a2
+        a1.save()
+        self.assertFechamentoConsistente()
+
+        # Os filhos do excluído viram raízes (on_delete=SET_NULL).
+        a.delete()
+        self.assertFechamentoConsistente()
+        a2.refresh_from_db()
+        self.assertIsNone(a2.pai_id)
+        self.assertTrue(hierarquia.eh_descendente(a11.pk, a2.pk))
+        self.assertFalse(hierarquia.eh_descendente(a11.pk, b.pk))
+
+    def test_inserir_nos_em_lote(self):
+        raiz = criar_processo()
+        filhos = [criar_processo() for _ in range(3)]
+        ProcessoAncestral.objects.filter(descendente__in=filhos).delete()
+        Processo.objects.filter(pk=filhos[0].pk).update(pai=raiz)
+        Processo.objects.filter(pk=filhos[1].pk).update(pai=filhos[0])
+        Processo.objects.filter(pk=filhos[2].pk).update(pai=filhos[1])
+
+        hierarquia.inserir_nos([
+            (filhos[0].pk, raiz.pk), (filhos[1].pk, filhos[0].pk), (filhos[2].pk, filhos[1].pk),
+        ])
+        self.assertFechamentoConsistente()
+
+
+@override_settings(PROCESSO_HISTORICO_DELTA_MINIMO=40, PROCESSO_HISTORICO_COMPRIMIR_ACIMA=120)
+class VersaoCampoTests(TestCase):
+    """versao_campo sobre deltas, deltas comprimidos e registros arquivados."""
+
+    def setUp(self):
+        base = ' '.join(f'palavra{i}' for i in range(60))
+        self.versoes = [
+            base,
+            base.replace('palavra10', 'trecho revisto'),
+            # Muitas trocas espalhadas: delta longo, que vai comprimido.
+            ' '.join(f'palavra{i}' if i % 3 else f'termo{i}' for i in range(60)),
+            'Texto reescrito do zero, sem nada em comum com o anterior. ' * 3,
+            'Curto',
+            base + ' com um acréscimo no fim',
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.processo = criar_processo(descricao=self.versoes[0])
+        self.marcos = [timezone.now()]
+        for texto in self.versoes[1:]:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.processo.descricao = texto
+                self.processo.save()
+            self.marcos.append(timezone.now())
+
+    def assertVersoes(self):
+        for marco, texto in zip(self.marcos, self.versoes):
+            self.assertEqual(versao_campo(self.processo, 'descricao', marco), texto)
+
+    def test_versoes_a_partir_dos_deltas(self):
+        formatos = {
+            chave
+            for alteracoes in self.processo.historicos.values_list('alteracoes', flat=True)
+            for chave in alteracoes.get('descricao', {})
+        }
+        self.assertTrue({'delta', 'delta_zlib'} <= formatos, formatos)
+        self.assertVersoes()
+
+    def test_compactar_historico_preserva_as_versoes(self):
+        # Registros gravados antes dos deltas guardam os textos inteiros.
+        for historico, (anterior, novo) in zip(
+            self.processo.historicos.filter(tipo_alteracao='ATUALIZACAO').order_by('data', 'id'),
+            zip(self.versoes, self.versoes[1:]),
+        ):
+            historico.alteracoes['descricao'] = {'anterior': anterior, 'novo': novo}
+            HistoricoProcesso.objects.filter(pk=historico.pk).update(alteracoes=historico.alteracoes)
+        self.assertVersoes()
+
+        call_command('compactar_historico', stdout=io.StringIO())
+        self.assertFalse(
+            self.processo.historicos.filter(alteracoes__descricao__anterior=self.versoes[0]).exists()
+        )
+        self.assertVersoes()
+
+    def test_versoes_com_registros_arquivados(self):
+        historicos = list(self.processo.historicos.order_by('data', 'id'))
+        retencao.arquivar_lote(historicos[:-1])
+
+        self.assertEqual(self.processo.historicos.count(), 1)
+        self.assertVersoes()
+        self.assertIsNone(versao_campo(self.processo, 'descricao', self.processo.data_cadastro - timedelta(days=1)))
+
+
+class ImportacaoTests(FechamentoMixin, TestCase):
+    """Ordenação das linhas por nível da hierarquia em importacao.validar_lote/importar."""
+
+    def setUp(self):
+        self.base = {
+            'assunto': 'Importado',
+            'tipo': Tipo.objects.create(nome='Processo').pk,
+            'situacao': Situacao.objects.create(nome='Em andamento').pk,
+            'prioridade': Prioridade.objects.create(nome='Alta').pk,
+        }
+
+    def linha(self, **campos):
+        return {**self.base, **campos}
+
+    def cliente(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.get_or_create(email='importador@example.com')[0])
+        return client
+
+    def csv(self, texto, codificacao):
+        cabecalho = 'ref;pai_ref;assunto;tipo;situacao;prioridade\n'
+        valores = ';'.join(str(self.base[campo]) for campo in ('tipo', 'situacao', 'prioridade'))
+        conteudo = cabecalho + ''.join(f'{linha};{valores}\n' for linha in texto)
+        arquivo = io.BytesIO(conteudo.encode(codificacao))
+        arquivo.name = 'processos.csv'
+        return arquivo
+
+    def test_endpoint_json(self):
+        linhas = [self.linha(ref='filho', pai_ref='raiz'), self.linha(ref='raiz')]
+        for corpo in (linhas, {'processos': linhas}):
+            with self.subTest(formato=type(corpo).__name__), self.captureOnCommitCallbacks(execute=True):
+                resposta = self.cliente().post('/api/processos/importar/', corpo, format='json')
+            self.assertEqual(resposta.status_code, 201, resposta.data)
+            self.assertEqual(resposta.data['criados'], 2)
+            # A resposta segue a ordem das linhas enviadas, não a de gravação.
+            self.assertEqual([item['ref'] for item in resposta.data['processos']], ['filho', 'raiz'])
+
+    def test_endpoint_json_com_linha_invalida_nao_grava_nada(self):
+        linhas = [self.linha(ref='a'), self.linha(ref='b', tipo=999999)]
+        resposta = self.cliente().post('/api/processos/importar/', linhas, format='json')
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual([erro['linha'] for erro in resposta.data['erros']], [2])
+        self.assertFalse(Processo.objects.exists())
+
+    def test_endpoint_csv_utf8_e_cp1252(self):
+        for codificacao in ('utf-8-sig', 'cp1252'):
+            with self.subTest(codificacao=codificacao), self.captureOnCommitCallbacks(execute=True):
+                arquivo = self.csv([f'r;;Auditoria de licitação ({codificacao})', f'f;r;Ação corretiva ({codificacao})'], codificacao)
+                resposta = self.cliente().post('/api/processos/importar/', {'arquivo': arquivo}, format='multipart')
+            self.assertEqual(resposta.status_code, 201, resposta.data)
+            filho = Processo.objects.get(numero=resposta.data['processos'][1]['numero'])
+            self.assertEqual(filho.assunto, f'Ação corretiva ({codificacao})')
+            self.assertEqual(filho.pai.numero, resposta.data['processos'][0]['numero'])
+
+    def test_endpoint_csv_com_codificacao_desconhecida(self):
+        arquivo = io.BytesIO(b'assunto;tipo\n\x81\x8d;1\n')
+        arquivo.name = 'processos.csv'
+        resposta = self.cliente().post('/api/processos/importar/', {'arquivo': arquivo}, format='multipart')
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('arquivo', resposta.data)
+        self.assertFalse(Processo.objects.exists())
+
+    def test_filhos_antes_dos_pais_no_lote(self):
+        linhas = [
+            self.linha(ref='neto', pai_ref='filho'),
+            self.linha(ref='filho', pai_ref='raiz'),
+            self.linha(ref='irmao', pai_ref='raiz'),
+            self.linha(ref='raiz'),
+        ]
+        itens, erros = importacao.validar_lote(linhas)
+        self.assertEqual(erros, [])
+
+        ordem = [item['ref'] for item in itens]
+        for pai, filho in (('raiz', 'filho'), ('raiz', 'irmao'), ('filho', 'neto')):
+            self.assertLess(ordem.index(pai), ordem.index(filho))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            importacao.importar(itens)
+        processos = {item['ref']: item['processo'] for item in itens}
+        self.assertEqual(processos['neto'].pai_id, processos['filho'].pk)
+        self.assertEqual(processos['filho'].pai_id, processos['raiz'].pk)
+        self.assertTrue(hierarquia.eh_descendente(processos['neto'].pk, processos['raiz'].pk))
+        self.assertEqual(HistoricoProcesso.objects.filter(tipo_alteracao='CRIACAO').count(), 4)
+        self.assertFechamentoConsistente()
+
+    def test_referencias_desconhecidas_e_ciclos(self):
+        linhas = [
+            self.linha(ref='a', pai_ref='b'),
+            self.linha(ref='b', pai_ref='a'),
+            self.linha(ref='c', pai_ref='inexistente'),
+            self.linha(ref='d'),
+        ]
+        itens, erros = importacao.validar_lote(linhas)
+
+        self.assertEqual([erro['ref'] for erro in erros], ['a', 'b', 'c'])
+        self.assertIn('circular', erros[0]['erros']['pai_ref'][0])
+        self.assertIn('inexistente', erros[2]['erros']['pai_ref'][0])
+
+
+class ValidacaoDominioEmCacheTests(TestCase):
+    """FKs de escrita resolvidas pelo cache das tabelas de domínio (processo/cache.py)."""
+
+    def setUp(self):
+        for model in MODELOS_DOMINIO:
+            tabela(model).invalidar()
+        self.dados = {
+            'assunto': 'Novo processo',
+            'tipo': Tipo.objects.create(nome='Processo').pk,
+            'situacao': Situacao.objects.create(nome='Em andamento').pk,
+            'prioridade': Prioridade.objects.create(nome='Alta').pk,
+            'categoria': Categoria.objects.create(nome='Categoria').pk,
+            'orgao_demandante': OrgaoDemandante.objects.create(nome='Órgão').pk,
+            'atribuicao': Atribuicao.objects.create(nome='Atribuição').pk,
+            'tipo_demanda': TipoDemanda.objects.create(nome='Demanda').pk,
+            'area_demandada': Unidade.objects.create(nome='Área').pk,
+        }
+        # Carrega as tabelas no cache.
+        self.assertTrue(ProcessoCreateUpdateSerializer(data=self.dados).is_valid())
+
+    def tearDown(self):
+        for model in MODELOS_DOMINIO:
+            tabela(model).invalidar()
+
+    def test_fks_validadas_sem_queries(self):
+        serializer = ProcessoCreateUpdateSerializer(data=self.dados)
+        with self.assertNumQueries(0):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data['tipo'].nome, 'Processo')
+
+    def test_registro_novo_invalida_o_cache(self):
+        self.dados['tipo'] = Tipo.objects.create(nome='Demanda').pk
+
+        with self.assertNumQueries(1):
+            self.assertTrue(ProcessoCreateUpdateSerializer(data=self.dados).is_valid())
+
+    def test_chave_inexistente_so_consulta_a_tabela_dela(self):
+        self.dados['categoria'] = 9999
+        serializer = ProcessoCreateUpdateSerializer(data=self.dados)
+
+        with self.assertNumQueries(1):
+            self.assertFalse(serializer.is_valid())
+        self.assertEqual(set(serializer.errors), {'categoria'})
+
+
+class ManyToManyEmLoteTests(TestCase):
+    """unidades_auditadas/auditores_responsaveis resolvidos e gravados em lote."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(email='cadastro@example.com', password='x'))
+        self.processo = criar_processo()
+        self.unidades = Unidade.objects.bulk_create([Unidade(nome=f'Unidade {i}') for i in range(40)])
+        self.auditores = Auditor.objects.bulk_create([Auditor(nome=f'Auditor {i}') for i in range(15)])
+        self.dados = {
+            'assunto': 'Com muitos relacionados',
+            'tipo': self.processo.tipo_id,
+            'situacao': self.processo.situacao_id,
+            'prioridade': self.processo.prioridade_id,
+        }
+
+    def test_todas_as_chaves_inexistentes_em_um_erro_e_uma_query(self):
+        dados = {**self.dados, 'auditores_responsaveis': [self.auditores[0].pk, 9998, self.auditores[1].pk, 9999]}
+        ProcessoCreateUpdateSerializer(data=self.dados).is_valid()  # aquece o cache das tabelas de domínio
+        serializer = ProcessoCreateUpdateSerializer(data=dados)
+
+        with self.assertNumQueries(1):
+            self.assertFalse(serializer.is_valid())
+        self.assertEqual(list(serializer.errors), ['auditores_responsaveis'])
+        mensagem = str(serializer.errors['auditores_responsaveis'][0])
+        self.assertIn('9998', mensagem)
+        self.assertIn('9999', mensagem)
+
+    def test_criacao_grava_cada_tabela_intermediaria_de_uma_vez(self):
+        dados = {
+            **self.dados,
+            'unidades_auditadas': [unidade.pk for unidade in self.unidades],
+            'auditores_responsaveis': [auditor.pk for auditor in self.auditores],
+        }
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.post('/api/processos/', dados, format='json')
+
+        self.assertEqual(resposta.status_code, 201, resposta.data)
+        processo = Processo.objects.get(assunto='Com muitos relacionados')
+        self.assertEqual(processo.unidades_auditadas.count(), 40)
+        self.assertEqual(processo.auditores_responsaveis.count(), 15)
+        for campo in ('unidades_auditadas', 'auditores_responsaveis'):
+            through = Processo._meta.get_field(campo).remote_field.through._meta.db_table
+            insercoes = [c for c in consultas if c['sql'].startswith(f'INSERT INTO "{through}"')]
+            self.assertEqual(len(insercoes), 1, campo)
+
+        registro = HistoricoProcesso.objects.get(processo=processo)
+        self.assertEqual(len(registro.alteracoes['unidades_auditadas']['adicionado']), 40)
+        self.assertEqual(len(registro.alteracoes['auditores_responsaveis']['adicionado']), 15)
+
+    def test_troca_de_itens_e_um_delete_e_um_insert(self):
+        self.processo.unidades_auditadas.add(*self.unidades[:3])
+        novas = [self.unidades[0].pk, self.unidades[5].pk, self.unidades[6].pk]
+        through = Processo.unidades_auditadas.through._meta.db_table
+
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.patch(
+                f'/api/processos/{self.processo.numero}/', {'unidades_auditadas': novas}, format='json',
+            )
+
+        self.assertEqual(resposta.status_code, 200, resposta.data)
+        self.assertEqual(set(self.processo.unidades_auditadas.values_list('pk', flat=True)), set(novas))
+        escritas = [c['sql'].split(' ')[0] for c in consultas if f'"{through}"' in c['sql'] and not c['sql'].startswith('SELECT')]
+        self.assertEqual(escritas, ['DELETE', 'INSERT'])
+        alteracoes = self.processo.historicos.order_by('-id').first().alteracoes['unidades_auditadas']
+        self.assertEqual((len(alteracoes['adicionado']), len(alteracoes['removido'])), (2, 2))
+
+
+class ChaveRemovidaEmOutroWorkerTests(TransactionTestCase):
+    """
+    Uma situação excluída por outro worker continua no cache deste até o
+    TTL: a gravação falha na FK (conferida no commit, por isso
+    TransactionTestCase) e a API responde 400.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(email='worker@example.com', password='x'))
+        self.processo = criar_processo()
+        self.removida = Situacao.objects.create(nome='Removida')
+        tabela(Situacao).objetos()
+        # Exclusão "em outro worker": sem sinais, a cópia local continua com a situação.
+        Situacao.objects.filter(pk=self.removida.pk)._raw_delete('default')
+        self.assertIsNotNone(tabela(Situacao).get(self.removida.pk))
+
+    def tearDown(self):
+        for model in MODELOS_DOMINIO:
+            tabela(model).invalidar()
+
+    def test_criacao_com_situacao_removida(self):
+        dados = {
+            'assunto': 'Novo', 'tipo': self.processo.tipo_id, 'prioridade': self.processo.prioridade_id,
+            'situacao': self.removida.pk,
+        }
+        resposta = self.client.post('/api/processos/', dados, format='json')
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('situacao', resposta.data)
+        self.assertEqual(Processo.objects.count(), 1)
+        # O cache foi invalidado: a próxima validação já recusa a chave sem tentar gravar.
+        self.assertIsNone(tabela(Situacao).get(self.removida.pk))
+
+    def test_atualizacao_com_propagacao_e_situacao_removida(self):
+        resposta = self.client.patch(
+            f'/api/processos/{self.processo.numero}/?propagar=true', {'situacao': self.removida.pk}, format='json'
+        )
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('situacao', resposta.data)
+        self.processo.refresh_from_db()
+        self.assertNotEqual(self.processo.situacao_id, self.removida.pk)
@@ -3,6 +3,7 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     # ViewSets para cada modelo
     ProcessoViewSet,
+    AlteracaoCampoViewSet,
     TipoViewSet,
     PrioridadeViewSet,
     OrgaoDemandanteViewSet,
@@ -34,6 +35,7 @@ router.register(r'unidades', UnidadeViewSet, basename='unidade')
 router.register(r'auditores', AuditorViewSet, basename='auditor')
 router.register(r'grupos-auditores', GrupoAuditorViewSet, basename='grupo-auditor')
 router.register(r'tipos-demanda', TipoDemandaViewSet, basename='tipo-demanda')
+router.register(r'historico', AlteracaoCampoViewSet, basename='historico')
 
 
 
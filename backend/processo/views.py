@@ -1,14 +1,40 @@
+from datetime import datetime, time
+from functools import lru_cache
+
+from django.db.models import CharField, Count, OuterRef, Prefetch, Subquery, TextField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, filters, pagination, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from .models import (
-    Processo, Tipo, Prioridade, OrgaoDemandante, Situacao, Categoria,
+    Processo, HistoricoProcesso, HistoricoProcessoArquivado, ResumoHistoricoArquivado, AlteracaoCampo, Tipo, Prioridade, OrgaoDemandante, Situacao, Categoria,
     Atribuicao, Unidade, Auditor, GrupoAuditor, TipoDemanda
 )
+from .atualizacao_lote import (
+    atualizar_em_lote, descendentes_para_propagar, limite_atualizacao_lote, propagar_situacao,
+)
+from .cache import tabela
+from .contadores import totais_por_situacao
+from .filters import (
+    FACETAS_PROCESSO, AlteracaoCampoFilter, ProcessoFilter, ProcessoSearchFilter, calcular_facetas,
+    parametros_ignorados,
+)
+from .hierarquia import carregar_caminho, carregar_subarvore
+from . import historico
+from .historico import versao_campo
+from .importacao import importar, ler_csv, limite_importacao, validar_lote
+from .pagination import HistoricoPagination, ProcessoPagination
 from .serializers import (
-    ProcessoListSerializer, ProcessoCreateUpdateSerializer, ProcessoArvoreSerializer,
+    CAMPOS_M2M_PROCESSO, AlteracaoCampoSerializer, AtualizacaoLoteSerializer, HistoricoProcessoSerializer,
+    HistoricoProcessoArquivadoSerializer, ResumoHistoricoArquivadoSerializer,
+    ProcessoListSerializer, ProcessoCreateUpdateSerializer, conferir_chaves_removidas,
     TipoSerializer, PrioridadeSerializer, OrgaoDemandanteSerializer, SituacaoSerializer,
     CategoriaSerializer, AtribuicaoSerializer, UnidadeSerializer, AuditorSerializer,
     GrupoAuditorSerializer, TipoDemandaSerializer 
@@ -70,28 +96,224 @@ class TipoDemandaViewSet(viewsets.ModelViewSet):
 
 # --- ViewSet principal para Processos ---
 
+# Relações carregadas via 'select_related' para cada campo do serializer de leitura.
+# O 'pai' é serializado com ProcessoSummarySerializer, que lê tipo/situação/prioridade.
+RELACOES_LEITURA = {
+    'tipo': ['tipo'],
+    'situacao': ['situacao'],
+    'prioridade': ['prioridade'],
+    'categoria': ['categoria'],
+    'orgao_demandante': ['orgao_demandante'],
+    'atribuicao': ['atribuicao'],
+    'area_demandada': ['area_demandada'],
+    'pai': ['pai__tipo', 'pai__situacao', 'pai__prioridade'],
+    'execucao': ['execucao'],
+    'resposta': ['resposta'],
+}
+
+# Colunas de Processo lidas por campos calculados do serializer de leitura.
+COLUNAS_LEITURA = {
+    'situacoes_disponiveis': ['situacao'],
+}
+
+# Relações carregadas via 'prefetch_related' para cada campo do serializer de leitura.
+PREFETCH_LEITURA = {
+    'unidades_auditadas': ['unidades_auditadas'],
+    'auditores_responsaveis': ['auditores_responsaveis'],
+}
+
+
+def contagem_filhos():
+    """Subquery com o número de filhos diretos de cada processo (usa o índice de pai_id)."""
+    filhos = Processo.objects.filter(pai=OuterRef('pk')).order_by().values('pai').annotate(total=Count('id')).values('total')
+    return Coalesce(Subquery(filhos), 0)
+
+
+def ultima_alteracao():
+    """Anotações com data, tipo e autor do registro de histórico mais recente de cada processo."""
+    ultimo = HistoricoProcesso.objects.filter(processo=OuterRef('pk')).order_by('-data', '-id')
+    return {
+        'ultima_alteracao_data': Subquery(ultimo.values('data')[:1]),
+        'ultima_alteracao_tipo': Subquery(ultimo.values('tipo_alteracao')[:1]),
+        'ultima_alteracao_por': Subquery(ultimo.values('alterado_por__email')[:1]),
+    }
+
+
+# Dados opcionais que o detalhe de um processo pode incluir via ?expand=.
+EXPANSOES_PROCESSO = ['caminho']
+
+
+@lru_cache(maxsize=None)
+def campos_leitura_processo():
+    """Nomes de todos os campos expostos pelo serializer de leitura de Processo."""
+    return tuple(ProcessoListSerializer().fields)
+
+
+@lru_cache(maxsize=None)
+def campos_texto_processo():
+    """Campos de texto editáveis do Processo, cujas versões passadas podem ser reconstruídas."""
+    return tuple(
+        field.name for field in Processo._meta.concrete_fields
+        if isinstance(field, (CharField, TextField)) and field.editable
+    )
+
+
 class ProcessoViewSet(viewsets.ModelViewSet):
     """
     ViewSet para gerenciar Processos.
     Usa serializers diferentes para leitura e escrita.
+
+    Na leitura (list/retrieve) aceita ?fields=a,b,c e/ou ?omit=x,y para
+    restringir os campos retornados. A mesma seleção define as colunas
+    carregadas (.only()) e os select/prefetch_related executados.
+
+    Na listagem, os filtros de ProcessoFilter rodam no banco. Entre eles,
+    ?descendentes_de=<numero> restringe o resultado à subárvore do processo
+    (via tabela de fechamento ProcessoAncestral) e, para navegar a árvore
+    nível a nível, ?raiz=true lista só os processos sem pai e ?pai=<numero>
+    os filhos diretos de um processo; cada linha traz 'num_filhos' para o
+    cliente saber se há o que expandir.
+
+    Com ?facets=tipo,situacao,... a listagem também traz a contagem dos
+    resultados filtrados por valor de cada faceta.
+
+    No detalhe, ?expand=caminho inclui a cadeia de ancestrais (breadcrumb).
+    Listagem e detalhe trazem só o resumo 'ultima_alteracao'; o histórico
+    completo é paginado em /api/processos/{numero}/historico/.
     """
-    # Usamos 'select_related' para otimizar queries de ForeignKey (1-para-1)
-    # e 'prefetch_related' para ManyToMany e OneToMany reversos.
-    queryset = Processo.objects.select_related(
-        'tipo', 'situacao', 'prioridade', 'categoria', 'orgao_demandante',
-        'atribuicao', 'area_demandada', 'pai', 'execucao', 'resposta'
-    ).prefetch_related(
-        'unidades_auditadas', 'auditores_responsaveis', 'historicos', 'filhos'
-    ).all()
+    queryset = Processo.objects.all()
 
     # O campo para buscar um processo específico (ex: /api/processos/12345/)
     lookup_field = 'numero'
     
-    # Habilita filtros de busca, como /api/processos/?search=auditoria
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    # Filtros indexados (ver ProcessoFilter), como /api/processos/?tipo=1&situacao=2,3
+    # e busca textual, como /api/processos/?search=auditoria
+    # (no SQLite a busca usa o índice FTS5, ordenado por relevância).
+    filter_backends = [DjangoFilterBackend, ProcessoSearchFilter, filters.OrderingFilter]
+    filterset_class = ProcessoFilter
     search_fields = ['numero', 'assunto', 'numero_processo_externo', 'numero_sei', 'descricao']
     ordering_fields = ['data_cadastro', 'prioridade__nome'] # Permite ordenar por data ou nome da prioridade
 
+    # Paginação por página, ou por cursor com ?paginacao=cursor (sem COUNT nem OFFSET).
+    pagination_class = ProcessoPagination
+
+    def get_campos_solicitados(self):
+        """
+        Retorna o conjunto de campos pedidos via ?fields= / ?omit=,
+        ou None quando o cliente não restringiu a resposta.
+        """
+        if hasattr(self, '_campos_solicitados'):
+            return self._campos_solicitados
+
+        campos = None
+        if self.action in ['list', 'retrieve']:
+            params = self.request.query_params
+            incluir = [c.strip() for c in params.get('fields', '').split(',') if c.strip()]
+            omitir = [c.strip() for c in params.get('omit', '').split(',') if c.strip()]
+
+            if incluir or omitir:
+                disponiveis = campos_leitura_processo()
+                invalidos = sorted(set(incluir + omitir) - set(disponiveis))
+                if invalidos:
+                    raise ValidationError({'fields': f"Campos inválidos: {', '.join(invalidos)}."})
+                campos = set(incluir or disponiveis) - set(omitir)
+
+        self._campos_solicitados = campos
+        return campos
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        if self.action in ('update', 'partial_update'):
+            # Escrita: só o que o serializer de escrita compara (submodelos e M2M).
+            return queryset.select_related('execucao', 'resposta').prefetch_related(*CAMPOS_M2M_PROCESSO)
+        if self.action == 'destroy':
+            return queryset
+
+        campos = self.get_campos_solicitados()
+        if campos is None:
+            campos = campos_leitura_processo()
+
+        # Usamos 'select_related' para otimizar queries de ForeignKey (1-para-1)
+        # e 'prefetch_related' para ManyToMany e OneToMany reversos,
+        # carregando apenas o que os campos pedidos realmente usam.
+        select = {rel for campo in campos for rel in RELACOES_LEITURA.get(campo, [])}
+        prefetch = [lookup for campo in campos for lookup in PREFETCH_LEITURA.get(campo, [])]
+        if self.action == 'retrieve' and 'filhos' in campos:
+            # Os filhos só são serializados no detalhe (ver get_filhos).
+            prefetch.append(Prefetch('filhos', queryset=Processo.objects.select_related('tipo', 'situacao', 'prioridade')))
+
+        if 'num_filhos' in campos:
+            queryset = queryset.annotate(num_filhos=contagem_filhos())
+        if 'ultima_alteracao' in campos:
+            queryset = queryset.annotate(**ultima_alteracao())
+
+        if select:
+            # select_related() sem argumentos seguiria todas as FKs não nulas.
+            queryset = queryset.select_related(*sorted(select))
+        queryset = queryset.prefetch_related(*prefetch)
+
+        if self.get_campos_solicitados() is not None:
+            concretos = {f.name for f in Processo._meta.concrete_fields}
+            colunas = {campo for campo in campos if campo in concretos}
+            colunas.update(coluna for campo in campos for coluna in COLUNAS_LEITURA.get(campo, []))
+            # select_related exige que a relação percorrida não seja adiada.
+            colunas.update(rel.split('__')[0] for rel in select)
+            queryset = queryset.only('id', *sorted(colunas))
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['campos'] = self.get_campos_solicitados()
+        return context
+
+    def get_expansoes(self):
+        """Retorna as expansões opcionais pedidas via ?expand=a,b."""
+        expansoes = {e.strip() for e in self.request.query_params.get('expand', '').split(',') if e.strip()}
+        invalidas = sorted(expansoes - set(EXPANSOES_PROCESSO))
+        if invalidas:
+            raise ValidationError({'expand': f"Expansões inválidas: {', '.join(invalidas)}."})
+        return expansoes
+
+    def get_facetas_solicitadas(self):
+        """Retorna as facetas pedidas via ?facets=tipo,situacao (lista, na ordem pedida)."""
+        facetas = []
+        for nome in self.request.query_params.get('facets', '').split(','):
+            nome = nome.strip()
+            if nome and nome not in facetas:
+                facetas.append(nome)
+        invalidas = [nome for nome in facetas if nome not in FACETAS_PROCESSO]
+        if invalidas:
+            raise ValidationError({'facets': f"Facetas inválidas: {', '.join(invalidas)}."})
+        return facetas
+
+    def list(self, request, *args, **kwargs):
+        """
+        Listagem padrão; com ?facets=tipo,situacao,prioridade inclui no envelope
+        paginado a contagem dos resultados filtrados por valor de cada faceta.
+        """
+        facetas = self.get_facetas_solicitadas()
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            response = self.get_paginated_response(serializer.data)
+        else:
+            serializer = self.get_serializer(queryset, many=True)
+            response = Response({'results': serializer.data}) if facetas else Response(serializer.data)
+
+        if facetas:
+            response.data['facets'] = calcular_facetas(queryset, facetas)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        expansoes = self.get_expansoes()
+        response = super().retrieve(request, *args, **kwargs)
+        if 'caminho' in expansoes:
+            response.data['caminho'] = carregar_caminho(kwargs[self.lookup_field])
+        return response
+
     def get_serializer_class(self):
         """
         Retorna o serializer apropriado dependendo da ação (leitura ou escrita).
@@ -101,34 +323,256 @@ class ProcessoViewSet(viewsets.ModelViewSet):
         # Para 'list', 'retrieve' e ações customizadas, usa o serializer de leitura.
         return ProcessoListSerializer
 
+    def update(self, request, *args, **kwargs):
+        """
+        Com ?propagar=true, uma mudança de situação é levada também aos
+        descendentes (exceto os já em situação final), na mesma transação;
+        a resposta informa quantos foram alterados em 'propagados'.
+        """
+        self.propagados = None
+        response = super().update(request, *args, **kwargs)
+        if self.propagados is not None:
+            response.data['propagados'] = self.propagados
+        return response
+
+    def perform_update(self, serializer):
+        nova_situacao = serializer.validated_data.get('situacao')
+        propagar = (
+            self.request.query_params.get('propagar', '').lower() in ('true', '1')
+            and nova_situacao is not None and nova_situacao.pk != serializer.instance.situacao_id
+        )
+        if not propagar:
+            serializer.save()
+            return
+
+        total = descendentes_para_propagar(serializer.instance).count()
+        if total > limite_atualizacao_lote():
+            raise ValidationError({
+                'propagar': [f'A subárvore tem {total} processos a alterar; o máximo por operação é {limite_atualizacao_lote()}.'],
+            })
+        # A transação externa é esta: é no commit dela que as FKs são conferidas.
+        with conferir_chaves_removidas(serializer), historico.operacao():
+            processo = serializer.save()
+            self.propagados = propagar_situacao(processo)
+
+    @action(
+        detail=False, methods=['post'], url_path='importar',
+        parser_classes=[JSONParser, MultiPartParser, FormParser],
+    )
+    def importar_processos(self, request):
+        """
+        Cria processos em lote, em uma única transação: um array JSON com os
+        campos do cadastro (ou {"processos": [...]}) ou um CSV enviado no
+        campo 'arquivo'. Cada linha pode ter 'ref' e apontar o pai do mesmo
+        lote por 'pai_ref'. Se qualquer linha for inválida, nada é gravado e a
+        resposta lista os erros por linha.
+        Acessível em /api/processos/importar/
+        """
+        if 'arquivo' in request.FILES:
+            try:
+                linhas = ler_csv(request.FILES['arquivo'])
+            except ValueError as erro:
+                raise ValidationError({'arquivo': [str(erro)]})
+        elif isinstance(request.data, dict) and 'processos' in request.data:
+            linhas = request.data['processos']
+        else:
+            linhas = request.data
+        if not isinstance(linhas, list) or not linhas:
+            raise ValidationError({'processos': 'Envie uma lista de processos ou um CSV no campo "arquivo".'})
+        if len(linhas) > limite_importacao():
+            raise ValidationError({'processos': f'No máximo {limite_importacao()} processos por importação.'})
+
+        itens, erros = validar_lote(linhas, context=self.get_serializer_context())
+        if erros:
+            return Response({'erros': erros}, status=status.HTTP_400_BAD_REQUEST)
+
+        importar(itens)
+        criados = sorted(itens, key=lambda item: item['linha'])
+        return Response({
+            'criados': len(criados),
+            'processos': [
+                {'linha': item['linha'], 'ref': item['ref'], 'id': item['processo'].pk, 'numero': item['processo'].numero}
+                for item in criados
+            ],
+        }, status=status.HTTP_201_CREATED)
+
+
+    @action(detail=False, methods=['post'], url_path='bulk-update')
+    def atualizar_lote(self, request):
+        """
+        Altera situação, prioridade e/ou atribuição de vários processos com um
+        único UPDATE, escolhidos por 'numeros' ou por 'filtro' (parâmetros da
+        listagem), ex.: {"filtro": {"descendentes_de": "123", "tipo": "2"}, "situacao": 3}.
+        Seleções maiores que PROCESSO_ATUALIZACAO_LOTE_MAXIMO são recusadas; com
+        'numeros', os que não existem voltam em 'nao_encontrados'.
+        Acessível em /api/processos/bulk-update/
+        """
+        serializer = AtualizacaoLoteSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+
+        resposta = {}
+        if 'numeros' in serializer.validated_data:
+            numeros = serializer.validated_data['numeros']
+            queryset = Processo.objects.filter(numero__in=numeros)
+            encontrados = set(queryset.values_list('numero', flat=True))
+            selecionados = len(encontrados)
+            # Números inexistentes não impedem a alteração dos demais, mas são devolvidos.
+            resposta['nao_encontrados'] = list(dict.fromkeys(numero for numero in numeros if numero not in encontrados))
+        else:
+            filterset = ProcessoFilter(serializer.validated_data['filtro'], queryset=Processo.objects.all(), request=request)
+            if not filterset.is_valid():
+                raise ValidationError({'filtro': filterset.errors})
+            ignorados = parametros_ignorados(filterset, serializer.validated_data['filtro'])
+            if ignorados:
+                raise ValidationError({'filtro': [f"Filtros sem efeito: {', '.join(ignorados)}."]})
+            queryset = Processo.objects.filter(id__in=filterset.qs.order_by().values('id'))
+            selecionados = queryset.count()
+
+        if selecionados > limite_atualizacao_lote():
+            raise ValidationError({
+                'non_field_errors': [
+                    f'A seleção tem {selecionados} processos; o máximo por operação é {limite_atualizacao_lote()}.'
+                ],
+            })
+
+        atualizados = atualizar_em_lote(queryset, serializer.mudancas())
+        return Response({'selecionados': selecionados, 'atualizados': atualizados, **resposta})
+
+
     @action(detail=True, methods=['get'], url_path='arvore')
     def get_processo_arvore(self, request, numero=None):
         """
         Endpoint customizado para retornar um processo e todos os seus descendentes.
         Acessível em /api/processos/{numero}/arvore/
+
+        A subárvore inteira é carregada em uma única query (CTE recursiva).
+        Use ?depth=N para limitar quantos níveis abaixo do processo são retornados.
         """
-        processo = self.get_object()
-        serializer = ProcessoArvoreSerializer(processo, context={'request': request})
-        return Response(serializer.data)
+        profundidade = request.query_params.get('depth')
+        if profundidade is not None:
+            try:
+                profundidade = int(profundidade)
+                if profundidade < 0:
+                    raise ValueError
+            except ValueError:
+                raise ValidationError({'depth': 'Informe um número inteiro maior ou igual a zero.'})
+
+        arvore = carregar_subarvore(numero, profundidade)
+        if arvore is None:
+            raise NotFound()
+        return Response(arvore)
+
+    @action(detail=True, methods=['get'], url_path='caminho')
+    def get_processo_caminho(self, request, numero=None):
+        """
+        Retorna a cadeia de ancestrais do processo, da raiz até ele próprio,
+        com 'numero', 'assunto' e 'tipo' de cada nível (uma única query).
+        Acessível em /api/processos/{numero}/caminho/
+        """
+        caminho = carregar_caminho(numero)
+        if caminho is None:
+            raise NotFound()
+        return Response(caminho)
+
+
+    @action(detail=True, methods=['get'], url_path='historico')
+    def get_processo_historico(self, request, numero=None):
+        """
+        Histórico de alterações do processo, do mais recente ao mais antigo,
+        paginado por cursor (?cursor=). Acessível em /api/processos/{numero}/historico/
+        Com ?arquivo=true, lista os registros já arquivados (ver arquivar_historico)
+        e inclui o 'resumo' do arquivo.
+        """
+        processo_id = Processo.objects.filter(numero=numero).values_list('id', flat=True).first()
+        if processo_id is None:
+            raise NotFound()
+
+        arquivo = request.query_params.get('arquivo', '').lower() in ('true', '1')
+        model, serializer_class = (
+            (HistoricoProcessoArquivado, HistoricoProcessoArquivadoSerializer) if arquivo
+            else (HistoricoProcesso, HistoricoProcessoSerializer)
+        )
+        queryset = model.objects.filter(processo_id=processo_id).select_related('alterado_por')
+        paginator = HistoricoPagination()
+        pagina = paginator.paginate_queryset(queryset, request, view=self)
+        response = paginator.get_paginated_response(serializer_class(pagina, many=True).data)
+        if arquivo:
+            resumo = ResumoHistoricoArquivado.objects.filter(processo_id=processo_id).first()
+            response.data['resumo'] = ResumoHistoricoArquivadoSerializer(resumo).data if resumo else None
+        return response
+
+
+    @action(detail=True, methods=['get'], url_path='versao')
+    def get_processo_versao(self, request, numero=None):
+        """
+        Valor de um campo de texto do processo em uma data passada, reconstruído
+        a partir do histórico (inclusive dos deltas dos campos longos).
+        Acessível em /api/processos/{numero}/versao/?campo=descricao&data=2025-03-01T10:00
+        """
+        campo = request.query_params.get('campo')
+        if campo not in campos_texto_processo():
+            raise ValidationError({'campo': f"Informe um destes campos: {', '.join(campos_texto_processo())}."})
+
+        texto_data = request.query_params.get('data', '')
+        data = parse_datetime(texto_data)
+        if data is None and parse_date(texto_data) is not None:
+            # Só a data: vale o fim do dia.
+            data = datetime.combine(parse_date(texto_data), time.max)
+        if data is None:
+            raise ValidationError({'data': 'Informe uma data/hora ISO 8601 (ex.: 2025-03-01T10:00).'})
+        if timezone.is_naive(data):
+            data = timezone.make_aware(data)
+
+        processo = Processo.objects.filter(numero=numero).only('id', 'data_cadastro', campo).first()
+        if processo is None:
+            raise NotFound()
+        return Response({
+            'campo': campo,
+            'data': data.isoformat(),
+            'valor': versao_campo(processo, campo, data),
+        })
+
+
+class AlteracaoCampoViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Consulta de auditoria entre processos: uma linha por campo alterado.
+    Ex.: /api/historico/?campo=situacao&id_novo=3&data_after=2025-01-01
+    ou /api/historico/?alterado_por=7&data_after=2025-06-10.
+    Paginado por cursor, do mais recente ao mais antigo.
+    """
+    queryset = AlteracaoCampo.objects.select_related('processo', 'alterado_por')
+    serializer_class = AlteracaoCampoSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = AlteracaoCampoFilter
+    pagination_class = HistoricoPagination
 
 
 class DashboardStatsView(APIView):
     """
     Endpoint para fornecer estatísticas para o dashboard.
+
+    As contagens vêm de um único agrupamento por situação (ou dos contadores
+    mantidos pelos sinais) e os nomes das situações do cache em memória.
     """
     def get(self, request, *args, **kwargs):
-        # A lógica é a mesma, mas agora filtramos pelo nome na tabela relacionada.
-        total = Processo.objects.count()
-        # Garanta que você tenha Situações com estes nomes no seu banco de dados.
-        em_andamento = Processo.objects.filter(situacao__nome__iexact='Em andamento').count()
-        pendente = Processo.objects.filter(situacao__nome__iexact='Pendente').count()
-        finalizado = Processo.objects.filter(situacao__nome__iexact='Finalizado').count()
-        
+        totais = totais_por_situacao()
+        situacoes = tabela(Situacao).objetos()
+
+        por_situacao = [
+            {'id': situacao.pk, 'nome': situacao.nome, 'total': totais.get(situacao.pk, 0)}
+            for situacao in sorted(situacoes.values(), key=lambda s: s.nome)
+        ]
+
+        def total_com_nome(nome):
+            # Mantém a comparação sem diferenciar maiúsculas/minúsculas das versões anteriores.
+            return sum(item['total'] for item in por_situacao if item['nome'].lower() == nome.lower())
+
         data = {
-            'totalProcessos': total,
-            'processosEmAndamento': em_andamento,
-            'processosPendentes': pendente,
-            'processosFinalizados': finalizado,
+            'totalProcessos': sum(totais.values()),
+            'processosEmAndamento': total_com_nome('Em andamento'),
+            'processosPendentes': total_com_nome('Pendente'),
+            'processosFinalizados': total_com_nome('Finalizado'),
+            'porSituacao': por_situacao,
         }
         return Response(data)
 